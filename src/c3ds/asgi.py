@@ -22,10 +22,17 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'c3ds.settings.production')
 django_asgi_app = get_asgi_application()
 
 
+from django.conf import settings
+
+from c3ds.core.media_server import MediaApp, MediaRouter
 from c3ds.urls import websocket_urlpatterns
 
+# shared by both apps, so the limit of concurrent media streams holds for the process
+media_app = MediaApp()
+
 application = ProtocolTypeRouter({
-    "http": django_asgi_app,
+    # the web server can serve MEDIA_ROOT itself instead
+    "http": MediaRouter(django_asgi_app, media_app) if settings.MEDIA_SERVE else django_asgi_app,
     "websocket": AllowedHostsOriginValidator(
        AuthMiddlewareStack(URLRouter(websocket_urlpatterns))
     ),
@@ -33,26 +40,19 @@ application = ProtocolTypeRouter({
 
 # optional support for static files via starlette
 with suppress(ImportError):
-    # settings need to be loaded after django init via get_asgi_application
-    from django.conf import settings
     from starlette.applications import Starlette
     from starlette.routing import Mount
     from starlette.staticfiles import StaticFiles
 
     static_app = ProtocolTypeRouter({
-        "http": Starlette(routes=[
+        "http": MediaRouter(Starlette(routes=[
             Mount(
                 path=settings.STATIC_URL,
                 app=StaticFiles(directory=settings.STATIC_ROOT, follow_symlink=True),
                 name='static',
             ),
-            Mount(
-                path=settings.MEDIA_URL,
-                app=StaticFiles(directory=settings.MEDIA_ROOT, follow_symlink=True),
-                name='media',
-            ),
             Mount(path='/', app=django_asgi_app),
-        ]),
+        ]), media_app),
         "websocket": AllowedHostsOriginValidator(
             AuthMiddlewareStack(URLRouter(websocket_urlpatterns))
         ),
@@ -1,19 +1,25 @@
 import datetime
+import time
 
 import channels.layers
 from asgiref.sync import async_to_sync
 from django.conf import settings
 from django.contrib import admin
-from django.core.cache import cache
-from django.db import models
-from django.db.models import functions
-from django.http import HttpRequest
-from django.urls import reverse
+from django.http import HttpRequest, HttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 
-from c3ds.core.models import (Display, DisplayQuerySet, HTMLView, IFrameView, ImageFile, ImageView, Schedule,
-                              ScheduleView, VideoFile, VideoView)
+from c3ds.core.health import EVENTS, METRICS, PERCENTILES, RESOLUTIONS
+from c3ds.core.media import media_pipeline
+from c3ds.core.models import (Display, DisplayQuerySet, HTMLView, IFrameView, ImageFile, ImageVariant, ImageView,
+                              Playlist, PlaylistEntry, Rollout, RolloutTarget, Schedule, ScheduleView, VideoFile,
+                              VideoRendition, VideoView)
+from c3ds.core.prefetch import send_prefetch
+from c3ds.core.presence import presence_registry
+from c3ds.core.rollout import resume
+from c3ds.core.telemetry import telemetry_store
 
 class SlugLinkMixin():
     slug_view = 'view_by_slug'
@@ -27,15 +33,16 @@ class SlugLinkMixin():
 
 @admin.register(Display)
 class DisplayAdmin(admin.ModelAdmin, SlugLinkMixin):
-    list_display = ['name', 'slug', 'static_view', 'playlist', 'link', 'c3nav', 'heartbeat']
+    list_display = ['name', 'slug', 'static_view', 'playlist', 'link', 'c3nav', 'heartbeat', 'prefetched']
     if settings.REMOTE_SHELL:
         list_display.append('shell')
     list_display.append('last_changed')
     slug_view = 'display_by_slug'
 
-    fields = ('name', 'slug', 'static_view', 'playlist', 'link', 'c3nav', 'last_seen', 'last_changed')
-    readonly_fields = ('link', 'c3nav', 'last_seen', 'last_changed')
-    actions = ('reload', )
+    fields = ('name', 'slug', 'static_view', 'playlist', 'width', 'height', 'tags', 'link', 'c3nav', 'presence',
+              'health', 'last_seen', 'last_changed')
+    readonly_fields = ('link', 'c3nav', 'presence', 'health', 'last_seen', 'last_changed')
+    actions = ('reload', 'prefetch')
 
     def c3nav(self, obj):
         return mark_safe(f'<a href="{settings.C3NAV_BASE_URL}/l/{obj.slug.lower()}" target="_blank">map</a>')
@@ -47,17 +54,85 @@ class DisplayAdmin(admin.ModelAdmin, SlugLinkMixin):
         return mark_safe(f'<a href="{url}" target="_blank">shell</a>')
 
     def heartbeat(self, obj: Display):
-        last = cache.get(obj.get_heartbeat_cache_key())
-        if last is None or not isinstance(last, datetime.datetime):
-            return 'Unknown'
+        # the list asks once per row
+        if presence_registry.get_presence(obj.slug, max_age=1) is not None:
+            return mark_safe('<span style="color: green;">Online</span>')
         else:
-            if (datetime.datetime.now(tz=datetime.UTC) - last).total_seconds() < 60:
-                return mark_safe('<span style="color: green;">Online</span>')
-            else:
-                return mark_safe('<span style="color: red;">Offline</span>')
+            return mark_safe('<span style="color: red;">Offline</span>')
+
+    def presence(self, obj: Display):
+        presence = presence_registry.get_presence(obj.slug)
+        if presence is None:
+            return 'Offline'
+        connected_at = datetime.datetime.fromtimestamp(presence['connected_at'], tz=datetime.UTC)
+        return (f'{presence["connections"]} connection(s) since {connected_at.strftime("%Y-%m-%d %H:%M")} '
+                f'from {presence["client_ip"] or "unknown"} on {presence["worker"]}')
+
+    def health(self, obj: Display):
+        # the last hour
+        interval = RESOLUTIONS[0][0]
+        buckets = telemetry_store.get_history(obj.slug).get_buckets(interval, int(time.time()) - 3600)
+        parts = [f'{sum(bucket[event] for bucket in buckets)} {event}(s)' for event in EVENTS]
+        for metric in METRICS:
+            values = [bucket[metric] for bucket in buckets if bucket[metric] is not None]
+            if values:
+                mean = sum(value['mean'] * value['count'] for value in values) / sum(value['count'] for value in values)
+                parts.append(f'{metric} {min(value["min"] for value in values):.1f}/{mean:.1f}/'
+                             f'{max(value["max"] for value in values):.1f} ms')
+        return ', '.join(parts)
+
+    def get_urls(self):
+        return [
+            path('fleet-health/', self.admin_site.admin_view(self.fleet_health_view), name='core_display_fleet_health'),
+            *super().get_urls(),
+        ]
+
+    def fleet_health_view(self, request: HttpRequest) -> HttpResponse:
+        """
+        Fleet wide percentiles per bucket, read from the histograms of the workers.
+        """
+        intervals = [interval for interval, _slots in RESOLUTIONS]
+        try:
+            interval = int(request.GET.get('interval', intervals[0]))
+        except ValueError:
+            interval = intervals[0]
+        if interval not in intervals:
+            interval = intervals[0]
+        buckets = telemetry_store.get_fleet_history().get_buckets(interval)
+        columns = ['count', 'mean', *(f'p{percentile}' for percentile in PERCENTILES)]
+        for bucket in buckets:
+            bucket['start'] = datetime.datetime.fromtimestamp(bucket['start'], tz=datetime.UTC)
+            bucket['counts'] = [bucket[event] for event in EVENTS]
+            bucket['cells'] = [bucket[metric][column] if bucket[metric] else None
+                               for metric in METRICS for column in columns]
+        return TemplateResponse(request, 'admin/core/display/fleet_health.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': _('Fleet health'),
+            'interval': interval,
+            'intervals': intervals,
+            'metrics': METRICS,
+            'events': EVENTS,
+            'columns': columns,
+            'buckets': reversed(buckets),
+        })
+
+    def get_changelist_instance(self, request):
+        changelist = super().get_changelist_instance(request)
+        # one cache lookup for the reports of all displays on the page, the rows read them from the displays
+        reports = telemetry_store.get_prefetch_reports(display.slug for display in changelist.result_list)
+        for display in changelist.result_list:
+            display.prefetch_report = reports.get(display.slug)
+        return changelist
+
+    def prefetched(self, obj: Display):
+        report = obj.prefetch_report
+        if report is None:
+            return '-'
+        return f'{report["cached"]}/{report["total"]}'
 
     def last_seen(self, obj: Display):
-        last = cache.get(obj.get_heartbeat_cache_key())
+        last = telemetry_store.get_heartbeat(obj.slug)
         if last is None or not isinstance(last, datetime.datetime):
             return 'Unknown'
         else:
@@ -65,19 +140,23 @@ class DisplayAdmin(admin.ModelAdmin, SlugLinkMixin):
 
     @admin.action(description=_('Reload Display(s)'))
     def reload(self, request: HttpRequest, queryset: DisplayQuerySet):
-        queryset.reload()
+        count = queryset.reload(description=f'Reload of displays by {request.user}')
+        self.message_user(request, _('Sent reload command to %d display(s).') % count)
+
+    @admin.action(description=_('Prefetch Assets'))
+    def prefetch(self, request: HttpRequest, queryset: DisplayQuerySet):
+        versions = send_prefetch(queryset.select_related('static_view', 'playlist'))
+        self.message_user(request, _('Sent prefetch command to %d display(s).') % len(versions))
 
 
 class ViewAdmin(admin.ModelAdmin, SlugLinkMixin):
     actions = ('reload',)
 
-    @admin.action(description=_('Reload Sssigned Display(s)'))
+    @admin.action(description=_('Reload Assigned Display(s)'))
     def reload(self, request: HttpRequest, queryset):
-        num_displays = queryset.annotate(num_displays = functions.Coalesce(models.Count('displays'), 0))\
-            .aggregate(num_displays=models.Sum('num_displays', default=0))['num_displays']
-        delayed = num_displays > settings.DELAYED_RELOAD_THRESHOLD
-        for view in queryset.all():
-            view.displays.reload(delayed)
+        count = Display.objects.filter(static_view__in=queryset).reload(
+            description=f'Reload of the displays of views by {request.user}')
+        self.message_user(request, _('Sent reload command to %d display(s).') % count)
 
 
 @admin.register(HTMLView)
@@ -90,13 +169,43 @@ class IFrameViewAdmin(ViewAdmin):
     list_display = ('name', 'slug', 'title', 'layout_mode', 'url', 'link', 'last_changed')
 
 
-@admin.register(ImageFile)
-class ImageFileAdmin(admin.ModelAdmin):
-    list_display = ('name', 'filename', 'file', 'file_link', 'last_changed')
+class DerivativeInline(admin.TabularInline):
+    readonly_fields = fields = ('file', 'width', 'height', 'size', 'created_at')
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+class ImageVariantInline(DerivativeInline):
+    model = ImageVariant
+    readonly_fields = fields = ('format',) + DerivativeInline.fields
+
+
+class VideoRenditionInline(DerivativeInline):
+    model = VideoRendition
+    readonly_fields = fields = DerivativeInline.fields + ('poster',)
+
+
+class MediaFileAdmin(admin.ModelAdmin):
+    actions = ('generate_derivatives',)
 
     def file_link(self, obj) -> str:
         return mark_safe(f'<a href="{obj.file.url}" target="_blank" alt="{obj.name}">View</a>')
 
+    @admin.action(description=_('Regenerate Derivatives'))
+    def generate_derivatives(self, request: HttpRequest, queryset):
+        for media in queryset:
+            media_pipeline.submit(media)
+        self.message_user(request, _('Queued %d file(s).') % len(queryset))
+
+
+@admin.register(ImageFile)
+class ImageFileAdmin(MediaFileAdmin):
+    list_display = ('name', 'filename', 'file', 'file_link', 'last_changed')
+    inlines = (ImageVariantInline,)
+
 
 @admin.register(ImageView)
 class ImageViewAdmin(ViewAdmin):
@@ -104,11 +213,9 @@ class ImageViewAdmin(ViewAdmin):
 
 
 @admin.register(VideoFile)
-class VideoFileAdmin(admin.ModelAdmin):
+class VideoFileAdmin(MediaFileAdmin):
     list_display = ('name', 'filename', 'file', 'loop', 'file_link', 'last_changed')
-
-    def file_link(self, obj) -> str:
-        return mark_safe(f'<a href="{obj.file.url}" target="_blank" alt="{obj.name}">View</a>')
+    inlines = (VideoRenditionInline,)
 
 
 @admin.register(VideoView)
@@ -116,6 +223,32 @@ class VideoViewAdmin(ViewAdmin):
     list_display = ('name', 'slug', 'title', 'layout_mode', 'video', 'video_url', 'link', 'last_changed')
 
 
+class PlaylistEntryInline(admin.TabularInline):
+    model = PlaylistEntry
+    fields = ('order', 'view', 'display_duration')
+    ordering = ('order',)
+    extra = 1
+
+
+@admin.register(Playlist)
+class PlaylistAdmin(admin.ModelAdmin):
+    list_display = ('name', 'slug', 'manifest_link', 'last_changed')
+    fields = ('name', 'slug', 'uuid', 'last_changed')
+    readonly_fields = ('uuid', 'last_changed')
+    inlines = (PlaylistEntryInline,)
+    actions = ('reload',)
+
+    def manifest_link(self, obj) -> str:
+        url = reverse('playlist_manifest', kwargs={'slug': obj.slug})
+        return mark_safe(f'<a href="{url}" target="_blank">manifest</a>')
+
+    @admin.action(description=_('Reload Assigned Display(s)'))
+    def reload(self, request: HttpRequest, queryset):
+        count = Display.objects.filter(playlist__in=queryset).reload(
+            description=f'Reload of the displays of playlists by {request.user}')
+        self.message_user(request, _('Sent reload command to %d display(s).') % count)
+
+
 @admin.register(Schedule)
 class ScheduleAdmin(admin.ModelAdmin):
     list_display = ('name', 'version', 'last_changed')
@@ -132,3 +265,60 @@ class ScheduleAdmin(admin.ModelAdmin):
 @admin.register(ScheduleView)
 class ScheduleViewAdmin(ViewAdmin):
     list_display = ('name', 'slug', 'title', 'layout_mode', 'schedule', 'room_filter', 'link', 'last_changed')
+
+
+class RolloutTargetInline(admin.TabularInline):
+    model = RolloutTarget
+    fields = ('display', 'wave', 'attempts', 'sent_at', 'expected_at', 'acked_at', 'latency')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def latency(self, obj: RolloutTarget):
+        return '-' if obj.latency is None else f'{obj.latency:.1f} s'
+
+
+@admin.register(Rollout)
+class RolloutAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'created_at', 'status', 'waves', 'progress', 'stragglers')
+    list_filter = ('status',)
+    fields = ('uuid', 'description', 'created_at', 'status', 'waves', 'wave_started_at', 'progress', 'stragglers',
+              'latency')
+    readonly_fields = ('uuid', 'created_at', 'status', 'waves', 'wave_started_at', 'progress', 'stragglers',
+                       'latency')
+    inlines = (RolloutTargetInline,)
+    actions = ('retry_stragglers', 'resume')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_progress()
+
+    def has_add_permission(self, request):
+        return False
+
+    def waves(self, obj: Rollout):
+        return f'{obj.wave + 1}/{obj.wave_count}'
+
+    def progress(self, obj: Rollout):
+        return f'{obj.acked_count}/{obj.target_count}'
+
+    def stragglers(self, obj: Rollout):
+        return obj.straggler_count
+
+    def latency(self, obj: Rollout):
+        latency = obj.get_progress()['latency']
+        if latency is None:
+            return '-'
+        return f'p50 {latency["p50"]:.1f} s, p90 {latency["p90"]:.1f} s, max {latency["max"]:.1f} s'
+
+    @admin.action(description=_('Retry Stragglers'))
+    def retry_stragglers(self, request: HttpRequest, queryset):
+        count = sum(rollout.retry_stragglers() for rollout in queryset)
+        self.message_user(request, _('Sent reload command to %d straggler(s).') % count)
+
+    @admin.action(description=_('Resume with the next wave'))
+    def resume(self, request: HttpRequest, queryset):
+        count = sum(resume(rollout) for rollout in queryset.filter(status=Rollout.Status.HALTED))
+        self.message_user(request, _('Sent the next wave to %d display(s).') % count)
@@ -0,0 +1,82 @@
+import datetime
+import hashlib
+import uuid
+from typing import Any, Optional
+
+from django.core.cache import cache
+from django.http import HttpRequest, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
+from ninja import NinjaAPI, Query, Schema
+
+from c3ds.core.models import Schedule
+from c3ds.core.schedule_index import schedule_indexes
+
+api = NinjaAPI(title='c3ds', urls_namespace='api')
+
+
+class TalkSchema(Schema):
+    guid: str
+    title: str
+    room: str
+    start: datetime.datetime
+    end: datetime.datetime
+    track: Optional[str] = None
+    persons: list[str]
+
+
+class RoomNowNextSchema(Schema):
+    room: str
+    now: Optional[TalkSchema] = None
+    next: Optional[TalkSchema] = None
+
+
+class NowNextSchema(Schema):
+    schedule: uuid.UUID
+    version: str
+    at: datetime.datetime
+    valid_until: Optional[datetime.datetime] = None
+    rooms: list[RoomNowNextSchema]
+
+
+def talk(talk: Optional[tuple]) -> Optional[dict[str, Any]]:
+    if talk is None:
+        return None
+    start, end, event = talk
+    return {
+        'guid': event['guid'],
+        'title': event['title'],
+        'room': event['room'],
+        'start': start,
+        'end': end,
+        'track': event.get('track'),
+        'persons': [person['name'] for person in event['persons']],
+    }
+
+
+@api.get('/schedules/{schedule_uuid}/now-next', response=NowNextSchema)
+def now_next(request: HttpRequest, response: HttpResponse, schedule_uuid: uuid.UUID, rooms: Query[list[str]]):
+    """
+    Current and next talk in each of the given rooms.
+    """
+    schedule = get_object_or_404(Schedule.objects.exclude(version=None), uuid=schedule_uuid)
+    rooms = list(dict.fromkeys(rooms))
+    cache_key = f'schedule-{schedule.pk}-now-next-' + hashlib.md5(
+        '\0'.join([schedule.version, *rooms]).encode(), usedforsecurity=False).hexdigest()
+    now = datetime.datetime.now(tz=datetime.UTC)
+    result = cache.get(cache_key)
+    if result is None or (result['valid_until'] is not None and result['valid_until'] <= now):
+        index = schedule_indexes.get(schedule)
+        valid_until = index.next_boundary(rooms, now)
+        result = {
+            'schedule': schedule.uuid,
+            'version': schedule.version,
+            'at': now,
+            'valid_until': valid_until,
+            'rooms': [dict(zip(('room', 'now', 'next'), (room, *map(talk, index.now_next(room, now)))))
+                      for room in rooms],
+        }
+        # the answer only changes when a talk starts or ends (or with a new version, which changes the key)
+        cache.set(cache_key, result, max((valid_until - now).total_seconds(), 1) if valid_until else None)
+    patch_cache_control(response, no_cache=True)
+    return result
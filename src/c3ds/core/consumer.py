@@ -1,16 +1,33 @@
 import json
 import logging
-from datetime import datetime, UTC
+import secrets
+import time
+import uuid
+from collections import OrderedDict
 from time import time_ns
 
 from asgiref.sync import async_to_sync
-from channels.generic.websocket import WebsocketConsumer
+from channels.generic.websocket import AsyncWebsocketConsumer, WebsocketConsumer
 from django.core.cache import cache
 
+from c3ds.core.enums import DisplayCommands
+from c3ds.core.groups import display_group, display_groups, group_send
+from c3ds.core.instrumentation import NTP_LATENCY, PING_RTT, RELOAD_ROUND_TRIP, WEBSOCKET_MESSAGES, command_label
 from c3ds.core.models import Display
+from c3ds.core.presence import presence_registry
+from c3ds.core.reload import reload_sent_cache_key
+from c3ds.core.rollout import rollout_acks
+from c3ds.core.telemetry import telemetry_store
 
 logger = logging.getLogger(__name__)
 
+# remote shell frames are relayed as they are, the consumers only look at these prefixes
+SHELL_MESSAGE_PREFIX = '{"cmd":"rsMSG"'
+SHELL_RESULT_PREFIX = '{"cmd":"rsRES","route":"'
+# routes of the shells a display answers to, shells that sent no command for a while are forgotten
+MAX_SHELL_ROUTES = 64
+
+
 class RemoteShellConsumer(WebsocketConsumer):
     def connect(self):
         user = self.scope['user']
@@ -18,14 +35,8 @@ class RemoteShellConsumer(WebsocketConsumer):
             return
 
         self.slug = self.scope['url_route']['kwargs']['display_slug']
-        self.group = f'shell_{self.slug}'
-
-        async_to_sync(self.channel_layer.group_add)(
-            self.group, self.channel_name
-        )
-        async_to_sync(self.channel_layer.group_add)(
-            'shells', self.channel_name
-        )
+        # correlation id of this shell, displays send their results for it straight to this channel
+        self.route = secrets.token_urlsafe(8)
 
         self.accept()
 
@@ -33,52 +44,104 @@ class RemoteShellConsumer(WebsocketConsumer):
         pass
 
     def receive(self, text_data = None, bytes_data = None):
-        data: dict[str] = json.loads(text_data)
-        logger.debug('Received message: %s', text_data)
+        if text_data is None or not text_data.startswith(SHELL_MESSAGE_PREFIX):
+            logger.error('Received invalid shell message')
+            return
+        # add the route to the frame without parsing and serializing it again
+        async_to_sync(group_send)(display_group(self.slug), {
+            'type': 'shell_frame',
+            'route': self.route,
+            'reply_to': self.channel_name,
+            'text': f'{{"route":"{self.route}",{text_data[1:]}',
+        }, self.channel_layer)
 
-        match data.get('cmd', None):
-            case 'rsMSG':
-                async_to_sync(self.channel_layer.group_send)(
-                    f'display_{data.get('displaySlug')}',
-                    {'type': 'cmd_data', 'data': data}
-                )
+    def shell_frame(self, event):
+        self.send(text_data=event['text'])
 
-    def cmd_data(self, event):
-        if not 'data' in event:
-            raise ValueError('No command/data specified')
+class DisplayConsumer(AsyncWebsocketConsumer):
+    groups_joined = ()
 
-        self.send(text_data=json.dumps(event["data"]))
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.shell_routes: OrderedDict[str, str] = OrderedDict()
 
-class DisplayConsumer(WebsocketConsumer):
-    def connect(self):
+    async def connect(self):
         self.display_slug = self.scope['url_route']['kwargs']['display_slug']
-        self.display_group = f'display_{self.display_slug}'
-
-        async_to_sync(self.channel_layer.group_add)(
-            self.display_group, self.channel_name
-        )
-        async_to_sync(self.channel_layer.group_add)(
-            'displays', self.channel_name
-        )
-
-        self.accept()
 
-    def disconnect(self, close_code):
-        pass
+        self.groups_joined = await self.get_groups()
+        for group in self.groups_joined:
+            await self.channel_layer.group_add(group, self.channel_name)
+
+        await self.accept()
+        if not self.scope['user'].is_authenticated:
+            client = self.scope.get('client')
+            presence_registry.connected(self.display_slug, self.channel_name, client[0] if client else None)
+            telemetry_store.record_event(self.display_slug, 'connect')
+            await self.measure_reload()
+
+    async def disconnect(self, close_code):
+        if not self.scope['user'].is_authenticated:
+            presence_registry.disconnected(self.display_slug, self.channel_name)
+            telemetry_store.record_event(self.display_slug, 'disconnect')
+        for group in self.groups_joined:
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def get_groups(self) -> list[str]:
+        # fleet commands reach the display through its shard, tags and playlist (which also sends the clock)
+        playlist_slug, tags = await Display.objects.filter(slug=self.display_slug)\
+            .values_list('playlist__slug', 'tags').afirst() or (None, None)
+        return display_groups(self.display_slug, Display.parse_tags(tags), playlist_slug)
+
+    async def regroup(self, event):
+        # the tags or the playlist changed
+        groups = await self.get_groups()
+        for group in set(self.groups_joined) - set(groups):
+            await self.channel_layer.group_discard(group, self.channel_name)
+        for group in set(groups) - set(self.groups_joined):
+            await self.channel_layer.group_add(group, self.channel_name)
+        self.groups_joined = groups
+
+    async def measure_reload(self):
+        key = reload_sent_cache_key(self.display_slug)
+        expected = await cache.aget(key)
+        if expected is not None:
+            await cache.adelete(key)
+            RELOAD_ROUND_TRIP.observe(max(time.time() - expected, 0))
+
+    async def receive(self, text_data = None, bytes_data = None):
+        if text_data is None:
+            logger.error('Received binary message')
+            return
+        if text_data.startswith(SHELL_RESULT_PREFIX):
+            WEBSOCKET_MESSAGES.labels('received', DisplayCommands.REMOTE_SHELL_RESULT).inc()
+            await self.relay_shell_result(text_data)
+            return
 
-    def receive(self, text_data = None, bytes_data = None):
         data: dict[str] = json.loads(text_data)
         logger.debug('Received message: %s', text_data)
+        WEBSOCKET_MESSAGES.labels('received', command_label(data.get('cmd'))).inc()
 
         match data.get('cmd', None):
             case 'ping':
                 if not self.scope['user'].is_authenticated:
-                    cache.set(Display.heartbeat_cache_key_for_slug(self.display_slug), datetime.now(tz=UTC), None)
-                self.cmd({'cmd': 'pong'})
+                    presence_registry.touch(self.display_slug, self.channel_name)
+                    telemetry_store.record_heartbeat(self.display_slug)
+                    # round trip time of the previous ping, measured by the display
+                    if isinstance(data.get('rtt'), (int, float)):
+                        telemetry_store.record_sample(self.display_slug, 'rtt', data['rtt'])
+                        PING_RTT.observe(data['rtt'] / 1000)
+                await self.cmd({'cmd': 'pong'})
+
+            case 'reloadAck':
+                try:
+                    if not self.scope['user'].is_authenticated:
+                        rollout_acks.record(uuid.UUID(data['rollout']), self.display_slug)
+                except (KeyError, TypeError, ValueError):
+                    logger.error('Received invalid reloadAck')
 
             case 'NTPRequest':
                 try:
-                    self.cmd_data({'data': {
+                    await self.cmd_data({'data': {
                         'cmd': 'NTPResponse',
                         'serverTime': time_ns() // 1000000,
                         'clientSendTimestamp': data['sendTimestamp'],
@@ -89,20 +152,45 @@ class DisplayConsumer(WebsocketConsumer):
             case 'NTPReport':
                 try:
                     if not self.scope['user'].is_authenticated:
-                        cache.set(Display.ntp_offset_cache_key_for_slug(self.display_slug), data['ntpOffset'], None)
-                    logger.info('Received NTPReport, Offset: %0.3f ms, Latency: %0.3f ms',
-                                data['ntpOffset'], data['ntpLatency'])
-                except KeyError:
+                        telemetry_store.record_ntp_offset(self.display_slug, data['ntpOffset'])
+                        telemetry_store.record_sample(self.display_slug, 'ntp_offset', float(data['ntpOffset']))
+                        telemetry_store.record_sample(self.display_slug, 'ntp_latency', float(data['ntpLatency']))
+                        NTP_LATENCY.observe(float(data['ntpLatency']) / 1000)
+                    logger.debug('Received NTPReport, Offset: %0.3f ms, Latency: %0.3f ms',
+                                 data['ntpOffset'], data['ntpLatency'])
+                except (KeyError, TypeError, ValueError):
                     logger.error('Received invalid NTPReport')
 
+            case 'prefetchReport':
+                try:
+                    if not self.scope['user'].is_authenticated:
+                        telemetry_store.record_prefetch_report(self.display_slug, {
+                            'version': data['version'],
+                            'total': int(data['total']),
+                            'cached': int(data['cached']),
+                            'bytes': int(data['bytes']),
+                            'failed': [str(url) for url in data.get('failed', [])][:20],
+                        })
+                except (KeyError, TypeError, ValueError):
+                    logger.error('Received invalid prefetchReport')
+
+    async def relay_shell_result(self, text_data: str):
+        route = text_data[len(SHELL_RESULT_PREFIX):text_data.find('"', len(SHELL_RESULT_PREFIX))]
+        reply_to = self.shell_routes.get(route)
+        if reply_to is None:
+            logger.warning('Dropping shell result for unknown route')
+            return
+        await self.channel_layer.send(reply_to, {'type': 'shell_frame', 'text': text_data})
 
-            case 'rsRES':
-                async_to_sync(self.channel_layer.group_send)(
-                    f'shell_{self.display_slug}',
-                    {'type': 'cmd_data', 'data': data}
-                )
+    async def shell_frame(self, event):
+        self.shell_routes[event['route']] = event['reply_to']
+        self.shell_routes.move_to_end(event['route'])
+        while len(self.shell_routes) > MAX_SHELL_ROUTES:
+            self.shell_routes.popitem(last=False)
+        WEBSOCKET_MESSAGES.labels('sent', DisplayCommands.REMOTE_SHELL_MESSAGE).inc()
+        await self.send(text_data=event['text'])
 
-    def cmd(self, event):
+    async def cmd(self, event):
         # Receive message from display group
         if not 'cmd' in event:
             raise ValueError('No command specified')
@@ -114,11 +202,13 @@ class DisplayConsumer(WebsocketConsumer):
             raise TypeError('Invalid cmd object')
 
         logger.debug('Sending command: %s', cmd)
+        WEBSOCKET_MESSAGES.labels('sent', command_label(cmd.get('cmd'))).inc()
         # Send message to WebSocket
-        self.send(text_data=json.dumps(cmd))
+        await self.send(text_data=json.dumps(cmd))
 
-    def cmd_data(self, event):
+    async def cmd_data(self, event):
         if not 'data' in event:
             raise ValueError('No command/data specified')
 
-        self.send(text_data=json.dumps(event["data"]))
+        WEBSOCKET_MESSAGES.labels('sent', command_label(event['data'].get('cmd'))).inc()
+        await self.send(text_data=json.dumps(event["data"]))
@@ -1,11 +1,16 @@
 from django.conf import settings
 
+from c3ds.core.reload import get_build_fingerprint
+
 
 def event_data(request):
     return {'event': {
         'day_zero': settings.DAY_ZERO.isoformat(),
     }}
 
+def build_data(request):
+    return {'build': get_build_fingerprint()}
+
 def extra_data(request):
     ip_address = request.META.get('HTTP_X_FORWARDED_FOR', request.META.get('REMOTE_ADDR', '')).split(',')[0].strip()
 
@@ -5,7 +5,14 @@ class DisplayCommands(StrEnum):
     PING = 'ping'
     PONG = 'pong'
     RELOAD = 'reload'
+    RELOAD_ACK = 'reloadAck'
+    UPDATE_VIEW = 'updateView'
     REMOTE_SHELL_MESSAGE = 'rsMSG'
     REMOTE_SHELL_RESULT = 'rsRES'
     NTP_REQUEST = 'NTPRequest'
-    NTP_RESPONSE = 'NTPResponse'
\ No newline at end of file
+    NTP_RESPONSE = 'NTPResponse'
+    NTP_REPORT = 'NTPReport'
+    PLAYLIST_ADVANCE = 'advance'
+    SCHEDULE_DELTA = 'scheduleDelta'
+    PREFETCH = 'prefetch'
+    PREFETCH_REPORT = 'prefetchReport'
\ No newline at end of file
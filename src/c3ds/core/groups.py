@@ -0,0 +1,88 @@
+import asyncio
+import hashlib
+from typing import Any, Iterable, Optional
+
+import channels.layers
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.utils.text import slugify
+
+from c3ds.core.instrumentation import GROUP_SEND, group_kind
+
+channel_layer = channels.layers.get_channel_layer()
+
+
+def display_group(slug: str) -> str:
+    return f'display_{slug}'
+
+
+def shard_group(shard: int) -> str:
+    return f'displays_{shard}'
+
+
+def shard_for_slug(slug: str, shards: Optional[int] = None) -> int:
+    digest = hashlib.blake2b(slug.encode(), digest_size=4).digest()
+    return int.from_bytes(digest) % (shards or settings.DISPLAY_GROUP_SHARDS)
+
+
+def tag_slug(tag: str) -> str:
+    # group names are limited to ASCII letters, digits, hyphens, underscores and periods
+    return slugify(tag)[:90]
+
+
+def tag_group(tag: str) -> str:
+    return f'tag_{tag_slug(tag)}'
+
+
+def playlist_group(slug: str) -> str:
+    return f'playlist_{slug}'
+
+
+def display_groups(slug: str, tags: Iterable[str] = (), playlist_slug: Optional[str] = None) -> list[str]:
+    """
+    Groups a display connection joins: its own, its fleet shard, one per tag and the one of its playlist.
+    """
+    groups = [display_group(slug), shard_group(shard_for_slug(slug))]
+    groups.extend(tag_group(tag) for tag in tags if tag_slug(tag))
+    if playlist_slug:
+        groups.append(playlist_group(playlist_slug))
+    return groups
+
+
+async def group_send(group: str, message: dict[str, Any], layer=None):
+    with GROUP_SEND.labels(group_kind(group)).time():
+        await (layer or channel_layer).group_send(group, message)
+
+
+def regroup_display(slug: str):
+    """
+    Makes the connections of the display join the groups of its current tags and playlist, content updates are swapped
+    in place without a reconnect.
+    """
+    async_to_sync(group_send)(display_group(slug), {'type': 'regroup'})
+
+
+async def async_fleet_send(cmd: dict[str, Any], pause: Optional[float] = None) -> int:
+    """
+    Sends the command to all connected displays one shard after the other, so the channel layer and the displays
+    (e.g. reloading) don't all get it at once. Returns the number of shards.
+    """
+    pause = settings.FLEET_SHARD_PAUSE if pause is None else pause
+    for shard in range(settings.DISPLAY_GROUP_SHARDS):
+        if shard and pause:
+            await asyncio.sleep(pause)
+        await group_send(shard_group(shard), {'type': 'cmd', 'cmd': cmd})
+    return settings.DISPLAY_GROUP_SHARDS
+
+
+async def async_groups_send(groups: Iterable[str], cmd: dict[str, Any], pause: Optional[float] = None) -> int:
+    """
+    Sends the command to the groups (e.g. tag and playlist groups) one after the other, returns the number of groups.
+    """
+    pause = settings.FLEET_SHARD_PAUSE if pause is None else pause
+    groups = list(dict.fromkeys(groups))
+    for index, group in enumerate(groups):
+        if index and pause:
+            await asyncio.sleep(pause)
+        await group_send(group, {'type': 'cmd', 'cmd': cmd})
+    return len(groups)
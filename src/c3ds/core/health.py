@@ -0,0 +1,231 @@
+import array
+from abc import ABC, abstractmethod
+from typing import Any, Iterable, Optional, Sequence
+
+# samples in milliseconds
+METRICS = ('rtt', 'ntp_offset', 'ntp_latency')
+EVENTS = ('connect', 'disconnect')
+# (seconds per bucket, number of buckets), every sample is downsampled into all of them when it is written
+RESOLUTIONS = ((300, 36), (3600, 72))
+RETENTION = max(interval * slots for interval, slots in RESOLUTIONS)
+# the bucket of the finest resolution that is still filling up, kept apart from the history until it is complete
+CURRENT_RESOLUTION = ((min(interval for interval, slots in RESOLUTIONS), 1),)
+# upper bounds in milliseconds of the fleet histogram buckets, larger values land in one more bucket
+HISTOGRAM_BOUNDS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+PERCENTILES = (50, 90, 99)
+
+
+class RingSeries:
+    """
+    A fixed number of time buckets with `width` float32 values each in one flat array. A bucket is cleared and reused
+    when the ring wraps around.
+    """
+
+    def __init__(self, interval: int, slots: int, width: int):
+        self.interval = interval
+        self.slots = slots
+        self.width = width
+        self.starts = array.array('I', [0]) * slots
+        self.values = array.array('f', [0.0]) * (slots * width)
+
+    @property
+    def nbytes(self) -> int:
+        return self.starts.itemsize * len(self.starts) + self.values.itemsize * len(self.values)
+
+    def load(self, data: memoryview):
+        split = self.starts.itemsize * self.slots
+        self.starts = array.array('I')
+        self.starts.frombytes(data[:split])
+        self.values = array.array('f')
+        self.values.frombytes(data[split:])
+
+    def dump(self) -> bytes:
+        return self.starts.tobytes() + self.values.tobytes()
+
+    def offset(self, timestamp: float) -> Optional[int]:
+        """
+        Index of the first value of the bucket of the timestamp, None if the ring moved past it.
+        """
+        start = int(timestamp) // self.interval * self.interval
+        index = start // self.interval % self.slots
+        if self.starts[index] != start:
+            if self.starts[index] > start:
+                return None
+            self.starts[index] = start
+            self.values[index * self.width:(index + 1) * self.width] = array.array('f', [0.0]) * self.width
+        return index * self.width
+
+    def buckets(self, since: int = 0) -> list[tuple[int, array.array]]:
+        return sorted((start, self.values[index * self.width:(index + 1) * self.width])
+                      for index, start in enumerate(self.starts) if start and start >= since)
+
+
+class History(ABC):
+    """
+    The ring series of all resolutions, serialized into one bytes value for the cache.
+    """
+    width: int
+    event_offset: int
+
+    def __init__(self, data: Optional[bytes] = None, resolutions: tuple[tuple[int, int], ...] = RESOLUTIONS):
+        self.series = {interval: RingSeries(interval, slots, self.width) for interval, slots in resolutions}
+        # a record of another layout is discarded
+        if data is not None and len(data) == sum(series.nbytes for series in self.series.values()):
+            view, offset = memoryview(data), 0
+            for series in self.series.values():
+                series.load(view[offset:offset + series.nbytes])
+                offset += series.nbytes
+
+    def to_bytes(self) -> bytes:
+        return b''.join(series.dump() for series in self.series.values())
+
+    def add_sample(self, timestamp: float, metric: str, value: float):
+        for series in self.series.values():
+            offset = series.offset(timestamp)
+            if offset is not None:
+                self.add_value(series.values, offset, METRICS.index(metric), value)
+
+    def add_event(self, timestamp: float, event: str):
+        for series in self.series.values():
+            offset = series.offset(timestamp)
+            if offset is not None:
+                series.values[offset + self.event_offset + EVENTS.index(event)] += 1
+
+    @abstractmethod
+    def add_value(self, values: array.array, offset: int, metric: int, value: float):
+        pass
+
+    @abstractmethod
+    def merge_values(self, values: array.array, offset: int, bucket: Sequence[float]):
+        """
+        Adds the values of a bucket to the bucket at the offset.
+        """
+
+    @abstractmethod
+    def summarize(self, values: Iterable[float]) -> dict[str, Any]:
+        pass
+
+    def add_bucket(self, start: int, bucket: Sequence[float]):
+        for series in self.series.values():
+            offset = series.offset(start)
+            if offset is not None:
+                self.merge_values(series.values, offset, bucket)
+
+    def add_history(self, other: 'History'):
+        """
+        Adds the buckets of a history of the finest resolution (e.g. the current bucket) to all resolutions.
+        """
+        for series in other.series.values():
+            for start, bucket in series.buckets():
+                self.add_bucket(start, bucket)
+
+    def get_buckets(self, interval: int, since: int = 0) -> list[dict[str, Any]]:
+        return [{'start': start, **self.summarize(values)} for start, values in self.series[interval].buckets(since)]
+
+
+class DisplayHistory(History):
+    """
+    Count, sum, minimum and maximum of each metric and the number of each event per bucket of one display.
+    """
+    width = 4 * len(METRICS) + len(EVENTS)
+    event_offset = 4 * len(METRICS)
+
+    def add_value(self, values: array.array, offset: int, metric: int, value: float):
+        offset += 4 * metric
+        if values[offset] == 0:
+            values[offset + 2] = values[offset + 3] = value
+        else:
+            values[offset + 2] = min(values[offset + 2], value)
+            values[offset + 3] = max(values[offset + 3], value)
+        values[offset] += 1
+        values[offset + 1] += value
+
+    def merge_values(self, values: array.array, offset: int, bucket: Sequence[float]):
+        for metric in range(len(METRICS)):
+            target, source = offset + 4 * metric, 4 * metric
+            if not bucket[source]:
+                continue
+            if values[target] == 0:
+                values[target + 2], values[target + 3] = bucket[source + 2], bucket[source + 3]
+            else:
+                values[target + 2] = min(values[target + 2], bucket[source + 2])
+                values[target + 3] = max(values[target + 3], bucket[source + 3])
+            values[target] += bucket[source]
+            values[target + 1] += bucket[source + 1]
+        for index in range(len(EVENTS)):
+            values[offset + self.event_offset + index] += bucket[self.event_offset + index]
+
+    def summarize(self, values: Iterable[float]) -> dict[str, Any]:
+        values = list(values)
+        summary = {event: int(values[self.event_offset + index]) for index, event in enumerate(EVENTS)}
+        for index, metric in enumerate(METRICS):
+            count, total, minimum, maximum = values[4 * index:4 * index + 4]
+            summary[metric] = {'count': int(count), 'mean': total / count, 'min': minimum, 'max': maximum} \
+                if count else None
+        return summary
+
+
+class FleetHistory(History):
+    """
+    A histogram and the sum of each metric and the number of each event per bucket of all displays of one worker.
+    The NTP offset is counted by magnitude, the histogram buckets are positive.
+    """
+    stride = len(HISTOGRAM_BOUNDS) + 2
+    width = stride * len(METRICS) + len(EVENTS)
+    event_offset = stride * len(METRICS)
+
+    def add_value(self, values: array.array, offset: int, metric: int, value: float):
+        value = abs(value)
+        offset += self.stride * metric
+        position = next((index for index, bound in enumerate(HISTOGRAM_BOUNDS) if value <= bound),
+                        len(HISTOGRAM_BOUNDS))
+        values[offset + position] += 1
+        values[offset + self.stride - 1] += value
+
+    def merge_values(self, values: array.array, offset: int, bucket: Sequence[float]):
+        for index, value in enumerate(bucket):
+            values[offset + index] += value
+
+    def summarize(self, values: Iterable[float]) -> dict[str, Any]:
+        values = list(values)
+        summary = {event: int(values[self.event_offset + index]) for index, event in enumerate(EVENTS)}
+        for index, metric in enumerate(METRICS):
+            counts = values[self.stride * index:self.stride * (index + 1) - 1]
+            count = sum(counts)
+            summary[metric] = {
+                'count': int(count),
+                'mean': values[self.stride * (index + 1) - 1] / count,
+                **{f'p{percentile}': histogram_percentile(counts, percentile) for percentile in PERCENTILES},
+            } if count else None
+        return summary
+
+    @classmethod
+    def merge(cls, histories: Iterable['FleetHistory']) -> 'FleetHistory':
+        """
+        Adds up the histories of all workers bucket by bucket.
+        """
+        merged = cls()
+        for history in histories:
+            for interval, series in history.series.items():
+                target = merged.series[interval]
+                for start, values in series.buckets():
+                    offset = target.offset(start)
+                    if offset is not None:
+                        merged.merge_values(target.values, offset, values)
+        return merged
+
+
+def histogram_percentile(counts: list[float], percentile: float) -> float:
+    """
+    Interpolates the percentile within the histogram bucket it falls into, the overflow bucket reports its bound.
+    """
+    rank = sum(counts) * percentile / 100
+    seen = 0.0
+    for index, count in enumerate(counts):
+        if count and seen + count >= rank:
+            if index == len(HISTOGRAM_BOUNDS):
+                return HISTOGRAM_BOUNDS[-1]
+            lower = HISTOGRAM_BOUNDS[index - 1] if index else 0
+            return lower + (HISTOGRAM_BOUNDS[index] - lower) * (rank - seen) / count
+        seen += count
+    return HISTOGRAM_BOUNDS[-1]
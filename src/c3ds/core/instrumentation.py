@@ -0,0 +1,41 @@
+from prometheus_client import Counter, Histogram
+
+from c3ds.core.enums import DisplayCommands
+
+# labels are limited to fixed sets and never contain display slugs, so the number of series doesn't grow with the
+# fleet
+COMMANDS = frozenset(DisplayCommands)
+GROUP_KINDS = ('display', 'displays', 'tag', 'playlist')
+
+PING_RTT = Histogram(
+    'display_ping_rtt_seconds', 'Websocket ping round trip time measured by the displays',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+NTP_LATENCY = Histogram(
+    'display_ntp_latency_seconds', 'Latency between NTP server and displays',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+GROUP_SEND = Histogram(
+    'channel_group_send_seconds', 'Duration of channel layer group sends by group kind', ['group'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+DISPLAY_VIEW_RENDER = Histogram(
+    'display_view_render_seconds', 'Duration of display page requests by page cache result', ['cache'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+RELOAD_ROUND_TRIP = Histogram(
+    'display_reload_round_trip_seconds', 'Time from a reload command (after its delay) until the display reconnected',
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300),
+)
+WEBSOCKET_MESSAGES = Counter(
+    'display_websocket_messages', 'Websocket messages of displays by direction and command', ['direction', 'cmd'],
+)
+
+
+def command_label(cmd) -> str:
+    return cmd if cmd in COMMANDS else 'other'
+
+
+def group_kind(group: str) -> str:
+    kind = group.partition('_')[0]
+    return kind if kind in GROUP_KINDS else 'other'
@@ -0,0 +1,93 @@
+import asyncio
+import random
+import time
+from collections import Counter
+from typing import Optional
+from urllib.parse import urlparse
+
+from django.core.management import BaseCommand, CommandError
+
+
+async def fetch(host: str, port: int, path: str, secure: bool,
+                byte_range: Optional[str] = None) -> tuple[int, float, int]:
+    """
+    Fetches the path on a connection of its own, returns status, time to the first byte and body bytes read.
+    """
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port, ssl=secure or None)
+    try:
+        writer.write((f'GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nConnection: close\r\n'
+                      + (f'Range: {byte_range}\r\n' if byte_range else '') + '\r\n').encode())
+        head = await reader.readuntil(b'\r\n\r\n')
+        ttfb = time.perf_counter() - started
+        status = int(head.split(b' ', 2)[1])
+        received = 0
+        while chunk := await reader.read(256 * 1024):
+            received += len(chunk)
+        return status, ttfb, received
+    finally:
+        writer.close()
+
+
+async def simulate_client(url, deadline: float, range_size: int, size: int, stats: Counter, ttfbs: list):
+    secure = url.scheme == 'https'
+    port = url.port or (443 if secure else 80)
+    while time.monotonic() < deadline:
+        byte_range = None
+        if range_size and size > range_size:
+            # seeking, like a player jumping to a random position
+            first = random.randrange(0, size - range_size)
+            byte_range = f'bytes={first}-{first + range_size - 1}'
+        try:
+            status, ttfb, received = await fetch(url.hostname, port, url.path, secure, byte_range)
+        except (OSError, ValueError, asyncio.IncompleteReadError):
+            stats['failed'] += 1
+            await asyncio.sleep(1)
+            continue
+        stats[status] += 1
+        stats['bytes'] += received
+        ttfbs.append(ttfb * 1000)
+        if status == 503:
+            await asyncio.sleep(1)
+
+
+class Command(BaseCommand):
+    help = "Download a media file with many parallel clients from a running worker and report the throughput"
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='URL of a media file, e.g. a video below /media/')
+        parser.add_argument('--clients', type=int, default=200, help='Number of parallel clients')
+        parser.add_argument('--duration', type=int, default=30, help='Seconds to keep downloading')
+        parser.add_argument('--range-size', type=int, default=0,
+                            help='Request random byte ranges of this many bytes instead of the whole file')
+
+    def handle(self, *args, **options):
+        url = urlparse(options['url'])
+        if url.scheme not in ('http', 'https') or not url.hostname:
+            raise CommandError('URL must be a http:// or https:// URL')
+        stats, ttfbs, elapsed = asyncio.run(self.run(url, options))
+
+        ttfbs.sort()
+        statuses = ', '.join(f'{status}: {count}' for status, count in sorted(stats.items(), key=str)
+                             if isinstance(status, int))
+        self.stdout.write(f'requests: {len(ttfbs)}, failed: {stats["failed"]}, {statuses}')
+        self.stdout.write('throughput: %.1f MiB/s total, %.2f MiB/s per client' % (
+            stats['bytes'] / 2 ** 20 / elapsed, stats['bytes'] / 2 ** 20 / elapsed / options['clients'],
+        ))
+        if ttfbs:
+            self.stdout.write('time to first byte p50: %.2f ms, p99: %.2f ms, max: %.2f ms' % (
+                ttfbs[len(ttfbs) // 2], ttfbs[int(len(ttfbs) * 0.99)], ttfbs[-1],
+            ))
+
+    async def run(self, url, options):
+        secure = url.scheme == 'https'
+        status, _ttfb, size = await fetch(url.hostname, url.port or (443 if secure else 80), url.path, secure)
+        if status != 200:
+            raise CommandError(f'Fetching {url.geturl()} failed with status {status}')
+        stats, ttfbs = Counter(), []
+        started = time.monotonic()
+        await asyncio.gather(*(
+            simulate_client(url, started + options['duration'], options['range_size'], size, stats, ttfbs)
+            for _ in range(options['clients'])
+        ))
+        return stats, ttfbs, time.monotonic() - started
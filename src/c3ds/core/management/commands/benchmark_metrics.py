@@ -0,0 +1,69 @@
+import datetime
+import time
+
+from django.core.cache import cache
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from c3ds.core.metrics import CustomCollector
+from c3ds.core.models import Display, HTMLView
+from c3ds.core.presence import WORKERS_CACHE_KEY, worker_cache_key
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Benchmark the Prometheus collector scrape latency for a growing number of displays"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--displays', type=int, nargs='+', default=[10, 100, 1000, 10000],
+                            help='Number of displays to benchmark with')
+        parser.add_argument('--runs', type=int, default=5, help='Number of scrapes per display count')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"displays":>10} {"queries":>8} {"min ms":>10} {"median ms":>10} {"max ms":>10}')
+        for count in options['displays']:
+            try:
+                with transaction.atomic():
+                    self.benchmark(count, options['runs'])
+                    raise Rollback()
+            except Rollback:
+                pass
+
+    def benchmark(self, count: int, runs: int):
+        view = HTMLView.objects.create(name='benchmark', slug='benchmark-view')
+        displays = Display.objects.bulk_create(
+            Display(name=f'benchmark {i}', slug=f'benchmark-{i}', static_view=view) for i in range(count)
+        )
+        now = datetime.datetime.now(tz=datetime.UTC)
+        cache_data = {}
+        presence = {}
+        for display in displays:
+            cache_data[display.get_heartbeat_cache_key()] = now
+            cache_data[display.get_ntp_offset_cache_key()] = 1.0
+            presence[display.slug] = {'connections': 1, 'connected_at': now.timestamp(), 'client_ip': None,
+                                      'worker': 'benchmark'}
+        cache_data[worker_cache_key('benchmark')] = presence
+        workers = cache.get(WORKERS_CACHE_KEY) or {}
+        cache.set_many(cache_data, 300)
+        cache.set(WORKERS_CACHE_KEY, {**workers, 'benchmark': now.timestamp() + 300}, 300)
+
+        collector = CustomCollector()
+        timings = []
+        try:
+            for _ in range(runs):
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    for _metric in collector.collect():
+                        pass
+                    timings.append((time.perf_counter() - start) * 1000)
+        finally:
+            cache.delete_many(list(cache_data))
+            cache.set(WORKERS_CACHE_KEY, workers, 300)
+
+        timings.sort()
+        self.stdout.write(f'{count:>10} {len(queries):>8} {timings[0]:>10.2f} '
+                          f'{timings[len(timings) // 2]:>10.2f} {timings[-1]:>10.2f}')
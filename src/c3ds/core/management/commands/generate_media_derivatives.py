@@ -0,0 +1,18 @@
+from django.core.management import BaseCommand
+
+from c3ds.core.media import generate_derivatives
+from c3ds.core.models import ImageFile, VideoFile
+
+
+class Command(BaseCommand):
+    help = "Generate the image variants and video renditions of all media files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate up to date derivatives')
+
+    def handle(self, *args, **options):
+        for model in (ImageFile, VideoFile):
+            for media in model.objects.all():
+                count = generate_derivatives(media, force=options['force'])
+                if count:
+                    self.stdout.write(f'{model.__name__} "{media.name}": {count} derivative(s)')
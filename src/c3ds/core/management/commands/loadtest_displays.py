@@ -0,0 +1,145 @@
+import asyncio
+import base64
+import json
+import os
+import random
+import struct
+import time
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlparse
+
+from django.core.management import BaseCommand, CommandError
+
+
+def read_rss(pid: int) -> Optional[int]:
+    try:
+        status = Path(f'/proc/{pid}/status').read_text()
+    except OSError:
+        return None
+    for line in status.splitlines():
+        if line.startswith('VmRSS:'):
+            return int(line.split()[1]) * 1024
+    return None
+
+
+class WebSocketClient:
+    """Minimal websocket client, daphne forces txaio onto twisted so autobahn's asyncio client is unavailable."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host: str, port: int, path: str, secure: bool) -> 'WebSocketClient':
+        reader, writer = await asyncio.open_connection(host, port, ssl=secure or None)
+        key = base64.b64encode(os.urandom(16)).decode()
+        writer.write((f'GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\n'
+                      f'Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n'
+                      f'Origin: {"https" if secure else "http"}://{host}:{port}\r\n\r\n').encode())
+        response = await reader.readuntil(b'\r\n\r\n')
+        if not response.startswith(b'HTTP/1.1 101'):
+            writer.close()
+            raise ConnectionError(response.split(b'\r\n', 1)[0].decode())
+        return cls(reader, writer)
+
+    def send(self, text: str):
+        payload = text.encode()
+        mask = os.urandom(4)
+        if len(payload) < 126:
+            header = struct.pack('!BB', 0x81, 0x80 | len(payload))
+        else:
+            header = struct.pack('!BBH', 0x81, 0x80 | 126, len(payload))
+        self.writer.write(header + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload)))
+
+    async def receive(self) -> str:
+        first, length = await self.reader.readexactly(2)
+        length &= 0x7f
+        if length == 126:
+            length, = struct.unpack('!H', await self.reader.readexactly(2))
+        elif length == 127:
+            length, = struct.unpack('!Q', await self.reader.readexactly(8))
+        payload = await self.reader.readexactly(length)
+        if first & 0x0f == 0x8:
+            raise ConnectionError('connection closed by server')
+        return payload.decode()
+
+    def close(self):
+        self.writer.close()
+
+
+async def simulate_display(client: WebSocketClient, ping_interval: float, stats: dict, latencies: list):
+    # spread the pings of all clients over the whole interval
+    await asyncio.sleep(random.uniform(0, ping_interval))
+    while True:
+        ping_sent = time.perf_counter()
+        client.send(json.dumps({'cmd': 'ping'}))
+        stats['pings'] += 1
+        while json.loads(await client.receive()).get('cmd') != 'pong':
+            pass
+        latencies.append((time.perf_counter() - ping_sent) * 1000)
+        await asyncio.sleep(max(ping_interval - (time.perf_counter() - ping_sent), 0))
+
+
+class Command(BaseCommand):
+    help = "Keep many simulated displays connected to a running worker and report pong latency and RSS"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='ws://localhost:8000', help='Base websocket URL of the worker')
+        parser.add_argument('--clients', type=int, default=2000, help='Number of simulated displays')
+        parser.add_argument('--duration', type=int, default=60, help='Seconds to keep all displays connected')
+        parser.add_argument('--ping-interval', type=float, default=5, help='Seconds between pings per display')
+        parser.add_argument('--ramp', type=int, default=200, help='New connections per second')
+        parser.add_argument('--pid', type=int, help='PID of the worker to report the RSS of')
+
+    def handle(self, *args, **options):
+        url = urlparse(options['url'])
+        if url.scheme not in ('ws', 'wss') or not url.hostname:
+            raise CommandError('URL must be a ws:// or wss:// URL')
+        rss_before = read_rss(options['pid']) if options['pid'] else None
+        stats, latencies = asyncio.run(self.run(url, options))
+        rss_after = read_rss(options['pid']) if options['pid'] else None
+
+        latencies.sort()
+        self.stdout.write(f'connected: {stats["connected"]}, failed: {stats["failed"]}, '
+                          f'closed early: {stats["closed"]}, pings: {stats["pings"]}, pongs: {len(latencies)}')
+        if latencies:
+            self.stdout.write('pong latency p50: %.2f ms, p99: %.2f ms, max: %.2f ms' % (
+                latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)], latencies[-1],
+            ))
+        if rss_before is not None and rss_after is not None:
+            self.stdout.write('worker RSS: %.1f MiB → %.1f MiB (%.1f KiB per display)' % (
+                rss_before / 2 ** 20, rss_after / 2 ** 20,
+                (rss_after - rss_before) / 1024 / max(stats['connected'], 1),
+            ))
+
+    async def run(self, url, options):
+        secure = url.scheme == 'wss'
+        port = url.port or (443 if secure else 80)
+        stats = {'connected': 0, 'failed': 0, 'closed': 0, 'pings': 0}
+        latencies = []
+        clients = []
+        tasks = []
+
+        for i in range(options['clients']):
+            try:
+                client = await WebSocketClient.connect(url.hostname, port, f'/ws/display/loadtest-{i}/', secure)
+            except (OSError, ConnectionError, asyncio.IncompleteReadError):
+                stats['failed'] += 1
+                continue
+            stats['connected'] += 1
+            clients.append(client)
+            tasks.append(asyncio.create_task(simulate_display(client, options['ping_interval'], stats, latencies)))
+            if (i + 1) % options['ramp'] == 0:
+                await asyncio.sleep(1)
+
+        # only measure the steady state once all displays are connected
+        latencies.clear()
+        await asyncio.sleep(options['duration'])
+        stats['closed'] = sum(1 for task in tasks if task.done())
+        result = dict(stats), list(latencies)
+        for task in tasks:
+            task.cancel()
+        for client in clients:
+            client.close()
+        return result
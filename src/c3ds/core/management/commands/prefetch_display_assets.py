@@ -0,0 +1,43 @@
+import time
+
+from django.core.management import BaseCommand, CommandError
+
+from c3ds.core.models import BaseView, Display, Playlist
+from c3ds.core.prefetch import prefetch_status, send_prefetch
+
+
+class Command(BaseCommand):
+    help = "Let displays download the media of their content, or of the content they will switch to, in advance"
+
+    def add_arguments(self, parser):
+        parser.add_argument('displays', nargs='*', help='Display slugs, all displays if omitted')
+        content = parser.add_mutually_exclusive_group()
+        content.add_argument('--view', help='Slug of the view the displays will switch to')
+        content.add_argument('--playlist', help='Slug of the playlist the displays will switch to')
+        parser.add_argument('--wait', type=float, default=0,
+                            help='Seconds to wait for the displays to report their cached assets')
+
+    def handle(self, *args, **options):
+        displays = Display.objects.select_related('static_view', 'playlist')
+        if options['displays']:
+            displays = displays.filter(slug__in=options['displays'])
+        static_view = playlist = None
+        try:
+            if options['view']:
+                static_view = BaseView.objects.get(slug=options['view'])
+            if options['playlist']:
+                playlist = Playlist.objects.get(slug=options['playlist'])
+        except (BaseView.DoesNotExist, Playlist.DoesNotExist) as e:
+            raise CommandError(e)
+
+        versions = send_prefetch(displays, static_view, playlist)
+        self.stdout.write(f'Sent prefetch command to {len(versions)} display(s)')
+        deadline = time.monotonic() + options['wait']
+        status = prefetch_status(versions)
+        while not all(status.values()) and time.monotonic() < deadline:
+            time.sleep(1)
+            status = prefetch_status(versions)
+        if options['wait']:
+            for slug, ready in sorted(status.items()):
+                self.stdout.write(f'{slug}: {"ready" if ready else "not ready"}')
+            self.stdout.write(f'{sum(status.values())}/{len(status)} display(s) have cached their assets')
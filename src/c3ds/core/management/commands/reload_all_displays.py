@@ -1,18 +1,37 @@
-import channels.layers
 from asgiref.sync import async_to_sync
 from django.core.management import BaseCommand
 
 from c3ds.core.enums import DisplayCommands
+from c3ds.core.groups import async_fleet_send, async_groups_send, playlist_group, tag_group
+from c3ds.core.models import Display, Rollout
 
 
 class Command(BaseCommand):
-    help = "Reload all displays"
+    help = "Reload all displays, or the displays with a tag or playlist"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tag', action='append', default=[], help='Only reload displays with this tag')
+        parser.add_argument('--playlist', action='append', default=[],
+                            help='Only reload displays showing this playlist (slug)')
+        parser.add_argument('--pause', type=float, help='Seconds between two shards or groups')
+
     def handle(self, *args, **options):
-        channel_layer = channels.layers.get_channel_layer()
-        async_to_sync(channel_layer.group_send)('displays', {
-            'type': 'cmd',
-            'cmd': {
-                'cmd': DisplayCommands.RELOAD,
-                'delayed': True,
-            }
-        })
+        groups = [tag_group(tag) for tag in options['tag']] + [playlist_group(slug) for slug in options['playlist']]
+        displays = Display.objects.all()
+        if groups:
+            displays = displays.in_groups(options['tag'], options['playlist'])
+        # the displays pick their own delay within the reload window
+        rollout = Rollout.create_for(displays, description=' '.join(['reload_all_displays', *groups]))
+        cmd = {
+            'cmd': DisplayCommands.RELOAD,
+            'delayed': True,
+            'rollout': str(rollout.uuid),
+        }
+        if groups:
+            count = async_to_sync(async_groups_send)(groups, cmd, options['pause'])
+            self.stdout.write(f'Sent reload command to {count} group(s)')
+        else:
+            count = async_to_sync(async_fleet_send)(cmd, options['pause'])
+            self.stdout.write(f'Sent reload command to {count} shard(s)')
+        self.stdout.write(f'Rollout {rollout.uuid} with {rollout.targets.count()} display(s), '
+                          f'follow it with: manage.py rollout_status {rollout.uuid} --follow')
@@ -0,0 +1,58 @@
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management import BaseCommand, CommandError
+
+from c3ds.core.models import Rollout
+from c3ds.core.rollout import resume, rollout_driver
+
+
+class Command(BaseCommand):
+    help = "Show the progress of a rollout (the latest one by default), retry its stragglers or resume it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('rollout', nargs='?', help='UUID of the rollout')
+        parser.add_argument('--follow', action='store_true',
+                            help='Print the progress every second until every display acknowledged or straggles, and '
+                                 'send the next waves of the rollout once the current one is healthy')
+        parser.add_argument('--retry', action='store_true', help='Send the reload command to the stragglers again')
+        parser.add_argument('--resume', action='store_true', help='Send the next wave of a halted rollout')
+
+    def handle(self, *args, **options):
+        try:
+            rollouts = Rollout.objects.filter(uuid=options['rollout']) if options['rollout'] else Rollout.objects.all()
+            rollout = rollouts.first()
+        except ValidationError:
+            rollout = None
+        if rollout is None:
+            raise CommandError('Rollout not found')
+        self.stdout.write(str(rollout))
+
+        if options['resume']:
+            self.stdout.write(f'Sent the next wave to {resume(rollout)} display(s)')
+
+        if options['follow']:
+            # e.g. after a restart of the server that sent the previous wave
+            rollout_driver.start()
+        while True:
+            rollout.refresh_from_db()
+            progress = rollout.get_progress()
+            self.write_progress(rollout, progress)
+            if not options['follow'] or rollout.status == Rollout.Status.HALTED or \
+                    progress['acked'] + progress['stragglers'] >= progress['total']:
+                break
+            time.sleep(1)
+
+        stragglers = rollout.get_stragglers().select_related('display')
+        if stragglers:
+            self.stdout.write('Stragglers: ' + ', '.join(target.display.slug for target in stragglers))
+        if options['retry']:
+            self.stdout.write(f'Sent reload command to {rollout.retry_stragglers()} straggler(s)')
+
+    def write_progress(self, rollout, progress):
+        latency = progress['latency']
+        latency = f'p50 {latency["p50"]:.1f} s, p90 {latency["p90"]:.1f} s, max {latency["max"]:.1f} s' \
+            if latency else '-'
+        self.stdout.write(f'{rollout.get_status_display()}, wave {rollout.wave + 1}/{rollout.wave_count}, '
+                          f'{progress["acked"]}/{progress["total"]} acknowledged, '
+                          f'{progress["stragglers"]} straggler(s), latency {latency}')
@@ -0,0 +1,19 @@
+import asyncio
+
+from django.core.management import BaseCommand
+
+from c3ds.core.playlist_clock import PlaylistScheduler
+
+
+class Command(BaseCommand):
+    help = ("Publish the synchronized slot boundaries of all playlists to their displays "
+            "(requires a shared channel layer)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lead', type=int, help='Milliseconds a slot boundary is announced ahead of time')
+        parser.add_argument('--refresh-interval', type=float, default=30,
+                            help='Seconds between checks for added or removed playlists')
+
+    def handle(self, *args, **options):
+        scheduler = PlaylistScheduler(lead=options['lead'])
+        asyncio.run(scheduler.run(refresh_interval=options['refresh_interval']))
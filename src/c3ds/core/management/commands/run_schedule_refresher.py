@@ -0,0 +1,22 @@
+import asyncio
+
+from django.core.management import BaseCommand
+
+from c3ds.core.schedule_refresher import ScheduleRefresher
+
+
+class Command(BaseCommand):
+    help = "Keep all schedules up to date by polling their URLs in the background"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Seconds between two polls of a schedule')
+        parser.add_argument('--concurrency', type=int, default=4, help='Number of concurrent downloads')
+        parser.add_argument('--once', action='store_true', help='Refresh all schedules once and exit')
+
+    def handle(self, *args, **options):
+        refresher = ScheduleRefresher(interval=options['interval'], concurrency=options['concurrency'])
+        if options['once']:
+            updated = asyncio.run(refresher.refresh_due())
+            self.stdout.write(f'{updated} schedule(s) updated')
+        else:
+            asyncio.run(refresher.run())
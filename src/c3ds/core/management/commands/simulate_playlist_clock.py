@@ -0,0 +1,123 @@
+import asyncio
+import random
+import statistics
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management import BaseCommand
+
+from c3ds.core.playlist_clock import PlaylistClock, PlaylistScheduler, now_ms
+
+
+def wall_ms() -> float:
+    return time.time_ns() / 1000000
+
+
+class SimulatedDisplay:
+    """
+    A display with a skewed clock, asymmetric network delays and the offset estimation of core/ts/ntp.ts.
+    """
+
+    def __init__(self, layer: InMemoryChannelLayer, max_clock_offset: float, latency: float):
+        self.layer = layer
+        self.clock_offset = random.uniform(-max_clock_offset, max_clock_offset)
+        self.latency = latency
+        self.ntp_offset = 0.0
+        self.flips: dict[int, float] = {}
+
+    def local_ms(self) -> float:
+        return wall_ms() + self.clock_offset
+
+    def network_delay(self) -> float:
+        return random.expovariate(1 / self.latency) / 1000
+
+    async def ntp_sync(self, samples: int):
+        # like the client, keep the offset of the exchange with the lowest round trip time
+        best_round_trip_time = None
+        for _ in range(samples):
+            send_timestamp = time.perf_counter()
+            await asyncio.sleep(self.network_delay())
+            server_time = now_ms()
+            await asyncio.sleep(self.network_delay())
+            round_trip_time = (time.perf_counter() - send_timestamp) * 1000
+            if best_round_trip_time is None or round_trip_time < best_round_trip_time:
+                best_round_trip_time = round_trip_time
+                self.ntp_offset = self.local_ms() - (server_time + round_trip_time / 2)
+
+    async def run(self, group: str):
+        channel = await self.layer.new_channel()
+        await self.layer.group_add(group, channel)
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await self.layer.receive(channel)
+            await asyncio.sleep(self.network_delay())
+            cmd = message['cmd']
+            delay = cmd['at'] + self.ntp_offset - self.local_ms()
+            loop.call_later(max(delay, 0) / 1000, self.flip, cmd['at'])
+
+    def flip(self, at: int):
+        self.flips[at] = wall_ms()
+
+
+class Command(BaseCommand):
+    help = "Simulate many displays following the playlist clock and report how far apart they flip slides"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=500, help='Number of simulated displays')
+        parser.add_argument('--slots', type=int, default=5, help='Number of slot boundaries to measure')
+        parser.add_argument('--slot-duration', type=int, default=2, help='Seconds per playlist entry')
+        parser.add_argument('--clock-offset', type=float, default=5000,
+                            help='Maximum clock offset of a display in ms')
+        parser.add_argument('--latency', type=float, default=20, help='Mean one-way network latency in ms')
+        parser.add_argument('--ntp-samples', type=int, default=8, help='NTP exchanges per display')
+
+    def handle(self, *args, **options):
+        asyncio.run(self.simulate(options))
+
+    async def simulate(self, options):
+        layer = InMemoryChannelLayer(capacity=1000)
+        sent = []
+        group_send = layer.group_send
+
+        async def counting_group_send(group, message):
+            sent.append(message)
+            await group_send(group, message)
+        layer.group_send = counting_group_send
+
+        clock = PlaylistClock({
+            'playlist': 'simulation',
+            'version': 'simulation',
+            'epoch': now_ms(),
+            'entries': [{'duration': options['slot_duration']}] * 3,
+        })
+
+        class SimulationScheduler(PlaylistScheduler):
+            async def get_clock(self, slug: str):
+                return clock
+
+        displays = [SimulatedDisplay(layer, options['clock_offset'], options['latency'])
+                    for _ in range(options['clients'])]
+        await asyncio.gather(*(display.ntp_sync(options['ntp_samples']) for display in displays))
+        tasks = [asyncio.create_task(display.run('playlist_simulation')) for display in displays]
+        await asyncio.sleep(0.1)
+
+        scheduler = SimulationScheduler(channel_layer=layer)
+        publisher = asyncio.create_task(scheduler.publish('simulation'))
+        await asyncio.sleep(options['slots'] * options['slot_duration'] + scheduler.lead / 1000 + 0.5)
+        publisher.cancel()
+        for task in tasks:
+            task.cancel()
+
+        ntp_errors = sorted(abs(display.ntp_offset - display.clock_offset) for display in displays)
+        self.stdout.write(f'{len(displays)} displays, {len(sent)} messages sent for {len(sent)} slots, '
+                          f'NTP offset error p50 {statistics.median(ntp_errors):.2f} ms, '
+                          f'p99 {ntp_errors[int(len(ntp_errors) * 0.99)]:.2f} ms')
+        self.stdout.write(f'{"slot at":>15} {"flipped":>8} {"skew ms":>8} {"p50 err":>8} {"p99 err":>8}')
+        for message in sent:
+            at = message['cmd']['at']
+            flips = [display.flips[at] for display in displays if at in display.flips]
+            if not flips:
+                continue
+            errors = sorted(abs(flip - at) for flip in flips)
+            self.stdout.write(f'{at:>15} {len(flips):>8} {max(flips) - min(flips):>8.2f} '
+                              f'{statistics.median(errors):>8.2f} {errors[int(len(errors) * 0.99)]:>8.2f}')
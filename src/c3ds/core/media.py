@@ -0,0 +1,219 @@
+import io
+import logging
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from c3ds.core.models import Display, ImageFile, ImageVariant, Playlist, Schedule, VideoFile, VideoRendition
+from c3ds.core.reload import reload_coalescer
+from c3ds.core.storage import content_storage
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SAVE_OPTIONS = {
+    ImageVariant.Formats.AVIF: ('AVIF', {'quality': 60}),
+    ImageVariant.Formats.WEBP: ('WEBP', {'quality': 80, 'method': 4}),
+    ImageVariant.Formats.JPEG: ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+
+def image_formats() -> list[str]:
+    # AVIF needs a Pillow built with libavif
+    Image.init()
+    return [image_format for image_format, (pil_format, _options) in IMAGE_SAVE_OPTIONS.items()
+            if pil_format in Image.SAVE]
+
+
+def store_derivative(content: bytes, extension: str) -> tuple[str, str]:
+    # identical derivatives share one file
+    name = content_storage.save(f'derivative.{extension}', ContentFile(content))
+    return name, Path(name).stem
+
+
+def remove_unused_files(names: set[str]):
+    # the content addressed storage deduplicates across all media
+    used = set(ImageVariant.objects.filter(file__in=names).values_list('file', flat=True))
+    used.update(ImageFile.objects.filter(file__in=names).values_list('file', flat=True))
+    used.update(VideoFile.objects.filter(file__in=names).values_list('file', flat=True))
+    used.update(VideoRendition.objects.filter(file__in=names).values_list('file', flat=True))
+    used.update(VideoRendition.objects.filter(poster__in=names).values_list('poster', flat=True))
+    used.update(Schedule.objects.filter(file__in=names).values_list('file', flat=True))
+    for name in names - used:
+        content_storage.delete(name)
+
+
+def derivative_sizes(source_size: int, sizes: list[int]) -> list[int]:
+    # images are never scaled up, sizes above the source collapse into one variant of the source size
+    return sorted({min(size, source_size) for size in sizes}, reverse=True)
+
+
+def encode_image(image: Image.Image, image_format: str) -> bytes:
+    pil_format, options = IMAGE_SAVE_OPTIONS[image_format]
+    has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+    if image_format == ImageVariant.Formats.JPEG or not has_alpha:
+        image = image.convert('RGB')
+    else:
+        image = image.convert('RGBA')
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def needs_derivatives(media: ImageFile | VideoFile) -> bool:
+    derivatives = media.variants if isinstance(media, ImageFile) else media.renditions
+    return not derivatives.exists() or derivatives.exclude(source_name=media.file.name).exists()
+
+
+def generate_image_variants(image: ImageFile) -> list[ImageVariant]:
+    """
+    Generates the variants of an image for every configured width and supported format.
+    """
+    try:
+        with image.file.open('rb') as fp, Image.open(fp) as source:
+            source = ImageOps.exif_transpose(source)
+            variants = []
+            for width in derivative_sizes(source.width, settings.MEDIA_IMAGE_WIDTHS):
+                height = max(round(source.height * width / source.width), 1)
+                resized = source if width == source.width else source.resize((width, height), Image.Resampling.LANCZOS)
+                for image_format in image_formats():
+                    name, content_hash = store_derivative(encode_image(resized, image_format), image_format)
+                    variants.append(ImageVariant(
+                        image=image, format=image_format, file=name, width=width, height=height,
+                        content_hash=content_hash, size=content_storage.size(name), source_name=image.file.name,
+                    ))
+    except (UnidentifiedImageError, OSError):
+        logger.exception('Could not generate variants of image "%s"', image.name)
+        return []
+    replace_derivatives(image.variants, ImageVariant, variants)
+    return variants
+
+
+def run_ffmpeg(*args: str):
+    subprocess.run([settings.FFMPEG_BINARY, '-y', '-v', 'error', *args], check=True, capture_output=True)
+
+
+def generate_video_renditions(video: VideoFile) -> list[VideoRendition]:
+    """
+    Transcodes a video to H.264 in every configured height with a poster frame each, requires ffmpeg.
+    """
+    if shutil.which(settings.FFMPEG_BINARY) is None:
+        logger.warning('Not generating renditions of video "%s", ffmpeg is not installed', video.name)
+        return []
+    renditions = []
+    with tempfile.TemporaryDirectory() as directory, video.file.open('rb') as fp:
+        source = Path(directory) / 'source'
+        with source.open('wb') as target:
+            shutil.copyfileobj(fp, target)
+        try:
+            run_ffmpeg('-i', str(source), '-vf', 'thumbnail', '-frames:v', '1', f'{directory}/poster.png')
+            with Image.open(f'{directory}/poster.png') as poster:
+                poster.load()
+            for height in derivative_sizes(poster.height, settings.MEDIA_VIDEO_HEIGHTS):
+                # libx264 needs even dimensions
+                width = round(poster.width * height / poster.height / 2) * 2
+                output = Path(directory) / f'{height}.mp4'
+                run_ffmpeg('-i', str(source), '-vf', f'scale={width}:{height}', '-c:v', 'libx264', '-preset', 'medium',
+                           '-crf', '23', '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-b:a', '128k',
+                           '-movflags', '+faststart', str(output))
+                name, content_hash = store_derivative(output.read_bytes(), 'mp4')
+                poster_name, _poster_hash = store_derivative(
+                    encode_image(poster.resize((width, height), Image.Resampling.LANCZOS), ImageVariant.Formats.JPEG),
+                    'jpeg',
+                )
+                renditions.append(VideoRendition(
+                    video=video, file=name, poster=poster_name, width=width, height=height,
+                    content_hash=content_hash, size=output.stat().st_size, source_name=video.file.name,
+                ))
+        except (subprocess.CalledProcessError, UnidentifiedImageError, OSError) as e:
+            logger.error('Could not generate renditions of video "%s": %s', video.name,
+                         getattr(e, 'stderr', None) or e)
+            return []
+    replace_derivatives(video.renditions, VideoRendition, renditions)
+    return renditions
+
+
+def replace_derivatives(related_manager, model, derivatives: list):
+    with transaction.atomic():
+        old = list(related_manager.all())
+        related_manager.all().delete()
+        model.objects.bulk_create(derivatives)
+    names = {derivative.file.name for derivative in old}
+    names.update(derivative.poster.name for derivative in old if isinstance(derivative, VideoRendition))
+    remove_unused_files(names)
+
+
+def derivatives_updated(media: ImageFile | VideoFile):
+    """
+    Rerenders the pages and manifests showing the media, so the displays pick up the new derivatives.
+    """
+    if isinstance(media, ImageFile):
+        displays = Display.objects.filter(static_view__image_views__image=media)
+        playlists = Playlist.objects.filter(views__image_views__image=media)
+    else:
+        displays = Display.objects.filter(static_view__video_views__video=media)
+        playlists = Playlist.objects.filter(views__video_views__video=media)
+    displays.invalidate_page_cache()
+    playlists.invalidate_manifest()
+    reload_coalescer.add(displays.values_list('slug', flat=True))
+    reload_coalescer.add(Display.objects.filter(playlist__in=playlists).values_list('slug', flat=True))
+
+
+def generate_derivatives(media: ImageFile | VideoFile, force: bool = False) -> int:
+    """
+    Generates the derivatives of the media unless they are up to date, returns the number generated.
+    """
+    if not force and not needs_derivatives(media):
+        return 0
+    if isinstance(media, ImageFile):
+        derivatives = generate_image_variants(media)
+    else:
+        derivatives = generate_video_renditions(media)
+    if derivatives:
+        derivatives_updated(media)
+    return len(derivatives)
+
+
+class MediaPipeline:
+    """
+    Generates media derivatives in a pool of background threads, so uploads don't wait for the encoders.
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        self._workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._workers or settings.MEDIA_WORKERS,
+                                                    thread_name_prefix='media')
+            return self._executor
+
+    def submit(self, media: ImageFile | VideoFile):
+        # the worker must see the committed file
+        transaction.on_commit(partial(self.executor.submit, self.process, type(media), media.pk))
+
+    def process(self, model: type[ImageFile] | type[VideoFile], pk: int):
+        try:
+            media = model.objects.filter(pk=pk).first()
+            if media is not None:
+                generate_derivatives(media)
+        except Exception:
+            logger.exception('Generating derivatives of %s %d failed', model.__name__, pk)
+        finally:
+            connection.close()
+
+
+media_pipeline = MediaPipeline()
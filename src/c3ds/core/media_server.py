@@ -0,0 +1,248 @@
+import asyncio
+import mimetypes
+import os
+import stat
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+
+from c3ds.core.storage import HASHED_DIRECTORY
+
+CHUNK_SIZE = 256 * 1024
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: str, size: int) -> Optional[tuple[int, int]]:
+    """
+    Returns first and last byte of a single byte range, None if the whole file should be served.
+    """
+    unit, _, ranges = header.partition('=')
+    # a multipart response isn't worth it for media, ignoring the header and sending everything is allowed
+    if unit.strip().lower() != 'bytes' or ',' in ranges:
+        return None
+    first, separator, last = ranges.strip().partition('-')
+    if not separator:
+        return None
+    try:
+        if not first:
+            # suffix range, the last n bytes
+            length = int(last)
+            if length <= 0 or size == 0:
+                raise RangeNotSatisfiable
+            return max(size - length, 0), size - 1
+        first, last = int(first), int(last) if last else None
+    except ValueError:
+        return None
+    if last is not None and first > last:
+        return None
+    if first >= size:
+        raise RangeNotSatisfiable
+    return first, size - 1 if last is None else min(last, size - 1)
+
+
+def etag_matches(header: str, etag: str, weak: bool = True) -> bool:
+    tags = [tag.strip() for tag in header.split(',')]
+    if weak:
+        tags = [tag.removeprefix('W/') for tag in tags]
+    return '*' in tags or etag in tags
+
+
+def not_modified_since(header: str, mtime: float) -> bool:
+    try:
+        return int(mtime) <= parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+class MediaApp:
+    """
+    ASGI app serving MEDIA_ROOT with byte ranges for seeking in videos and a bounded number of concurrent streams.
+
+    Bodies are handed to the server with the zero-copy or path send extensions if it supports them, to nginx with
+    X-Accel-Redirect if MEDIA_ACCEL_REDIRECT is set, and read in chunks in a thread otherwise. Streams handed to
+    nginx don't count towards the bound, nginx limits those itself.
+    """
+
+    def __init__(self, root: Optional[Path] = None, max_streams: Optional[int] = None,
+                 queue_timeout: Optional[float] = None):
+        self.root = Path(root or settings.MEDIA_ROOT).resolve()
+        self.max_streams = max_streams or settings.MEDIA_MAX_STREAMS
+        self.queue_timeout = settings.MEDIA_QUEUE_TIMEOUT if queue_timeout is None else queue_timeout
+        self._streams: Optional[asyncio.Semaphore] = None
+
+    @property
+    def streams(self) -> asyncio.Semaphore:
+        if self._streams is None:
+            self._streams = asyncio.Semaphore(self.max_streams)
+        return self._streams
+
+    def resolve(self, url_path: str) -> Optional[Path]:
+        relative = url_path.removeprefix(settings.MEDIA_URL).lstrip('/')
+        # hidden files are uploads in progress
+        if not relative or any(part.startswith('.') for part in relative.split('/')):
+            return None
+        path = (self.root / relative).resolve()
+        return path if path.is_relative_to(self.root) else None
+
+    def get_headers(self, path: Path, stat_result: os.stat_result) -> dict[str, str]:
+        relative = path.relative_to(self.root)
+        # the content behind a hashed name never changes
+        immutable = relative.parts[0] == HASHED_DIRECTORY
+        content_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+        return {
+            'content-type': content_type,
+            'accept-ranges': 'bytes',
+            'etag': f'"{path.stem}"' if immutable else f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"',
+            'last-modified': formatdate(stat_result.st_mtime, usegmt=True),
+            'cache-control': IMMUTABLE_CACHE_CONTROL if immutable else 'no-cache',
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            raise ValueError(f'Unsupported scope type {scope["type"]}')
+        if scope['method'] not in ('GET', 'HEAD'):
+            await self.respond(send, 405, {'allow': 'GET, HEAD'})
+            return
+        path = self.resolve(scope['path'])
+        try:
+            stat_result = path.stat() if path is not None else None
+        except OSError:
+            stat_result = None
+        if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+            await self.respond(send, 404, {'content-type': 'text/plain'}, b'Not Found')
+            return
+
+        request_headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope['headers']}
+        headers = self.get_headers(path, stat_result)
+        if_none_match = request_headers.get('if-none-match')
+        if if_none_match is not None:
+            not_modified = etag_matches(if_none_match, headers['etag'])
+        else:
+            not_modified = 'if-modified-since' in request_headers and \
+                           not_modified_since(request_headers['if-modified-since'], stat_result.st_mtime)
+        if not_modified:
+            await self.respond(send, 304, {key: headers[key] for key in ('etag', 'last-modified', 'cache-control')})
+            return
+
+        if settings.MEDIA_ACCEL_REDIRECT:
+            # nginx handles ranges and streams the file itself
+            location = settings.MEDIA_ACCEL_REDIRECT.rstrip('/') + '/' + path.relative_to(self.root).as_posix()
+            await self.respond(send, 200, {**headers, 'x-accel-redirect': location})
+            return
+
+        size = stat_result.st_size
+        byte_range = None
+        if 'range' in request_headers and self.range_applies(request_headers.get('if-range'), headers):
+            try:
+                byte_range = parse_range(request_headers['range'], size)
+            except RangeNotSatisfiable:
+                await self.respond(send, 416, {'content-range': f'bytes */{size}'})
+                return
+        if byte_range is None:
+            status, first, length = 200, 0, size
+        else:
+            status, first, length = 206, byte_range[0], byte_range[1] - byte_range[0] + 1
+            headers['content-range'] = f'bytes {byte_range[0]}-{byte_range[1]}/{size}'
+        headers['content-length'] = str(length)
+        if scope['method'] == 'HEAD':
+            await self.respond(send, status, headers)
+            return
+
+        try:
+            await asyncio.wait_for(self.streams.acquire(), self.queue_timeout)
+        except TimeoutError:
+            await self.respond(send, 503, {'retry-after': '5', 'content-type': 'text/plain'}, b'Too many streams')
+            return
+        try:
+            await self.send_file(scope, receive, send, path, status, headers, first, length, size)
+        finally:
+            self.streams.release()
+
+    @staticmethod
+    def range_applies(if_range: Optional[str], headers: dict[str, str]) -> bool:
+        # a range of a file that changed since the client's copy would be garbage, so it gets the whole file
+        if if_range is None:
+            return True
+        if if_range.startswith(('"', 'W/')):
+            return etag_matches(if_range, headers['etag'], weak=False)
+        return if_range == headers['last-modified']
+
+    @staticmethod
+    async def respond(send, status: int, headers: dict[str, str], body: bytes = b''):
+        if body:
+            headers = {**headers, 'content-length': str(len(body))}
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(key.encode('latin-1'), value.encode('latin-1')) for key, value in headers.items()],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    @staticmethod
+    async def wait_for_disconnect(receive):
+        # the server reports the disconnect once the response is sent, a handed off body is only queued until then
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def send_file(self, scope, receive, send, path: Path, status: int, headers: dict[str, str],
+                        first: int, length: int, size: int):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(key.encode('latin-1'), value.encode('latin-1')) for key, value in headers.items()],
+        })
+        extensions = scope.get('extensions') or {}
+        with path.open('rb') as fp:
+            if 'http.response.zerocopysend' in extensions:
+                await send({'type': 'http.response.zerocopysend', 'file': fp, 'offset': first, 'count': length})
+                await self.wait_for_disconnect(receive)
+                return
+            if 'http.response.pathsend' in extensions and length == size:
+                await send({'type': 'http.response.pathsend', 'path': str(path)})
+                await self.wait_for_disconnect(receive)
+                return
+
+            disconnected = asyncio.Event()
+
+            async def watch_disconnect():
+                await self.wait_for_disconnect(receive)
+                disconnected.set()
+
+            watcher = asyncio.create_task(watch_disconnect())
+            loop = asyncio.get_running_loop()
+            try:
+                offset, remaining = first, length
+                while remaining > 0 and not disconnected.is_set():
+                    chunk = await loop.run_in_executor(None, os.pread, fp.fileno(), min(CHUNK_SIZE, remaining), offset)
+                    if not chunk:
+                        # the file was truncated, the client sees a short body
+                        break
+                    offset += len(chunk)
+                    remaining -= len(chunk)
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': remaining > 0})
+                if remaining > 0 and not disconnected.is_set():
+                    await send({'type': 'http.response.body', 'body': b''})
+            finally:
+                watcher.cancel()
+
+
+class MediaRouter:
+    """
+    Sends HTTP requests for MEDIA_URL to the media app, everything else to the wrapped app.
+    """
+
+    def __init__(self, app, media_app: Optional[MediaApp] = None):
+        self.app = app
+        self.media_app = media_app or MediaApp()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'].startswith(settings.MEDIA_URL):
+            await self.media_app(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
@@ -1,12 +1,22 @@
-import datetime
 from typing import Optional
 
 from django.apps import apps
-from django.core.cache import cache
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count
 from prometheus_client.core import GaugeMetricFamily, REGISTRY
 from prometheus_client.registry import Collector
 
 from c3ds.core.models import Display, BaseView, HTMLView, ImageView, VideoView, IFrameView, ScheduleView
+from c3ds.core.presence import presence_registry
+from c3ds.core.telemetry import telemetry_store
+
+VIEW_TYPES = {
+    'html': HTMLView,
+    'image': ImageView,
+    'video': VideoView,
+    'iframe': IFrameView,
+    'schedule': ScheduleView,
+}
 
 
 class CustomCollector(Collector):
@@ -16,23 +26,22 @@ class CustomCollector(Collector):
         if not apps.ready:
             return
 
-        now = datetime.datetime.now(tz=datetime.UTC)
         online = GaugeMetricFamily('display_online', 'Online status of displays',
                                    labels=['display_slug'])
         ntp_offset = GaugeMetricFamily('display_ntp_offset', 'NTP time offset of displays',
                                        labels=['display_slug'])
-        # ntp_latency = GaugeMetricFamily('display_ntp_latency',
-        #                                 'Latency between NTP Server and displays', labels=['display_slug'])
-        display_slugs = Display.objects.all().values_list('slug', flat=True)
+        # NTP latency and ping RTT are histograms without per display labels, see c3ds.core.instrumentation
+        display_slugs = list(Display.objects.all().values_list('slug', flat=True))
+        presences = presence_registry.get_online()
+        ntp_offsets = telemetry_store.get_ntp_offsets(display_slugs)
         displays_online = 0
         for slug in display_slugs:
-            last_heartbeat: Optional[datetime.datetime] = cache.get(Display.heartbeat_cache_key_for_slug(slug))
-            is_online = last_heartbeat is not None and (now - last_heartbeat).total_seconds() < 60
+            is_online = slug in presences
             if is_online:
                 displays_online += 1
             online.add_metric([slug], 1 if is_online else 0)
 
-            display_ntp_offset: Optional[float] = cache.get(Display.ntp_offset_cache_key_for_slug(slug))
+            display_ntp_offset: Optional[float] = ntp_offsets.get(slug)
             if display_ntp_offset is not None:
                 ntp_offset.add_metric([slug], display_ntp_offset)
         yield online
@@ -42,15 +51,14 @@ class CustomCollector(Collector):
         yield GaugeMetricFamily('number_of_displays_online', 'Number of displays currently online',
                                 value=displays_online)
 
+        # count all view types in a single grouped query instead of one COUNT(*) per type
+        counts = dict(BaseView.objects.order_by().values_list('content_type').annotate(count=Count('pk')))
         view_count = GaugeMetricFamily('number_of_views', 'Number of views configured',
                                        labels=['type'])
-        view_count.add_metric(['html'], HTMLView.objects.all().count())
-        view_count.add_metric(['image'], ImageView.objects.all().count())
-        view_count.add_metric(['video'], VideoView.objects.all().count())
-        view_count.add_metric(['iframe'], IFrameView.objects.all().count())
-        view_count.add_metric(['schedule'], ScheduleView.objects.all().count())
+        for label, model in VIEW_TYPES.items():
+            view_count.add_metric([label], counts.get(ContentType.objects.get_for_model(model).pk, 0))
         yield view_count
         yield GaugeMetricFamily('number_of_views_total', 'Number of views configured',
-                                value=BaseView.objects.all().count())
+                                value=sum(counts.values()))
 
 REGISTRY.register(CustomCollector())
\ No newline at end of file
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.3 on 2026-10-18 20:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+VIEW_MODELS = ('htmlview', 'iframeview', 'imageview', 'videoview', 'scheduleview')
+
+
+def backfill_content_types(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    BaseView = apps.get_model('core', 'BaseView')
+    for model_name in VIEW_MODELS:
+        content_type, _created = ContentType.objects.get_or_create(app_label='core', model=model_name)
+        view_model = apps.get_model('core', model_name)
+        BaseView.objects.filter(pk__in=view_model.objects.values('pk')).update(content_type=content_type)
+    base_content_type, _created = ContentType.objects.get_or_create(app_label='core', model='baseview')
+    BaseView.objects.filter(content_type__isnull=True).update(content_type=base_content_type)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('core', '0002_schedule_scheduleview'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='baseview',
+            name='content_type',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='contenttypes.contenttype', verbose_name='View Type'),
+        ),
+        migrations.RunPython(backfill_content_types, migrations.RunPython.noop),
+    ]
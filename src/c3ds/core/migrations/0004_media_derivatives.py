@@ -0,0 +1,64 @@
+# Generated by Django 5.1.3 on 2026-10-18 21:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_baseview_content_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='display',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, help_text='Screen width in pixels, used to pick the image and video size', null=True, verbose_name='Width'),
+        ),
+        migrations.AddField(
+            model_name='display',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, help_text='Screen height in pixels, used to pick the image and video size', null=True, verbose_name='Height'),
+        ),
+        migrations.CreateModel(
+            name='ImageVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(upload_to='derivatives/')),
+                ('source_name', models.CharField(max_length=256, verbose_name='Source File')),
+                ('width', models.PositiveIntegerField(verbose_name='Width')),
+                ('height', models.PositiveIntegerField(verbose_name='Height')),
+                ('content_hash', models.CharField(help_text='SHA-256', max_length=64, verbose_name='Content Hash')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Size')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('format', models.CharField(choices=[('avif', 'AVIF'), ('webp', 'WebP'), ('jpeg', 'JPEG')], max_length=8, verbose_name='Format')),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='core.imagefile', verbose_name='Image')),
+            ],
+            options={
+                'verbose_name': 'Image Variant',
+                'verbose_name_plural': 'Image Variants',
+                'ordering': ['image', 'width', 'format'],
+            },
+        ),
+        migrations.CreateModel(
+            name='VideoRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(upload_to='derivatives/')),
+                ('source_name', models.CharField(max_length=256, verbose_name='Source File')),
+                ('width', models.PositiveIntegerField(verbose_name='Width')),
+                ('height', models.PositiveIntegerField(verbose_name='Height')),
+                ('content_hash', models.CharField(help_text='SHA-256', max_length=64, verbose_name='Content Hash')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Size')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('poster', models.FileField(upload_to='derivatives/', verbose_name='Poster')),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='core.videofile', verbose_name='Video')),
+            ],
+            options={
+                'verbose_name': 'Video Rendition',
+                'verbose_name_plural': 'Video Renditions',
+                'ordering': ['video', 'height'],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.3 on 2026-10-18 22:15
+
+import c3ds.core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_media_derivatives'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mediafile',
+            name='file',
+            field=models.FileField(storage=c3ds.core.storage.get_content_storage, upload_to=''),
+        ),
+        migrations.AlterField(
+            model_name='imagevariant',
+            name='file',
+            field=models.FileField(storage=c3ds.core.storage.get_content_storage, upload_to=''),
+        ),
+        migrations.AlterField(
+            model_name='videorendition',
+            name='file',
+            field=models.FileField(storage=c3ds.core.storage.get_content_storage, upload_to=''),
+        ),
+        migrations.AlterField(
+            model_name='videorendition',
+            name='poster',
+            field=models.FileField(storage=c3ds.core.storage.get_content_storage, upload_to='', verbose_name='Poster'),
+        ),
+        migrations.AlterField(
+            model_name='schedule',
+            name='file',
+            field=models.FileField(blank=True, null=True, storage=c3ds.core.storage.get_content_storage, upload_to='', verbose_name='File'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 23:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='display',
+            name='tags',
+            field=models.CharField(blank=True, help_text='Semicolon-separated list like floor or building, commands can target a tag', max_length=256, null=True, verbose_name='Tags'),
+        ),
+    ]
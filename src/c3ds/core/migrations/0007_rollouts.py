@@ -0,0 +1,47 @@
+# Generated by Django 5.1.3 on 2026-10-18 23:40
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_display_tags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Rollout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uuid', models.UUIDField(default=uuid.uuid4, editable=False, unique=True, verbose_name='Rollout UUID')),
+                ('description', models.CharField(blank=True, max_length=256, verbose_name='Description')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+            ],
+            options={
+                'verbose_name': 'Rollout',
+                'verbose_name_plural': 'Rollouts',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RolloutTarget',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sent_at', models.DateTimeField(verbose_name='Sent At')),
+                ('expected_at', models.DateTimeField(help_text='When the display reloads, after its slot in the reload window', verbose_name='Expected At')),
+                ('acked_at', models.DateTimeField(blank=True, null=True, verbose_name='Acknowledged At')),
+                ('attempts', models.PositiveSmallIntegerField(default=1, verbose_name='Attempts')),
+                ('display', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollout_targets', to='core.display')),
+                ('rollout', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='targets', to='core.rollout')),
+            ],
+            options={
+                'verbose_name': 'Rollout Target',
+                'verbose_name_plural': 'Rollout Targets',
+                'ordering': ['display__name'],
+                'constraints': [models.UniqueConstraint(fields=('rollout', 'display'), name='unique_rollout_display')],
+            },
+        ),
+    ]
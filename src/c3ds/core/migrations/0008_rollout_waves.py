@@ -0,0 +1,48 @@
+# Generated by Django 5.1.3 on 2026-10-19 01:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_rollouts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rollout',
+            name='status',
+            field=models.CharField(choices=[('sent', 'Sent'), ('running', 'Running in waves'), ('halted', 'Halted')], default='sent', max_length=16, verbose_name='Status'),
+        ),
+        migrations.AddField(
+            model_name='rollout',
+            name='wave',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Current Wave'),
+        ),
+        migrations.AddField(
+            model_name='rollout',
+            name='wave_count',
+            field=models.PositiveSmallIntegerField(default=1, verbose_name='Waves'),
+        ),
+        migrations.AddField(
+            model_name='rollout',
+            name='wave_started_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Wave Started At'),
+        ),
+        migrations.AddField(
+            model_name='rollouttarget',
+            name='wave',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Wave'),
+        ),
+        migrations.AlterField(
+            model_name='rollouttarget',
+            name='expected_at',
+            field=models.DateTimeField(blank=True, help_text='When the display reloads, after its slot in the reload window', null=True, verbose_name='Expected At'),
+        ),
+        migrations.AlterField(
+            model_name='rollouttarget',
+            name='sent_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Sent At'),
+        ),
+    ]
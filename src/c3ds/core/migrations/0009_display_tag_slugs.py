@@ -0,0 +1,30 @@
+# Generated by Django 5.1.3 on 2026-10-19 09:30
+
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def fill_tag_slugs(apps, schema_editor):
+    Display = apps.get_model('core', 'Display')
+    displays = list(Display.objects.exclude(tags=None).exclude(tags=''))
+    for display in displays:
+        tags = [tag.strip() for tag in display.tags.split(';') if tag.strip()]
+        slugs = list(dict.fromkeys(filter(None, (slugify(tag)[:90] for tag in tags))))
+        display.tag_slugs = f';{";".join(slugs)};' if slugs else ''
+    Display.objects.bulk_update(displays, ['tag_slugs'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_rollout_waves'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='display',
+            name='tag_slugs',
+            field=models.CharField(blank=True, default='', editable=False, max_length=512, verbose_name='Tag Slugs'),
+        ),
+        migrations.RunPython(fill_tag_slugs, migrations.RunPython.noop),
+    ]
@@ -1,32 +1,57 @@
 import datetime
+import hashlib
+import json
 import logging
+import math
+import mimetypes
+import os
+import shutil
+import tempfile
 import uuid
+from collections import defaultdict
 from contextlib import suppress
+from functools import partial
 from pathlib import Path
-from typing import Optional, Self, Any
+from typing import Any, Iterable, Optional, Self
 
-import channels.layers
 import requests
-from asgiref.sync import async_to_sync
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist, ImproperlyConfigured
 from django.db import models, transaction
-from django.db.models import Q
+from django.db.models import Count, Q
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from c3ds.core.enums import DisplayCommands
+from c3ds.core.groups import tag_slug
+from c3ds.core.reload import CLIENT_RELOAD_WINDOW, get_build_fingerprint, reload_delays, reload_slugs, send_commands
+from c3ds.core.schedule_index import schedule_indexes
+from c3ds.core.schedule_slices import INDEX_FILE, diff_slices, filter_delta, read_slice, write_slices
+from c3ds.core.storage import HASHED_DIRECTORY, get_content_storage
+from c3ds.utils.json_stream import JSONPathScanner
 
 logger = logging.getLogger(__name__)
-channel_layer = channels.layers.get_channel_layer()
 
 
 class DisplayQuerySet(models.QuerySet):
-    def reload(self, delayed: Optional[bool] = None):
-        slugs = self.values_list('slug', flat=True)
-        if delayed is None:
-            delayed = delayed = len(slugs) >= settings.DELAYED_RELOAD_THRESHOLD
-        for slug in slugs:
-            self.model.reload_by_slug(slug, delayed)
+    def reload(self, delayed: Optional[bool] = None, spread: Optional[float] = None, description: str = '') -> int:
+        return Rollout.start(self, description, delayed, spread).targets.count()
+
+    def invalidate_page_cache(self):
+        cache.delete_many([self.model.page_cache_key_for_slug(slug) for slug in self.values_list('slug', flat=True)])
+
+    def in_groups(self, tags: Iterable[str] = (), playlist_slugs: Iterable[str] = ()) -> Self:
+        """
+        Displays in the group of one of the tags or playlists, tags are compared by the slug of their group.
+        """
+        condition = Q(playlist__slug__in=list(playlist_slugs))
+        for slug in filter(None, map(tag_slug, tags)):
+            condition |= Q(tag_slugs__contains=f';{slug};')
+        return self.filter(condition)
 
 
 class Display(models.Model):
@@ -35,11 +60,24 @@ class Display(models.Model):
     uuid = models.UUIDField(verbose_name=_('Display UUID'), default=uuid.uuid4, editable=False, unique=True)
     static_view = models.ForeignKey('BaseView', on_delete=models.PROTECT, verbose_name=_('Static View'), null=True, blank=True)
     playlist = models.ForeignKey('Playlist', on_delete=models.PROTECT, verbose_name=_('Playlist'), null=True, blank=True)
+    width = models.PositiveIntegerField(verbose_name=_('Width'), null=True, blank=True,
+                                        help_text=_('Screen width in pixels, used to pick the image and video size'))
+    height = models.PositiveIntegerField(verbose_name=_('Height'), null=True, blank=True,
+                                         help_text=_('Screen height in pixels, used to pick the image and video size'))
+    tags = models.CharField(max_length=256, verbose_name=_('Tags'), blank=True, null=True,
+                            help_text=_('Semicolon-separated list like floor or building, commands can target a tag'))
+    # slugs of the tag groups the display joins as ";slug;slug;", so displays with a tag are found in SQL
+    tag_slugs = models.CharField(max_length=512, verbose_name=_('Tag Slugs'), editable=False, blank=True, default='')
     last_changed = models.DateTimeField(verbose_name=_('Last Changed'), auto_now=True)
     created_at = models.DateTimeField(verbose_name=_('Created At'), auto_now_add=True)
 
     objects = DisplayQuerySet.as_manager()
 
+    # fields rendered into the display page, saving a display without changing them does not reload it
+    reload_fields = ('name', 'slug', 'static_view_id', 'playlist_id', 'width', 'height', 'tags')
+    # fields that decide the channel groups of the display connections
+    group_fields = ('playlist_id', 'tags')
+
     class Meta:
         verbose_name = _('Display')
         verbose_name_plural = _('Displays')
@@ -55,25 +93,69 @@ class Display(models.Model):
     def __str__(self):
         return self.name
 
+    @staticmethod
+    def parse_tags(tags: Optional[str]) -> list[str]:
+        return [tag.strip() for tag in (tags or '').split(';') if tag.strip()]
+
+    def get_tags(self) -> list[str]:
+        return self.parse_tags(self.tags)
+
+    @staticmethod
+    def format_tag_slugs(tags: Iterable[str]) -> str:
+        slugs = list(dict.fromkeys(filter(None, map(tag_slug, tags))))
+        return f';{";".join(slugs)};' if slugs else ''
+
+    def save(self, *args, **kwargs):
+        self.tag_slugs = self.format_tag_slugs(self.get_tags())
+        if kwargs.get('update_fields') is not None and 'tags' in kwargs['update_fields']:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'tag_slugs'}
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def default_resolution() -> tuple[int, int]:
+        return settings.DISPLAY_DEFAULT_WIDTH, settings.DISPLAY_DEFAULT_HEIGHT
+
+    def get_resolution(self) -> tuple[int, int]:
+        default_width, default_height = self.default_resolution()
+        return self.width or default_width, self.height or default_height
+
     @classmethod
-    async def async_reload_by_slug(cls, slug: str, delayed: bool = False):
-        await channel_layer.group_send(f'display_{slug}', {
-            'type': 'cmd',
-            'cmd': {
-                'cmd': DisplayCommands.RELOAD,
-                'delayed': delayed,
-            }
-        })
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {field: getattr(instance, field) for field in cls.reload_fields
+                                   if field in instance.__dict__}
+        return instance
+
+    def needs_reload(self) -> bool:
+        loaded_values = getattr(self, '_loaded_values', None)
+        if loaded_values is None:
+            return True
+        return any(getattr(self, field) != value for field, value in loaded_values.items())
+
+    def needs_regroup(self) -> bool:
+        loaded_values = getattr(self, '_loaded_values', None)
+        if loaded_values is None:
+            return False
+        return any(getattr(self, field) != loaded_values[field] for field in self.group_fields
+                   if field in loaded_values)
+
+    def mark_reloaded(self):
+        self._loaded_values = {field: getattr(self, field) for field in self.reload_fields}
 
     @classmethod
-    def reload_by_slug(cls, slug: str, delayed: bool = False):
-        async_to_sync(cls.async_reload_by_slug)(slug, delayed)
+    def reload_by_slug(cls, slug: str, delayed: bool = False, description: str = '') -> 'Rollout':
+        # a rollout of one display, so the reload is acknowledged like any other
+        return Rollout.start(cls.objects.filter(slug=slug), description, delayed)
 
-    async def async_reload(self, delayed: bool = False):
-        await self.async_reload_by_slug(self.slug)
+    @classmethod
+    async def async_reload_by_slug(cls, slug: str, delayed: bool = False, description: str = '') -> 'Rollout':
+        return await sync_to_async(cls.reload_by_slug)(slug, delayed, description)
 
-    def reload(self, delayed: bool = False):
-        async_to_sync(self.async_reload)(delayed)
+    async def async_reload(self, delayed: bool = False, description: str = '') -> 'Rollout':
+        return await self.async_reload_by_slug(self.slug, delayed, description)
+
+    def reload(self, delayed: bool = False, description: str = '') -> 'Rollout':
+        return self.reload_by_slug(self.slug, delayed, description)
 
     @staticmethod
     def heartbeat_cache_key_for_slug(slug: str) -> str:
@@ -87,13 +169,204 @@ class Display(models.Model):
         return f'{slug}-ntp-offset'
 
     def get_ntp_offset_cache_key(self):
-        return self.heartbeat_cache_key_for_slug(self.slug)
+        return self.ntp_offset_cache_key_for_slug(self.slug)
+
+    @staticmethod
+    def page_cache_key_for_slug(slug: str) -> str:
+        # pages rendered for another build reference scripts that are gone
+        return f'{slug}-page-{get_build_fingerprint()}'
+
+    def get_page_cache_key(self):
+        return self.page_cache_key_for_slug(self.slug)
+
+    @staticmethod
+    def prefetch_cache_key_for_slug(slug: str) -> str:
+        return f'{slug}-prefetch'
+
+    @staticmethod
+    def history_cache_key_for_slug(slug: str) -> str:
+        return f'{slug}-history'
+
+    def get_asset_manifest(self, static_view: Optional['BaseView'] = None,
+                           playlist: Optional['Playlist'] = None) -> dict[str, Any]:
+        """
+        Media of the content of the display in the order it is shown, or of the content it is about to switch to.
+        """
+        if static_view is None and playlist is None:
+            static_view, playlist = self.static_view, self.playlist
+        if playlist is not None:
+            view_ids = list(playlist.entries.order_by('order', 'pk').values_list('view_id', flat=True))
+        else:
+            view_ids = [static_view.pk]
+        views = {view.pk: view for view in BaseView.objects.filter(pk__in=view_ids).specific()}
+        assets = {}
+        for view_id in view_ids:
+            for asset in views[view_id].get_assets(self.get_resolution()):
+                assets.setdefault(asset['url'], asset)
+        assets = list(assets.values())
+        version = hashlib.md5(json.dumps(assets, sort_keys=True).encode(), usedforsecurity=False)
+        return {
+            'display': self.slug,
+            'version': version.hexdigest(),
+            'size': sum(asset['size'] or 0 for asset in assets),
+            'assets': assets,
+        }
+
+    def invalidate_page_cache(self):
+        cache.delete(self.get_page_cache_key())
+
+
+class RolloutQuerySet(models.QuerySet):
+    def with_progress(self) -> Self:
+        deadline = timezone.now() - datetime.timedelta(seconds=settings.ROLLOUT_ACK_TIMEOUT)
+        return self.annotate(
+            target_count=Count('targets'),
+            acked_count=Count('targets__acked_at'),
+            straggler_count=Count('targets', filter=Q(targets__acked_at=None, targets__expected_at__lt=deadline)),
+        )
+
+
+class Rollout(models.Model):
+    """
+    A reload of a set of displays, every display acknowledges it once it loaded again. Content updates are rolled out
+    in waves, see c3ds.core.rollout.
+    """
+    class Status(models.TextChoices):
+        SENT = 'sent', _('Sent')
+        RUNNING = 'running', _('Running in waves')
+        HALTED = 'halted', _('Halted')
+
+    uuid = models.UUIDField(verbose_name=_('Rollout UUID'), default=uuid.uuid4, editable=False, unique=True)
+    description = models.CharField(max_length=256, verbose_name=_('Description'), blank=True)
+    status = models.CharField(max_length=16, choices=Status, default=Status.SENT, verbose_name=_('Status'))
+    wave = models.PositiveSmallIntegerField(verbose_name=_('Current Wave'), default=0)
+    wave_count = models.PositiveSmallIntegerField(verbose_name=_('Waves'), default=1)
+    wave_started_at = models.DateTimeField(verbose_name=_('Wave Started At'), null=True, blank=True)
+    created_at = models.DateTimeField(verbose_name=_('Created At'), auto_now_add=True)
+
+    objects = RolloutQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _('Rollout')
+        verbose_name_plural = _('Rollouts')
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'{self.description or _("Reload")} ({timezone.localtime(self.created_at):%Y-%m-%d %H:%M:%S})'
+
+    @classmethod
+    def create_for(cls, displays: DisplayQuerySet, delays: Optional[dict[str, int]] = None,
+                   description: str = '') -> Self:
+        """
+        Creates the rollout and its targets, delays are the reload delays in ms per slug (None if the displays pick
+        their own).
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            rollout = cls.objects.create(description=description)
+            RolloutTarget.objects.bulk_create(
+                RolloutTarget(rollout=rollout, display_id=pk, sent_at=now, expected_at=now + datetime.timedelta(
+                    milliseconds=delays[slug] if delays is not None else CLIENT_RELOAD_WINDOW * 1000))
+                for slug, pk in displays.order_by().values_list('slug', 'pk').distinct()
+            )
+        return rollout
+
+    @classmethod
+    def start(cls, displays: DisplayQuerySet, description: str = '', delayed: Optional[bool] = None,
+              spread: Optional[float] = None) -> Self:
+        delays = reload_delays(displays.order_by().values_list('slug', flat=True).distinct(), delayed, spread)
+        rollout = cls.create_for(displays, delays, description)
+        reload_slugs(delays, delayed, spread, rollout=str(rollout.uuid))
+        return rollout
+
+    def get_stragglers(self) -> models.QuerySet['RolloutTarget']:
+        """
+        Targets that didn't acknowledge within ROLLOUT_ACK_TIMEOUT seconds after their slot in the reload window.
+        """
+        deadline = timezone.now() - datetime.timedelta(seconds=settings.ROLLOUT_ACK_TIMEOUT)
+        return self.targets.filter(acked_at=None, expected_at__lt=deadline)
+
+    def retry_stragglers(self, delayed: Optional[bool] = None, spread: Optional[float] = None) -> int:
+        """
+        Sends the reload command again to the stragglers only, returns their number.
+        """
+        stragglers = {target.display.slug: target for target in self.get_stragglers().select_related('display')}
+        delays = reload_delays(stragglers, delayed, spread)
+        now = timezone.now()
+        for slug, delay in delays.items():
+            target = stragglers[slug]
+            target.sent_at = now
+            target.expected_at = now + datetime.timedelta(milliseconds=delay)
+            target.attempts += 1
+        RolloutTarget.objects.bulk_update(stragglers.values(), ['sent_at', 'expected_at', 'attempts'])
+        return reload_slugs(delays, delayed, spread, rollout=str(self.uuid))
+
+    def get_progress(self) -> dict[str, Any]:
+        deadline = timezone.now() - datetime.timedelta(seconds=settings.ROLLOUT_ACK_TIMEOUT)
+        progress = self.targets.aggregate(
+            total=Count('pk'),
+            acked=Count('acked_at'),
+            stragglers=Count('pk', filter=Q(acked_at=None, expected_at__lt=deadline)),
+        )
+        latencies = sorted(max((acked_at - expected_at).total_seconds(), 0) for expected_at, acked_at
+                           in self.targets.exclude(acked_at=None).values_list('expected_at', 'acked_at'))
+        progress['latency'] = {
+            'p50': latencies[len(latencies) // 2],
+            'p90': latencies[int(len(latencies) * 0.9)],
+            'max': latencies[-1],
+        } if latencies else None
+        return progress
+
+
+class RolloutTarget(models.Model):
+    rollout = models.ForeignKey(Rollout, on_delete=models.CASCADE, related_name='targets')
+    display = models.ForeignKey(Display, on_delete=models.CASCADE, related_name='rollout_targets')
+    wave = models.PositiveSmallIntegerField(verbose_name=_('Wave'), default=0)
+    # targets of later waves are sent nothing yet
+    sent_at = models.DateTimeField(verbose_name=_('Sent At'), null=True, blank=True)
+    expected_at = models.DateTimeField(verbose_name=_('Expected At'), null=True, blank=True,
+                                       help_text=_('When the display reloads, after its slot in the reload window'))
+    acked_at = models.DateTimeField(verbose_name=_('Acknowledged At'), null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(verbose_name=_('Attempts'), default=1)
+
+    class Meta:
+        verbose_name = _('Rollout Target')
+        verbose_name_plural = _('Rollout Targets')
+        ordering = ['display__name']
+        constraints = [
+            models.UniqueConstraint(fields=('rollout', 'display'), name='unique_rollout_display'),
+        ]
+
+    def __str__(self):
+        return str(self.display)
+
+    @property
+    def latency(self) -> Optional[float]:
+        """
+        Seconds from the slot of the display in the reload window until it acknowledged.
+        """
+        if self.acked_at is None:
+            return None
+        return max((self.acked_at - self.expected_at).total_seconds(), 0)
+
+
+def get_file_asset(file: FieldFile) -> dict[str, Any]:
+    size = None
+    with suppress(FileNotFoundError):
+        size = file.size
+    return {
+        'url': file.url,
+        'mime': mimetypes.guess_type(file.name)[0],
+        'size': size,
+        # files uploaded before the content addressed storage have no hash in their name
+        'hash': Path(file.name).stem if file.name.startswith(f'{HASHED_DIRECTORY}/') else None,
+    }
 
 
 class MediaFile(models.Model):
     name = models.CharField(max_length=128, verbose_name=_('Name'))
     filename = models.CharField(max_length=128, verbose_name=_('Filename'))
-    file = models.FileField(upload_to="uploads/%Y/%m/%d/")
+    file = models.FileField(storage=get_content_storage)
     last_changed = models.DateTimeField(verbose_name=_('Last Changed'), auto_now=True)
     created_at = models.DateTimeField(verbose_name=_('Created At'), auto_now_add=True)
 
@@ -104,6 +377,9 @@ class MediaFile(models.Model):
     def __str__(self):
         return self.name
 
+    def get_asset(self) -> dict[str, Any]:
+        return get_file_asset(self.file)
+
 class ImageFile(MediaFile):
 
     display_duration = models.PositiveIntegerField(verbose_name=_('Display Duration'), default=6,
@@ -112,6 +388,25 @@ class ImageFile(MediaFile):
         verbose_name = _('Image')
         verbose_name_plural = _('Images')
 
+    def get_variants(self, resolution: tuple[int, int]) -> dict[str, 'ImageVariant']:
+        """
+        Returns the smallest variant per format that fills the given resolution, or the largest one if none does.
+        """
+        variants = sorted(self.variants.all(), key=lambda variant: variant.width)
+        if not variants:
+            return {}
+        # the image is scaled to fit the screen, so a portrait image needs less than the full screen width
+        width = min(resolution[0], math.ceil(variants[0].width * resolution[1] / variants[0].height))
+        selected = {}
+        for variant in variants:
+            if variant.format not in selected or selected[variant.format].width < width:
+                selected[variant.format] = variant
+        return selected
+
+    def get_url(self, resolution: Optional[tuple[int, int]] = None) -> str:
+        variant = self.get_variants(resolution or Display.default_resolution()).get(ImageVariant.Formats.JPEG)
+        return variant.file.url if variant is not None else self.file.url
+
 
 class VideoFile(MediaFile):
 
@@ -121,6 +416,71 @@ class VideoFile(MediaFile):
         verbose_name = _('Video')
         verbose_name_plural = _('Videos')
 
+    def get_rendition(self, resolution: tuple[int, int]) -> Optional['VideoRendition']:
+        """
+        Returns the smallest rendition at least as high as the given resolution, or the largest one if none is.
+        """
+        selected = None
+        for rendition in sorted(self.renditions.all(), key=lambda rendition: rendition.height):
+            if selected is None or selected.height < resolution[1]:
+                selected = rendition
+        return selected
+
+
+class MediaDerivative(models.Model):
+    file = models.FileField(storage=get_content_storage)
+    # derivatives of a replaced file are generated again
+    source_name = models.CharField(max_length=256, verbose_name=_('Source File'))
+    width = models.PositiveIntegerField(verbose_name=_('Width'))
+    height = models.PositiveIntegerField(verbose_name=_('Height'))
+    content_hash = models.CharField(max_length=64, verbose_name=_('Content Hash'), help_text=_('SHA-256'))
+    size = models.PositiveBigIntegerField(verbose_name=_('Size'))
+    created_at = models.DateTimeField(verbose_name=_('Created At'), auto_now_add=True)
+
+    class Meta:
+        abstract = True
+
+    def get_asset(self) -> dict[str, Any]:
+        return {'url': self.file.url, 'mime': 'video/mp4', 'size': self.size, 'hash': self.content_hash}
+
+
+class ImageVariant(MediaDerivative):
+    class Formats(models.TextChoices):
+        AVIF = 'avif', 'AVIF'
+        WEBP = 'webp', 'WebP'
+        JPEG = 'jpeg', 'JPEG'
+
+    image = models.ForeignKey(ImageFile, on_delete=models.CASCADE, verbose_name=_('Image'), related_name='variants')
+    format = models.CharField(max_length=8, verbose_name=_('Format'), choices=Formats)
+
+    class Meta:
+        verbose_name = _('Image Variant')
+        verbose_name_plural = _('Image Variants')
+        ordering = ['image', 'width', 'format']
+
+    @property
+    def mime_type(self) -> str:
+        return f'image/{self.format}'
+
+    def get_asset(self) -> dict[str, Any]:
+        return {**super().get_asset(), 'mime': self.mime_type}
+
+
+class VideoRendition(MediaDerivative):
+    video = models.ForeignKey(VideoFile, on_delete=models.CASCADE, verbose_name=_('Video'), related_name='renditions')
+    poster = models.FileField(storage=get_content_storage, verbose_name=_('Poster'))
+
+    class Meta:
+        verbose_name = _('Video Rendition')
+        verbose_name_plural = _('Video Renditions')
+        ordering = ['video', 'height']
+
+
+class PlaylistQuerySet(models.QuerySet):
+    def invalidate_manifest(self):
+        cache.delete_many([self.model.manifest_cache_key_for_slug(slug)
+                           for slug in self.values_list('slug', flat=True)])
+
 
 class Playlist(models.Model):
     name = models.CharField(max_length=128, verbose_name=_('Name'))
@@ -131,9 +491,66 @@ class Playlist(models.Model):
     last_changed = models.DateTimeField(verbose_name=_('Last Changed'), auto_now=True)
     created_at = models.DateTimeField(verbose_name=_('Created At'), auto_now_add=True)
 
+    objects = PlaylistQuerySet.as_manager()
+
     class Meta:
         ordering = ["name"]
 
+    def __str__(self):
+        return self.name
+
+    @staticmethod
+    def manifest_cache_key_for_slug(slug: str) -> str:
+        return f'playlist-{slug}-manifest'
+
+    def get_manifest_cache_key(self):
+        return self.manifest_cache_key_for_slug(self.slug)
+
+    def invalidate_manifest(self):
+        cache.delete(self.get_manifest_cache_key())
+
+    def get_manifest(self) -> dict[str, Any]:
+        manifest = cache.get(self.get_manifest_cache_key())
+        if manifest is None:
+            manifest = self.build_manifest()
+            cache.set(self.get_manifest_cache_key(), manifest, None)
+        return manifest
+
+    def build_manifest(self) -> dict[str, Any]:
+        entries = list(self.entries.order_by('order', 'pk'))
+        views = {view.pk: view for view in BaseView.objects.filter(pk__in={entry.view_id for entry in entries})
+                 .specific()}
+        manifest_entries = []
+        for entry in entries:
+            view = views[entry.view_id]
+            duration = view.get_playlist_duration(entry.display_duration)
+            manifest_entries.append({
+                'id': entry.pk,
+                'view': view.pk,
+                'slug': view.slug,
+                'type': view._meta.model_name,
+                'url': view.get_absolute_url(),
+                'template': view.get_template_name(),
+                'vue_module': view.get_vue_module(),
+                'layout_mode': view.layout_mode,
+                'duration': duration,
+                'until_ended': duration is None,
+                'assets': view.get_assets(),
+                'changed': view.last_changed.isoformat(),
+            })
+        clock = {
+            # start of the synchronized playlist clock, server time in ms, the same for every rebuild and worker
+            'epoch': int(self.created_at.timestamp() * 1000),
+            'default_duration': settings.PLAYLIST_DEFAULT_DURATION,
+        }
+        version = hashlib.md5(json.dumps([clock, manifest_entries], sort_keys=True).encode(), usedforsecurity=False)
+        return {
+            'playlist': self.slug,
+            'version': version.hexdigest(),
+            **clock,
+            'entries': manifest_entries,
+        }
+
 
 class PlaylistEntry(models.Model):
     playlist = models.ForeignKey(Playlist, on_delete=models.CASCADE, verbose_name=_('Playlist'), related_name='entries')
@@ -146,10 +563,40 @@ class PlaylistEntry(models.Model):
     )
 
 
+class BaseViewQuerySet(models.QuerySet):
+    def specific(self) -> list['BaseView']:
+        """
+        Resolves the views to instances of their concrete subclasses with one query per view type.
+        """
+        views = list(self)
+        pks_by_type = defaultdict(list)
+        for view in views:
+            pks_by_type[view.content_type_id].append(view.pk)
+
+        resolved = {}
+        for content_type_id, pks in pks_by_type.items():
+            model = ContentType.objects.get_for_id(content_type_id).model_class() if content_type_id else None
+            if model is None or model is self.model:
+                continue
+            queryset = model._base_manager.filter(pk__in=pks)
+            if model.specific_select_related:
+                queryset = queryset.select_related(*model.specific_select_related)
+            if model.specific_prefetch_related:
+                queryset = queryset.prefetch_related(*model.specific_prefetch_related)
+            resolved.update((obj.pk, obj) for obj in queryset)
+
+        return [resolved[view.pk] if view.pk in resolved else view.get_specific() or view for view in views]
+
+
 class BaseView(models.Model):
     view = None
     template_name = None
     vue_module = None
+    specific_select_related = ()
+    # relations read by get_assets, prefetched for all views of a type at once
+    specific_prefetch_related = ()
+    # the page can be swapped in place on the displays, views running scripts of their own need a reload
+    hot_swappable = True
 
     class LayoutModes(models.TextChoices):
         NORMAL = 'normal', _('Normal')
@@ -162,9 +609,13 @@ class BaseView(models.Model):
     title = models.CharField(max_length=128, verbose_name=_('Title'), blank=True)
     layout_mode = models.CharField(verbose_name=_('Layout Mode'), max_length=32, choices=LayoutModes,
                                    default=LayoutModes.NORMAL)
+    content_type = models.ForeignKey(ContentType, on_delete=models.PROTECT, verbose_name=_('View Type'),
+                                     related_name='+', editable=False, null=True)
     last_changed = models.DateTimeField(verbose_name=_('Last Changed'), auto_now=True)
     created_at = models.DateTimeField(verbose_name=_('Created At'), auto_now_add=True)
 
+    objects = BaseViewQuerySet.as_manager()
+
     class Meta:
         verbose_name = _('View')
         verbose_name_plural = _('Views')
@@ -174,6 +625,11 @@ class BaseView(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if self.content_type_id is None:
+            self.content_type = ContentType.objects.get_for_model(self)
+        super().save(*args, **kwargs)
+
     def get_view(self):
         raise NotImplementedError()
         # ToDo: implement view loading
@@ -189,6 +645,16 @@ class BaseView(models.Model):
         raise ImproperlyConfigured('Subclasses of BaseView must provide a vue_module or override get_vue_module')
 
     def get_specific(self) -> Optional[Self]:
+        if self.content_type_id is not None:
+            model = ContentType.objects.get_for_id(self.content_type_id).model_class()
+            if model is None or model is BaseView:
+                return None
+            if isinstance(self, model):
+                return self
+            return model._base_manager.select_related(*model.specific_select_related)\
+                .prefetch_related(*model.specific_prefetch_related).get(pk=self.pk)
+
+        # views saved before the content type was stored
         for field in self._meta.get_fields():
             if not isinstance(field, models.OneToOneRel) or not field.parent_link:
                 continue
@@ -201,9 +667,21 @@ class BaseView(models.Model):
 
         return reverse("view_by_pk", kwargs={"pk": self.pk})
 
-    def get_context(self) -> dict[str, Any]:
+    def get_context(self, resolution: Optional[tuple[int, int]] = None) -> dict[str, Any]:
         return {}
 
+    def get_playlist_duration(self, duration: Optional[int] = None) -> Optional[int]:
+        """
+        Effective duration of the view in a playlist in seconds, None if it is shown until its video has ended.
+        """
+        return duration or settings.PLAYLIST_DEFAULT_DURATION
+
+    def get_assets(self, resolution: Optional[tuple[int, int]] = None) -> list[dict[str, Any]]:
+        """
+        Media shown by the view, displays prefetch them before they show the view.
+        """
+        return []
+
 
 class HTMLView(BaseView):
     content = models.TextField(verbose_name=_('HTML Content'), blank=True)
@@ -218,13 +696,18 @@ class HTMLView(BaseView):
         default_related_name = 'html_views'
         ordering = ["name"]
 
+    @property
+    def hot_swappable(self) -> bool:
+        # scripts in the content don't run when it is swapped in, custom templates may bring their own
+        return not self.template_name_override and '<script' not in (self.content or '').lower()
+
     def get_template_name(self):
         return self.template_name_override or 'core/html_views/generic.html'
 
     def get_vue_module(self):
         return self.vue_module_override or 'HTMLViewGeneric'
 
-    def get_context(self) -> dict[str, Any]:
+    def get_context(self, resolution: Optional[tuple[int, int]] = None) -> dict[str, Any]:
         if self.context:
             return self.context
         else:
@@ -246,6 +729,8 @@ class IFrameView(BaseView):
 class ImageView(BaseView):
     template_name = 'core/image_view.html'
     vue_module = 'ImageView'
+    specific_select_related = ('image',)
+    specific_prefetch_related = ('image__variants',)
     image = models.ForeignKey(ImageFile, on_delete=models.PROTECT, verbose_name=_('Image'))
 
     class Meta:
@@ -254,10 +739,37 @@ class ImageView(BaseView):
         default_related_name = 'image_views'
         ordering = ["name"]
 
+    def get_sources(self, resolution: Optional[tuple[int, int]] = None) \
+            -> tuple[list[ImageVariant], Optional[ImageVariant]]:
+        """
+        Returns the variants offered to the browser in order of preference and the JPEG fallback.
+        """
+        variants = self.image.get_variants(resolution or Display.default_resolution())
+        return [variants[image_format] for image_format in (ImageVariant.Formats.AVIF, ImageVariant.Formats.WEBP)
+                if image_format in variants], variants.get(ImageVariant.Formats.JPEG)
+
+    def get_context(self, resolution: Optional[tuple[int, int]] = None) -> dict[str, Any]:
+        sources, fallback = self.get_sources(resolution)
+        return {'image_sources': sources, 'image_fallback': fallback}
+
+    def get_playlist_duration(self, duration: Optional[int] = None) -> Optional[int]:
+        return duration or self.image.display_duration
+
+    def get_assets(self, resolution: Optional[tuple[int, int]] = None) -> list[dict[str, Any]]:
+        sources, fallback = self.get_sources(resolution)
+        return [{
+            'type': 'image',
+            **(fallback.get_asset() if fallback is not None else self.image.get_asset()),
+            # the browser loads the first source it supports instead
+            'sources': [source.get_asset() for source in sources],
+        }]
+
 
 class VideoView(BaseView):
     template_name = 'core/video_view.html'
     vue_module = 'VideoView'
+    specific_select_related = ('video',)
+    specific_prefetch_related = ('video__renditions',)
     video = models.ForeignKey(VideoFile, on_delete=models.PROTECT, verbose_name=_('Video'), blank=True, null=True)
     video_url = models.URLField(verbose_name=_('Video URL'), blank=True, null=True,
                                 help_text=_('Can also be a hls or dash stream.'))
@@ -274,6 +786,31 @@ class VideoView(BaseView):
             ),
         ]
 
+    def get_playlist_duration(self, duration: Optional[int] = None) -> Optional[int]:
+        # videos that don't loop are played until they end, streams never end
+        if self.video is not None and not self.video.loop:
+            return None
+        return super().get_playlist_duration(duration)
+
+    def get_context(self, resolution: Optional[tuple[int, int]] = None) -> dict[str, Any]:
+        rendition = self.get_rendition(resolution)
+        if rendition is None:
+            return {'video_src': self.get_video_src(), 'video_type': self.get_video_type(), 'video_poster': None}
+        return {'video_src': rendition.file.url, 'video_type': 'video/mp4', 'video_poster': rendition.poster.url}
+
+    def get_rendition(self, resolution: Optional[tuple[int, int]] = None) -> Optional['VideoRendition']:
+        if self.video is None:
+            return None
+        return self.video.get_rendition(resolution or Display.default_resolution())
+
+    def get_assets(self, resolution: Optional[tuple[int, int]] = None) -> list[dict[str, Any]]:
+        if self.video is None:
+            return []
+        rendition = self.get_rendition(resolution)
+        if rendition is None:
+            return [{'type': 'video', **self.video.get_asset()}]
+        return [{'type': 'image', **get_file_asset(rendition.poster)}, {'type': 'video', **rendition.get_asset()}]
+
     def get_video_src(self) -> str:
         return self.video_url or self.video.file.url
 
@@ -294,7 +831,7 @@ class Schedule(models.Model):
     url = models.URLField(verbose_name=_('URL'))
     version = models.CharField(max_length=256, verbose_name=_('Version'), editable=False, null=True, blank=True)
     etag = models.CharField(max_length=256, verbose_name='ETag', editable=False, null=True, blank=True)
-    file = models.FileField(verbose_name=_('File'), upload_to='schedule/', null=True, blank=True)
+    file = models.FileField(verbose_name=_('File'), storage=get_content_storage, null=True, blank=True)
     last_changed = models.DateTimeField(verbose_name=_('Last Changed'), auto_now=True)
     created_at = models.DateTimeField(verbose_name=_('Created At'), auto_now_add=True)
 
@@ -307,40 +844,126 @@ class Schedule(models.Model):
     def __str__(self):
         return self.name
 
-    def update_schedule(self, force: bool = False):
+    def update_schedule(self, force: bool = False, session: Optional[requests.Session] = None) -> bool:
+        """
+        Downloads the schedule if it changed, returns whether it was updated.
+
+        The body is streamed into a temporary file in the content addressed storage, the row is only locked for
+        swapping the file in. The download stops as soon as the version shows the schedule is unchanged.
+        """
         if self.pk is None:
             raise ValueError('Save model first')
-        # start transaction and lock
-        with transaction.atomic():
-            obj = Schedule.objects.select_for_update().get(pk=self.pk)
-            file_time = None
-            if self.file:
+        file_time = None
+        if self.file:
+            with suppress(FileNotFoundError):
+                file_time = datetime.datetime.fromtimestamp(Path(self.file.path).stat().st_mtime, datetime.UTC)\
+                    .strftime('%a, %d %b %Y %H:%M:%S GMT')
+        directory = Path(self.file.storage.path(HASHED_DIRECTORY))
+        directory.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        with (session or requests).get(self.url, stream=True, timeout=settings.SCHEDULE_FETCH_TIMEOUT, headers={
+            'Accept': 'application/json',
+            # a forced update needs the full body
+            'If-None-Match': None if force else self.etag,
+            'If-Modified-Since': None if force or self.etag else file_time
+        }) as req, tempfile.NamedTemporaryFile(dir=directory, prefix='.schedule.', delete=False) as fp:
+            try:
+                if not force and req.status_code == 304:
+                    logger.info('Not updating schedule "%s" [%d], unchanged. (304)', self.name, self.pk)
+                    return False
+                req.raise_for_status()
+                scanner = JSONPathScanner(('schedule', 'version'))
+                for chunk in req.iter_content(chunk_size=64 * 1024):
+                    fp.write(chunk)
+                    digest.update(chunk)
+                    if scanner.found:
+                        continue
+                    scanner.feed(chunk)
+                    if not force and self.version and self.version == scanner.value:
+                        logger.info('Not updating schedule "%s" [%d], unchanged. (Version)', self.name, self.pk)
+                        return False
+                if not scanner.found:
+                    raise ValueError(f'Schedule "{self.name}" has no version')
+                fp.close()
+
+                # the slices are stored per version, so they can be built before the new version is swapped in
+                self.build_slices(Path(fp.name), scanner.value)
+                with transaction.atomic():
+                    obj = Schedule.objects.select_for_update().get(pk=self.pk)
+                    old_version, old_name = obj.version, obj.file.name
+                    obj.file.name = self.file.storage.adopt(Path(fp.name), digest.hexdigest(), 'schedule.json')
+                    obj.etag = req.headers.get('ETag', None)
+                    obj.version = scanner.value
+                    obj.save(update_fields=['file', 'etag', 'version', 'last_changed'])
+            finally:
                 with suppress(FileNotFoundError):
-                    file_time = datetime.datetime.fromtimestamp(Path(self.file.path).stat().st_mtime, datetime.UTC)\
-                        .strftime('%a, %d %b %Y %H:%M:%S GMT')
-            req = requests.get(self.url, headers={
-                'Accept': 'application/json',
-                'If-None-Match': self.etag,
-                'If-Modified-Since': None if self.etag else file_time
-            })
-            if not force and req.status_code == 304:
-                logger.info('Not updating schedule "%s" [%d], unchanged. (304)', self.name, self.pk)
-                return
-            req.raise_for_status()
-            data = req.json()
-            old_version = self.version
-            new_version = data['schedule']['version']
-            if not force and self.version and self.version == new_version:
-                logger.info('Not updating schedule "%s" [%d], unchanged. (Version)', self.name, self.pk)
-                return
-            if not self.file.name:
-                self.file.name = f'schedules/schedule-{self.uuid}.json'
-            with self.file.open('wb') as fp:
-                fp.write(req.content)
-            self.etag = req.headers.get('ETag', None)
-            self.version = new_version
-            self.save()
-            logger.info('Updated schedule "%s" [%d]: %s → %s', self.name, self.pk, old_version, new_version)
+                    os.unlink(fp.name)
+        self.file, self.etag, self.version, self.last_changed = obj.file, obj.etag, obj.version, obj.last_changed
+        logger.info('Updated schedule "%s" [%d]: %s → %s', self.name, self.pk, old_version, self.version)
+        transaction.on_commit(partial(self.schedule_updated, old_version, old_name))
+        return True
+
+    def schedule_updated(self, old_version: Optional[str], old_name: Optional[str] = None):
+        schedule_indexes.build(self)
+        self.push_delta(old_version)
+        self.remove_old_slices()
+        # files are shared by schedules with identical content
+        if old_name and not Schedule.objects.filter(file=old_name).exists():
+            self.file.storage.delete(old_name)
+
+    def push_delta(self, old_version: Optional[str]) -> int:
+        """
+        Sends the events changed since the old version to the displays showing their rooms, returns the number of
+        displays signalled. Displays refetch the schedule if the delta is unknown or too large.
+        """
+        delta = None
+        if old_version and (self.get_slice_dir(old_version) / INDEX_FILE).exists():
+            delta = diff_slices(self.get_slice_dir(old_version), self.get_slice_dir())
+            if len(delta['upserts']) + len(delta['removed']) > settings.SCHEDULE_DELTA_MAX_EVENTS:
+                delta = None
+        commands = {}
+        for view in self.schedule_views.prefetch_related('displays'):
+            view_delta = filter_delta(delta, view.get_room_filter()) if delta is not None else None
+            if view_delta is not None and not view_delta['upserts'] and not view_delta['removed']:
+                continue
+            for display in view.displays.all():
+                commands[display.slug] = {
+                    'cmd': DisplayCommands.SCHEDULE_DELTA,
+                    'version': self.version,
+                    'previous': old_version if view_delta is not None else None,
+                    **(view_delta or {'upserts': [], 'removed': []}),
+                }
+        return send_commands(commands)
+
+    @staticmethod
+    def slice_key_for_version(version: str) -> str:
+        return hashlib.md5(version.encode(), usedforsecurity=False).hexdigest()[:16]
+
+    def get_slice_dir(self, version: Optional[str] = None) -> Path:
+        return Path(self.file.storage.path(f'schedules/slices/{self.uuid}')) / \
+            self.slice_key_for_version(version or self.version)
+
+    def build_slices(self, source: Optional[Path] = None, version: Optional[str] = None):
+        write_slices(source or Path(self.file.path), self.get_slice_dir(version))
+
+    def remove_old_slices(self):
+        current = self.get_slice_dir()
+        for directory in current.parent.iterdir():
+            if directory != current and not directory.name.startswith('.'):
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def ensure_slices(self) -> Path:
+        directory = self.get_slice_dir()
+        if not (directory / INDEX_FILE).exists():
+            # schedules downloaded before slices existed
+            self.build_slices()
+        return directory
+
+    def get_slice(self, rooms: Optional[list[str]] = None, day: Optional[int] = None) -> dict[str, Any]:
+        """
+        Returns the compact schedule of the given rooms and day, see c3ds.core.schedule_slices.
+        """
+        return read_slice(self.ensure_slices(), rooms, day)
 
     @property
     def local_url(self):
@@ -350,6 +973,8 @@ class Schedule(models.Model):
 class ScheduleView(BaseView):
     template_name = 'core/schedule_view.html'
     vue_module = 'ScheduleView'
+    hot_swappable = False
+    specific_select_related = ('schedule',)
     schedule = models.ForeignKey(Schedule, on_delete=models.PROTECT, verbose_name=_('Schedule'))
     room_filter = models.CharField(max_length=256, verbose_name=_('Room Filter'), blank=True, null=True,
                                         help_text=_('Room filter for schedule as semicolon-separated list'))
@@ -359,3 +984,11 @@ class ScheduleView(BaseView):
         verbose_name_plural = _('Schedule Views')
         default_related_name = 'schedule_views'
         ordering = ["name"]
+
+    def get_room_filter(self) -> list[str]:
+        return [room for room in (self.room_filter or '').split(';') if room]
+
+    def get_schedule_url(self) -> str:
+        from django.urls import reverse
+
+        return reverse('schedule_view_slice', kwargs={'slug': self.slug})
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import time
+from typing import Any, Optional
+
+import channels.layers
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from c3ds.core.enums import DisplayCommands
+from c3ds.core.groups import group_send, playlist_group
+from c3ds.core.models import Playlist
+
+logger = logging.getLogger(__name__)
+
+
+def now_ms() -> int:
+    return time.time_ns() // 1000000
+
+
+class PlaylistClock:
+    """
+    Slot boundaries of a playlist, counted in whole playlist cycles from the manifest epoch (server time in ms).
+
+    Entries that play until their video ended have no fixed length, so they get the default duration here.
+    """
+
+    def __init__(self, manifest: dict[str, Any]):
+        self.playlist = manifest['playlist']
+        self.version = manifest['version']
+        self.epoch = manifest['epoch']
+        self.durations = [(entry['duration'] or settings.PLAYLIST_DEFAULT_DURATION) * 1000
+                          for entry in manifest['entries']]
+        self.cycle = sum(self.durations)
+
+    def slot_at(self, timestamp: int) -> Optional[tuple[int, int, int]]:
+        """
+        Returns index, start and end of the slot at the given server time.
+        """
+        if self.cycle == 0:
+            return None
+        cycle_start = timestamp - (timestamp - self.epoch) % self.cycle
+        start = cycle_start
+        for index, duration in enumerate(self.durations):
+            if timestamp < start + duration:
+                return index, start, start + duration
+            start += duration
+        raise AssertionError('timestamp outside of playlist cycle')
+
+    def next_boundary(self, timestamp: int) -> Optional[tuple[int, int]]:
+        """
+        Returns index and start of the first slot starting after the given server time.
+        """
+        slot = self.slot_at(timestamp)
+        if slot is None:
+            return None
+        index, _start, end = slot
+        return (index + 1) % len(self.durations), end
+
+    def advance_command(self, index: int, at: int) -> dict[str, Any]:
+        return {
+            'cmd': DisplayCommands.PLAYLIST_ADVANCE,
+            'playlist': self.playlist,
+            'version': self.version,
+            'epoch': self.epoch,
+            'index': index,
+            'at': at,
+        }
+
+
+class PlaylistScheduler:
+    """
+    Publishes one "advance at T" command per slot to the group of every playlist, displays flip to the next entry
+    at T on their NTP adjusted clock.
+    """
+
+    def __init__(self, lead: Optional[int] = None, channel_layer=None):
+        self.lead = settings.PLAYLIST_CLOCK_LEAD if lead is None else lead
+        self.channel_layer = channel_layer or channels.layers.get_channel_layer()
+        self.tasks: dict[str, asyncio.Task] = {}
+
+    async def run(self, refresh_interval: float = 30):
+        while True:
+            slugs = set(await sync_to_async(list)(
+                Playlist.objects.filter(displays__isnull=False).distinct().values_list('slug', flat=True)
+            ))
+            # a task that ended anyway is started again
+            for slug in slugs - {slug for slug, task in self.tasks.items() if not task.done()}:
+                self.tasks[slug] = asyncio.create_task(self.publish(slug))
+            for slug in self.tasks.keys() - slugs:
+                self.tasks.pop(slug).cancel()
+            await asyncio.sleep(refresh_interval)
+
+    async def get_clock(self, slug: str) -> Optional[PlaylistClock]:
+        playlist = await Playlist.objects.filter(slug=slug).afirst()
+        if playlist is None:
+            return None
+        return PlaylistClock(await sync_to_async(playlist.get_manifest)())
+
+    async def publish(self, slug: str):
+        at = now_ms()
+        failures = 0
+        while True:
+            try:
+                at = await self.publish_next(slug, at)
+                failures = 0
+            except Exception:  # NoQa
+                failures += 1
+                delay = min(2 ** failures, settings.PLAYLIST_CLOCK_MAX_BACKOFF)
+                logger.exception('Publishing the clock of playlist "%s" failed, retrying in %.1f seconds', slug, delay)
+                await asyncio.sleep(delay)
+                at = now_ms()
+
+    async def publish_next(self, slug: str, at: int) -> int:
+        """
+        Announces the next boundary after `at`, returns the time of the announced boundary.
+        """
+        clock = await self.get_clock(slug)
+        # announce every boundary after the last announced one, even if the lead is longer than a slot
+        boundary = clock.next_boundary(max(at, now_ms())) if clock is not None else None
+        if boundary is None:
+            await asyncio.sleep(settings.PLAYLIST_DEFAULT_DURATION)
+            return now_ms()
+        index, at = boundary
+        await asyncio.sleep(max(at - self.lead - now_ms(), 0) / 1000)
+        await group_send(playlist_group(slug), {
+            'type': 'cmd',
+            'cmd': clock.advance_command(index, at),
+        }, self.channel_layer)
+        logger.debug('Playlist "%s" advances to entry %d at %d', slug, index, at)
+        return at
@@ -0,0 +1,38 @@
+from typing import Any, Iterable, Optional
+
+from c3ds.core.enums import DisplayCommands
+from c3ds.core.models import BaseView, Display, Playlist
+from c3ds.core.reload import send_commands
+from c3ds.core.telemetry import telemetry_store
+
+
+def prefetch_command(manifest: dict[str, Any]) -> dict[str, Any]:
+    return {
+        'cmd': DisplayCommands.PREFETCH,
+        'version': manifest['version'],
+        'assets': manifest['assets'],
+    }
+
+
+def send_prefetch(displays: Iterable[Display], static_view: Optional[BaseView] = None,
+                  playlist: Optional[Playlist] = None) -> dict[str, str]:
+    """
+    Asks the displays to download the media of their content, or of the given content, in the background.
+
+    Returns the manifest version per display slug, see prefetch_status.
+    """
+    manifests = {display.slug: display.get_asset_manifest(static_view, playlist) for display in displays}
+    send_commands({slug: prefetch_command(manifest) for slug, manifest in manifests.items()})
+    return {slug: manifest['version'] for slug, manifest in manifests.items()}
+
+
+def prefetch_status(versions: dict[str, str]) -> dict[str, bool]:
+    """
+    Whether the displays reported to have cached all assets of the given manifest versions.
+    """
+    reports = telemetry_store.get_prefetch_reports(versions.keys())
+    return {
+        slug: slug in reports and reports[slug]['version'] == version
+        and reports[slug]['cached'] == reports[slug]['total']
+        for slug, version in versions.items()
+    }
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import os
+import secrets
+import socket
+import time
+from typing import Any, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+WORKERS_CACHE_KEY = 'presence-workers'
+# identifies the records this process writes to the shared cache
+WORKER = f'{socket.gethostname()}-{os.getpid()}-{secrets.token_hex(2)}'
+
+
+def worker_cache_key(worker: str) -> str:
+    return f'presence-worker-{worker}'
+
+
+class PresenceRegistry:
+    """
+    Tracks the websocket connections of the displays, updated on connect and disconnect instead of derived from the
+    age of the last heartbeat.
+
+    Every worker process writes one record of its connections to the shared cache, which expires after PRESENCE_TTL
+    seconds so the displays of a crashed worker go offline on their own. Heartbeats only keep a connection from
+    expiring. The records of all workers are listed in an index, so the online displays are read with two lookups.
+    """
+
+    def __init__(self):
+        self.worker = WORKER
+        # slug -> channel name -> connection
+        self._connections: dict[str, dict[str, dict[str, Any]]] = {}
+        self._dirty = False
+        self._written = 0.0
+        self._flush_task: Optional[asyncio.Task] = None
+        self._online: Optional[tuple[float, dict[str, dict[str, Any]]]] = None
+
+    def connected(self, slug: str, channel_name: str, client_ip: Optional[str]):
+        now = time.time()
+        self._connections.setdefault(slug, {})[channel_name] = {
+            'connected_at': now,
+            'last_seen': now,
+            'client_ip': client_ip,
+        }
+        self.changed()
+
+    def disconnected(self, slug: str, channel_name: str):
+        connections = self._connections.get(slug, {})
+        connections.pop(channel_name, None)
+        if not connections:
+            self._connections.pop(slug, None)
+        self.changed()
+
+    def touch(self, slug: str, channel_name: str):
+        connection = self._connections.get(slug, {}).get(channel_name)
+        if connection is not None:
+            connection['last_seen'] = time.time()
+
+    def changed(self):
+        self._dirty = True
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # not running in an event loop, write through instead
+            self.flush_sync()
+            return
+        self._flush_task = loop.create_task(self._flush_loop())
+
+    def get_record(self) -> dict[str, dict[str, Any]]:
+        # connections that stopped sending heartbeats without closing are half open sockets
+        alive = time.time() - settings.PRESENCE_TTL
+        record = {}
+        for slug, connections in self._connections.items():
+            connections = [connection for connection in connections.values() if connection['last_seen'] > alive]
+            if connections:
+                latest = max(connections, key=lambda connection: connection['connected_at'])
+                record[slug] = {
+                    'connections': len(connections),
+                    'connected_at': min(connection['connected_at'] for connection in connections),
+                    'client_ip': latest['client_ip'],
+                    'worker': self.worker,
+                }
+        return record
+
+    def _take_values(self, workers: dict[str, float]) -> dict[str, Any]:
+        self._dirty = False
+        self._written = time.monotonic()
+        now = time.time()
+        # every worker rewrites the index, an entry lost to concurrent writes is back after the next refresh
+        workers = {worker: expires for worker, expires in workers.items() if expires > now}
+        workers[self.worker] = now + settings.PRESENCE_TTL
+        return {worker_cache_key(self.worker): self.get_record(), WORKERS_CACHE_KEY: workers}
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(settings.PRESENCE_FLUSH_INTERVAL)
+            # the record is refreshed well before it expires even if nothing changed
+            if self._dirty or time.monotonic() - self._written > settings.PRESENCE_TTL / 3:
+                try:
+                    await self.flush()
+                except Exception:  # NoQa
+                    logger.exception('Writing presence failed')
+
+    async def flush(self):
+        workers = await cache.aget(WORKERS_CACHE_KEY) or {}
+        await cache.aset_many(self._take_values(workers), settings.PRESENCE_TTL)
+
+    def flush_sync(self):
+        workers = cache.get(WORKERS_CACHE_KEY) or {}
+        cache.set_many(self._take_values(workers), settings.PRESENCE_TTL)
+
+    def get_online(self, max_age: float = 0) -> dict[str, dict[str, Any]]:
+        """
+        Returns the connected displays of all workers by slug with the number of connections, the time of the first
+        connection, the client IP address of the latest connection and the worker holding it. The last result is
+        reused if it is at most max_age seconds old.
+        """
+        if self._online is not None and time.monotonic() - self._online[0] < max_age:
+            return self._online[1]
+        workers = cache.get(WORKERS_CACHE_KEY) or {}
+        online = {}
+        for record in cache.get_many([worker_cache_key(worker) for worker in workers]).values():
+            for slug, presence in record.items():
+                other = online.get(slug)
+                if other is not None:
+                    latest = presence if presence['connected_at'] > other['connected_at'] else other
+                    presence = {
+                        **latest,
+                        'connections': presence['connections'] + other['connections'],
+                        'connected_at': min(presence['connected_at'], other['connected_at']),
+                    }
+                online[slug] = presence
+        self._online = time.monotonic(), online
+        return online
+
+    def get_presence(self, slug: str, max_age: float = 0) -> Optional[dict[str, Any]]:
+        return self.get_online(max_age).get(slug)
+
+
+presence_registry = PresenceRegistry()
@@ -0,0 +1,277 @@
+import asyncio
+import functools
+import hashlib
+import logging
+import threading
+import time
+from contextlib import suppress
+from functools import partial
+from pathlib import Path
+from typing import Iterable, Optional
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connection, transaction
+
+from c3ds.core.enums import DisplayCommands
+from c3ds.core.groups import display_group, group_send
+
+logger = logging.getLogger(__name__)
+
+# seconds a display is given to reconnect after a reload for the round trip metric
+RELOAD_TRACKING_TIMEOUT = 600
+# delayed reload commands without a delay are spread over this many seconds by the displays themselves
+CLIENT_RELOAD_WINDOW = 20
+
+
+def reload_sent_cache_key(slug: str) -> str:
+    return f'{slug}-reload-sent'
+
+
+async def track_reloads(delays: dict[str, int]):
+    """
+    Stores when the displays are expected to reload (the command plus its delay), the consumer measures the round trip
+    when they reconnect.
+    """
+    if delays:
+        now = time.time()
+        await cache.aset_many({reload_sent_cache_key(slug): now + delay / 1000 for slug, delay in delays.items()},
+                              RELOAD_TRACKING_TIMEOUT)
+
+
+def reload_window(count: int, delayed: Optional[bool] = None, spread: Optional[float] = None) -> float:
+    """
+    Length of the window in seconds the reloads of `count` displays are spread over.
+
+    `spread` is the number of seconds added per display, so the displays hit the origin at a flat rate.
+    """
+    if delayed is None:
+        delayed = count >= settings.DELAYED_RELOAD_THRESHOLD
+    if not delayed:
+        return 0
+    if spread is None:
+        spread = settings.RELOAD_SPREAD_FACTOR
+    return min(count * spread, settings.RELOAD_MAX_WINDOW)
+
+
+def reload_delay(slug: str, window: float) -> int:
+    """
+    Deterministic delay in ms within the window for a display, so repeated reloads keep the same order.
+    """
+    if window <= 0:
+        return 0
+    digest = hashlib.blake2b(slug.encode(), digest_size=4).digest()
+    return int(int.from_bytes(digest) / 2 ** 32 * window * 1000)
+
+
+def reload_delays(slugs: Iterable[str], delayed: Optional[bool] = None,
+                  spread: Optional[float] = None) -> dict[str, int]:
+    slugs = list(dict.fromkeys(slugs))
+    window = reload_window(len(slugs), delayed, spread)
+    return {slug: reload_delay(slug, window) for slug in slugs}
+
+
+async def async_reload_slugs(slugs: Iterable[str], delayed: Optional[bool] = None,
+                             spread: Optional[float] = None, rollout: Optional[str] = None) -> int:
+    """
+    Sends the reload command to all displays concurrently, returns the number of displays signalled.
+
+    Displays acknowledge a command with a rollout id once they loaded again.
+    """
+    delays = reload_delays(slugs, delayed, spread)
+    await asyncio.gather(*(
+        group_send(display_group(slug), {
+            'type': 'cmd',
+            'cmd': {
+                'cmd': DisplayCommands.RELOAD,
+                'delayed': delay > 0,
+                'delay': delay,
+                **({'rollout': rollout} if rollout else {}),
+            }
+        })
+        for slug, delay in delays.items()
+    ))
+    await track_reloads(delays)
+    return len(delays)
+
+
+def reload_slugs(slugs: Iterable[str], delayed: Optional[bool] = None, spread: Optional[float] = None,
+                 rollout: Optional[str] = None) -> int:
+    # evaluate querysets here, the database can not be queried from the event loop
+    return async_to_sync(async_reload_slugs)(list(slugs), delayed, spread, rollout)
+
+
+async def async_send_commands(commands: dict[str, dict]) -> int:
+    """
+    Sends every display its own command concurrently, returns the number of displays signalled.
+    """
+    await asyncio.gather(*(
+        group_send(display_group(slug), {'type': 'cmd', 'cmd': cmd})
+        for slug, cmd in commands.items()
+    ))
+    return len(commands)
+
+
+def send_commands(commands: dict[str, dict]) -> int:
+    return async_to_sync(async_send_commands)(commands)
+
+
+@functools.cache
+def get_build_fingerprint() -> str:
+    """
+    Fingerprint of the frontend build and the base template, displays showing a page of another build must reload.
+    """
+    from django.template.loader import get_template
+    from django_vite_plugin.utils import CONFIG
+
+    digest = hashlib.md5(usedforsecurity=False)
+    with suppress(FileNotFoundError):
+        digest.update(Path(CONFIG['HOT_FILE'] if CONFIG['DEV_MODE'] else CONFIG['MANIFEST']).read_bytes())
+    digest.update(get_template('core/base.html').template.source.encode())
+    return digest.hexdigest()[:16]
+
+
+def render_view_pages(slugs: Iterable[str]) -> dict[str, Optional[str]]:
+    """
+    Renders the pages of the displays for a hot swap, None for displays without a page to swap to.
+    """
+    from c3ds.core.models import Display
+    from c3ds.core.views import DisplayView
+
+    pages = dict.fromkeys(slugs)
+    for display in Display.objects.filter(slug__in=pages.keys()).select_related('playlist', 'static_view'):
+        page = DisplayView.render_page(display)
+        if page is not None:
+            pages[display.slug] = page[1].decode()
+    return pages
+
+
+async def async_update_views(pages: dict[str, Optional[str]], delayed: Optional[bool] = None,
+                             spread: Optional[float] = None, rollout: Optional[str] = None) -> int:
+    """
+    Pushes the rendered pages to the displays, which swap their content in place. Displays that can't do that
+    (another build, content with scripts of its own, no page) reload at their slot in the reload window instead.
+    """
+    window = reload_window(len(pages), delayed, spread)
+    build = get_build_fingerprint()
+    extra = {'rollout': rollout} if rollout else {}
+    await asyncio.gather(*(
+        group_send(display_group(slug), {
+            'type': 'cmd',
+            'cmd': {
+                'cmd': DisplayCommands.UPDATE_VIEW,
+                'build': build,
+                'html': page,
+                'delay': reload_delay(slug, window),
+                **extra,
+            } if page is not None else {
+                'cmd': DisplayCommands.RELOAD,
+                'delayed': window > 0,
+                'delay': reload_delay(slug, window),
+                **extra,
+            }
+        })
+        for slug, page in pages.items()
+    ))
+    # hot swaps keep the connection
+    await track_reloads({slug: reload_delay(slug, window) for slug, page in pages.items() if page is None})
+    return len(pages)
+
+
+def update_views(slugs: Iterable[str], delayed: Optional[bool] = None, spread: Optional[float] = None) -> int:
+    return async_to_sync(async_update_views)(render_view_pages(slugs), delayed, spread)
+
+
+class _ReloadBatch:
+    def __init__(self, savepoints: list[str]):
+        self.slugs: set[str] = set()
+        self.savepoints = savepoints
+        self.committed = False
+
+
+class ReloadCoalescer:
+    """
+    Collects the slugs of displays to update and sends one batched update once the surrounding transaction has
+    committed and no further updates were requested for the debounce window. The update is a rollout that starts with
+    the canary wave, see c3ds.core.rollout.
+    """
+
+    def __init__(self, debounce: Optional[float] = None):
+        self._debounce = debounce
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending: set[str] = set()
+        self._timer: Optional[threading.Timer] = None
+
+    @property
+    def debounce(self) -> float:
+        return settings.RELOAD_DEBOUNCE if self._debounce is None else self._debounce
+
+    def add(self, slugs: Iterable[str]):
+        slugs = set(slugs)
+        if not slugs:
+            return
+        # one batch per atomic block, the batch of a rolled back block is dropped together with its commit callback
+        db = transaction.get_connection()
+        batch = getattr(self._local, 'batch', None)
+        if (batch is not None and not batch.committed and batch.savepoints == db.savepoint_ids
+                and any(isinstance(func, partial) and func.args and func.args[0] is batch
+                        for _sids, func, _robust in db.run_on_commit)):
+            batch.slugs.update(slugs)
+            return
+        batch = self._local.batch = _ReloadBatch(list(db.savepoint_ids))
+        batch.slugs.update(slugs)
+        # runs right away outside of a transaction
+        transaction.on_commit(partial(self._commit, batch))
+
+    def _commit(self, batch: _ReloadBatch):
+        if batch.committed:
+            return
+        batch.committed = True
+        with self._lock:
+            self._pending.update(batch.slugs)
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self.debounce > 0:
+                self._timer = threading.Timer(self.debounce, self._flush_from_timer)
+                self._timer.start()
+                return
+        self.flush()
+
+    def _take_pending(self) -> set[str]:
+        with self._lock:
+            slugs, self._pending = self._pending, set()
+            self._timer = None
+        if slugs:
+            logger.debug('Updating %d display(s)', len(slugs))
+        return slugs
+
+    def flush(self) -> int:
+        from c3ds.core.rollout import start_update_rollout
+
+        slugs = self._take_pending()
+        if not slugs:
+            return 0
+        rollout, pages = start_update_rollout(slugs)
+        return async_to_sync(async_update_views)(pages, rollout=rollout)
+
+    def _flush_from_timer(self):
+        from c3ds.core.rollout import start_update_rollout
+
+        # the timer thread has no event loop, and async_to_sync fails if the timer fires while the interpreter exits
+        # (e.g. right after loaddata), so run the sends in an event loop of our own
+        slugs = self._take_pending()
+        if not slugs:
+            return
+        try:
+            close_old_connections()
+            rollout, pages = start_update_rollout(slugs)
+            asyncio.run(async_update_views(pages, rollout=rollout))
+        finally:
+            # every flush runs in a new timer thread, don't leave its database connection open
+            connection.close()
+
+
+reload_coalescer = ReloadCoalescer()
@@ -0,0 +1,262 @@
+import asyncio
+import datetime
+import hashlib
+import logging
+import math
+import threading
+import time
+import uuid
+from typing import Iterable, Optional
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from c3ds.core.models import Display, Rollout, RolloutTarget
+from c3ds.core.presence import presence_registry
+from c3ds.core.reload import async_update_views, reload_delays, render_view_pages
+from c3ds.core.telemetry import telemetry_store
+
+logger = logging.getLogger(__name__)
+
+
+class RolloutAckRecorder:
+    """
+    Buffers the rollout acknowledgements of the displays and writes them with one bulk update per flush interval,
+    so a fleet reloading at once doesn't update the targets one by one.
+    """
+
+    def __init__(self):
+        # (rollout uuid, slug) -> time of the acknowledgement
+        self._pending: dict[tuple[uuid.UUID, str], datetime.datetime] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def record(self, rollout: uuid.UUID, slug: str):
+        self._pending.setdefault((rollout, slug), timezone.now())
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush_sync()
+            return
+        self._flush_task = loop.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while self._pending:
+            await asyncio.sleep(settings.ROLLOUT_ACK_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception:  # NoQa
+                logger.exception('Writing rollout acknowledgements failed')
+
+    async def flush(self):
+        await sync_to_async(self.flush_sync)()
+
+    def flush_sync(self) -> int:
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        targets = RolloutTarget.objects.filter(
+            rollout__uuid__in={rollout for rollout, _slug in pending},
+            display__slug__in={slug for _rollout, slug in pending},
+            acked_at=None,
+        ).select_related('rollout', 'display').only('rollout__uuid', 'rollout__status', 'display__slug', 'acked_at')
+        acked = []
+        for target in targets:
+            acked_at = pending.get((target.rollout.uuid, target.display.slug))
+            if acked_at is not None:
+                target.acked_at = acked_at
+                acked.append(target)
+        RolloutTarget.objects.bulk_update(acked, ['acked_at'])
+        # the rollout may be driven by another process, this one picks it up too and the wave is claimed by one
+        if any(target.rollout.status == Rollout.Status.RUNNING for target in acked):
+            rollout_driver.start()
+        return len(acked)
+
+
+def wave_sizes(count: int, canaries: int = 0) -> list[int]:
+    """
+    Number of displays per wave: the canaries (at least ROLLOUT_CANARY_SIZE), then waves growing from
+    ROLLOUT_WAVE_SIZE by ROLLOUT_WAVE_GROWTH.
+    """
+    if not settings.ROLLOUT_WAVES or count <= 0:
+        return [count] if count > 0 else []
+    sizes = [min(max(canaries, settings.ROLLOUT_CANARY_SIZE), count)]
+    size = settings.ROLLOUT_WAVE_SIZE
+    while sum(sizes) < count:
+        sizes.append(min(size, count - sum(sizes)))
+        size = max(math.ceil(size * settings.ROLLOUT_WAVE_GROWTH), 1)
+    return sizes
+
+
+def canary_order(displays: Iterable[tuple[str, list[str]]]) -> list[str]:
+    """
+    Orders the slugs of (slug, tags) for the waves, displays tagged as canaries first and the rest in a deterministic
+    order, so the same displays see updates first every time.
+    """
+    def key(display):
+        slug, tags = display
+        return (settings.ROLLOUT_CANARY_TAG not in tags,
+                hashlib.blake2b(slug.encode(), digest_size=4).digest())
+    return [slug for slug, tags in sorted(displays, key=key)]
+
+
+def start_update_rollout(slugs: Iterable[str],
+                         description: str = 'Content update') -> tuple[Optional[str], dict[str, Optional[str]]]:
+    """
+    Creates the rollout of a content update to the online displays among the slugs and prepares the first wave,
+    returns the rollout uuid and the pages of the first wave to send. The others see the update when they connect.
+    """
+    online = presence_registry.get_online()
+    pks, displays = {}, []
+    for pk, slug, tags in Display.objects.filter(slug__in=set(slugs) & online.keys()).values_list('pk', 'slug', 'tags'):
+        pks[slug] = pk
+        displays.append((slug, Display.parse_tags(tags)))
+    if not displays:
+        return None, {}
+    order = canary_order(displays)
+    sizes = wave_sizes(len(order), sum(settings.ROLLOUT_CANARY_TAG in tags for slug, tags in displays))
+    with transaction.atomic():
+        rollout = Rollout.objects.create(description=description, wave_count=len(sizes))
+        waves = [wave for wave, size in enumerate(sizes) for _ in range(size)]
+        RolloutTarget.objects.bulk_create(
+            RolloutTarget(rollout=rollout, display_id=pks[slug], wave=wave) for slug, wave in zip(order, waves)
+        )
+        pages = prepare_wave(rollout, 0)
+    if rollout.status == Rollout.Status.RUNNING:
+        logger.info('Rolling out %s to %d display(s) in %d waves', rollout.uuid, len(order), len(sizes))
+        rollout_driver.start()
+    return str(rollout.uuid), pages
+
+
+def prepare_wave(rollout: Rollout, wave: int) -> dict[str, Optional[str]]:
+    """
+    Marks the targets of the wave as sent and renders their pages, the rollout keeps running until its last wave.
+    Targets that went offline in the meantime are dropped, they load the update when they connect again.
+    """
+    targets = {target.display.slug: target for target in rollout.targets.filter(wave=wave).select_related('display')}
+    online = presence_registry.get_online()
+    RolloutTarget.objects.filter(pk__in=[target.pk for slug, target in targets.items() if slug not in online]).delete()
+    targets = {slug: target for slug, target in targets.items() if slug in online}
+    delays = reload_delays(targets)
+    now = timezone.now()
+    for slug, delay in delays.items():
+        targets[slug].sent_at = now
+        targets[slug].expected_at = now + datetime.timedelta(milliseconds=delay)
+    RolloutTarget.objects.bulk_update(targets.values(), ['sent_at', 'expected_at'])
+    rollout.wave = wave
+    rollout.wave_started_at = now
+    rollout.status = Rollout.Status.RUNNING if wave < rollout.wave_count - 1 else Rollout.Status.SENT
+    rollout.save(update_fields=['wave', 'wave_started_at', 'status'])
+    return render_view_pages(delays)
+
+
+def get_wave_health(rollout: Rollout) -> tuple[int, int]:
+    """
+    Returns how many displays of the current wave are healthy (acknowledged, online and sent a heartbeat after the
+    acknowledgement) and the size of the wave.
+    """
+    targets = list(rollout.targets.filter(wave=rollout.wave).values_list('display__slug', 'acked_at'))
+    online = presence_registry.get_online()
+    heartbeats = telemetry_store.get_heartbeats(slug for slug, acked_at in targets if acked_at)
+    healthy = sum(1 for slug, acked_at in targets
+                  if acked_at and slug in online and slug in heartbeats and heartbeats[slug] >= acked_at)
+    return healthy, len(targets)
+
+
+def advance(rollout: Rollout, force: bool = False) -> Optional[dict[str, Optional[str]]]:
+    """
+    Prepares the next wave once the current one is healthy enough and returns its pages to send, halts the rollout if
+    the current wave doesn't get there within ROLLOUT_WAVE_TIMEOUT seconds after the last slot of its reload window.
+    """
+    if rollout.status != Rollout.Status.RUNNING:
+        return None
+    if not force:
+        healthy, total = get_wave_health(rollout)
+        if healthy < math.ceil(total * settings.ROLLOUT_WAVE_SUCCESS_RATIO):
+            window_end = rollout.targets.filter(wave=rollout.wave).aggregate(end=Max('expected_at'))['end']
+            deadline = timezone.now() - datetime.timedelta(seconds=settings.ROLLOUT_WAVE_TIMEOUT)
+            if (window_end or rollout.wave_started_at) < deadline and Rollout.objects.filter(
+                    pk=rollout.pk, status=Rollout.Status.RUNNING, wave=rollout.wave,
+            ).update(status=Rollout.Status.HALTED):
+                rollout.status = Rollout.Status.HALTED
+                logger.warning('Halted rollout %s, %d/%d display(s) of wave %d are healthy',
+                               rollout.uuid, healthy, total, rollout.wave)
+            return None
+    # claim the next wave, processes checking the same rollout concurrently see the wave number changed
+    if not Rollout.objects.filter(pk=rollout.pk, status=Rollout.Status.RUNNING, wave=rollout.wave).update(
+            wave=rollout.wave + 1):
+        return None
+    return prepare_wave(rollout, rollout.wave + 1)
+
+
+def resume(rollout: Rollout) -> int:
+    """
+    Sends the next wave of a halted rollout regardless of the health of the current one, returns its size.
+    """
+    if not Rollout.objects.filter(pk=rollout.pk, status=Rollout.Status.HALTED).update(status=Rollout.Status.RUNNING):
+        return 0
+    rollout.status = Rollout.Status.RUNNING
+    pages = advance(rollout, force=True)
+    if not pages:
+        return 0
+    count = async_to_sync(async_update_views)(pages, rollout=str(rollout.uuid))
+    rollout_driver.start()
+    return count
+
+
+class RolloutDriver:
+    """
+    Advances the running rollouts in a thread of its own, which ends once none are left and is started again by the
+    next rollout or acknowledgement.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._wakeup = threading.Event()
+
+    def start(self):
+        with self._lock:
+            self._wakeup.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name='rollout-driver', daemon=True)
+                self._thread.start()
+
+    def run(self):
+        try:
+            while True:
+                self._wakeup.clear()
+                close_old_connections()
+                rollouts = list(Rollout.objects.filter(status=Rollout.Status.RUNNING))
+                for rollout in rollouts:
+                    try:
+                        self.step(rollout)
+                    except Exception:  # NoQa
+                        logger.exception('Advancing rollout %s failed', rollout.uuid)
+                with self._lock:
+                    # a rollout started while querying set the wakeup event
+                    if not rollouts and not self._wakeup.is_set():
+                        self._thread = None
+                        return
+                time.sleep(settings.ROLLOUT_WAVE_CHECK_INTERVAL)
+        except Exception:  # NoQa
+            logger.exception('Rollout driver failed')
+            with self._lock:
+                self._thread = None
+        finally:
+            connection.close()
+
+    def step(self, rollout: Rollout):
+        pages = advance(rollout)
+        if pages:
+            logger.info('Sending wave %d of rollout %s to %d display(s)', rollout.wave, rollout.uuid, len(pages))
+            # this thread has no event loop of its own, see ReloadCoalescer._flush_from_timer
+            asyncio.run(async_update_views(pages, rollout=str(rollout.uuid)))
+
+
+rollout_acks = RolloutAckRecorder()
+rollout_driver = RolloutDriver()
@@ -0,0 +1,77 @@
+import bisect
+import datetime
+import threading
+from typing import Any, Iterable, Optional
+
+from c3ds.core.schedule_slices import read_events
+
+
+def parse_duration(duration: str) -> datetime.timedelta:
+    hours, minutes = duration.split(':')[:2]
+    return datetime.timedelta(hours=int(hours), minutes=int(minutes))
+
+
+class ScheduleIndex:
+    """
+    Talks of a schedule version sorted by start per room, answers "now and next" queries with a binary search.
+    """
+
+    def __init__(self, version: str, events: Iterable[dict[str, Any]]):
+        self.version = version
+        rooms: dict[str, list[tuple[datetime.datetime, datetime.datetime, dict[str, Any]]]] = {}
+        for event in events:
+            start = datetime.datetime.fromisoformat(event['date'])
+            rooms.setdefault(event['room'], []).append((start, start + parse_duration(event['duration']), event))
+        self.rooms = {room: sorted(talks, key=lambda talk: talk[0]) for room, talks in rooms.items()}
+        self.starts = {room: [talk[0] for talk in talks] for room, talks in self.rooms.items()}
+
+    def now_next(self, room: str, at: datetime.datetime) -> tuple[Optional[tuple], Optional[tuple]]:
+        """
+        Returns the talk running in the room at the given time and the one after it as (start, end, event).
+        """
+        talks = self.rooms.get(room)
+        if not talks:
+            return None, None
+        position = bisect.bisect_right(self.starts[room], at)
+        current = talks[position - 1] if position > 0 and talks[position - 1][1] > at else None
+        upcoming = talks[position] if position < len(talks) else None
+        return current, upcoming
+
+    def next_boundary(self, rooms: Iterable[str], at: datetime.datetime) -> Optional[datetime.datetime]:
+        """
+        The first time after `at` a talk in one of the rooms starts or ends, the answer of now_next changes then.
+        """
+        boundaries = []
+        for room in rooms:
+            current, upcoming = self.now_next(room, at)
+            if current is not None:
+                boundaries.append(current[1])
+            if upcoming is not None:
+                boundaries.append(upcoming[0])
+        return min(boundaries, default=None)
+
+
+class ScheduleIndexRegistry:
+    """
+    Keeps the index of the current version of every schedule in memory, built from the compact schedule slices.
+    """
+
+    def __init__(self):
+        self._indexes: dict[int, ScheduleIndex] = {}
+        self._lock = threading.Lock()
+
+    def get(self, schedule) -> ScheduleIndex:
+        index = self._indexes.get(schedule.pk)
+        if index is not None and index.version == schedule.version:
+            return index
+        return self.build(schedule)
+
+    def build(self, schedule) -> ScheduleIndex:
+        events = read_events(schedule.ensure_slices()).values()
+        index = ScheduleIndex(schedule.version, (event for _day, event in events))
+        with self._lock:
+            self._indexes[schedule.pk] = index
+        return index
+
+
+schedule_indexes = ScheduleIndexRegistry()
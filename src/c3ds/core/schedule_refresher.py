@@ -0,0 +1,63 @@
+import asyncio
+import logging
+from typing import Optional
+
+import requests
+from channels.db import database_sync_to_async
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from c3ds.core.models import Schedule
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduleRefresher:
+    """
+    Polls all schedules concurrently. The downloads share one pooled HTTP session, schedules that failed to update
+    are retried with exponential backoff.
+    """
+
+    def __init__(self, interval: Optional[float] = None, concurrency: int = 4):
+        self.interval = settings.SCHEDULE_REFRESH_INTERVAL if interval is None else interval
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.failures: dict[int, int] = {}
+        self.next_refresh: dict[int, float] = {}
+
+    def get_delay(self, pk: int) -> float:
+        return min(self.interval * 2 ** self.failures.get(pk, 0), settings.SCHEDULE_REFRESH_MAX_BACKOFF)
+
+    async def refresh(self, schedule: Schedule) -> bool:
+        async with self.semaphore:
+            try:
+                # the executor threads keep their database connections, these close the stale ones around the update
+                updated = await database_sync_to_async(schedule.update_schedule, thread_sensitive=False)(
+                    session=self.session)
+            except Exception:  # NoQa
+                self.failures[schedule.pk] = self.failures.get(schedule.pk, 0) + 1
+                logger.exception('Updating schedule "%s" [%d] failed, retrying in %d seconds', schedule.name,
+                                 schedule.pk, self.get_delay(schedule.pk))
+                updated = False
+            else:
+                self.failures.pop(schedule.pk, None)
+        self.next_refresh[schedule.pk] = asyncio.get_running_loop().time() + self.get_delay(schedule.pk)
+        return updated
+
+    async def refresh_due(self) -> int:
+        """
+        Refreshes all schedules that are due, returns the number of updated schedules.
+        """
+        now = asyncio.get_running_loop().time()
+        due = [schedule async for schedule in Schedule.objects.all() if self.next_refresh.get(schedule.pk, 0) <= now]
+        return sum(await asyncio.gather(*(self.refresh(schedule) for schedule in due)))
+
+    async def run(self):
+        while True:
+            await self.refresh_due()
+            now = asyncio.get_running_loop().time()
+            next_refresh = min(self.next_refresh.values(), default=now + self.interval)
+            await asyncio.sleep(min(max(next_refresh - now, 1), self.interval))
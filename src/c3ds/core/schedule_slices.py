@@ -0,0 +1,162 @@
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from django.utils.text import slugify
+
+INDEX_FILE = 'index.json'
+ALL_FILE = 'all.json'
+
+
+def compact_event(event: dict[str, Any]) -> dict[str, Any]:
+    # only the fields rendered by ScheduleView.vue
+    return {
+        'guid': event['guid'],
+        'date': event['date'],
+        'start': event['start'],
+        'duration': event['duration'],
+        'room': event['room'],
+        'title': event['title'],
+        'track': event.get('track'),
+        'persons': [{'name': person.get('name') or person.get('public_name', '')}
+                    for person in event.get('persons', [])],
+    }
+
+
+def make_slice(schedule: dict[str, Any], days: list[dict[str, Any]]) -> dict[str, Any]:
+    return {'schedule': {
+        'version': schedule['version'],
+        'conference': {
+            'tracks': [{'name': track.get('name'), 'color': track.get('color'), 'slug': track.get('slug')}
+                       for track in schedule['conference'].get('tracks', [])],
+            'days': days,
+        },
+    }}
+
+
+def slice_days(days: list[dict[str, Any]], rooms: Optional[Iterable[str]] = None) -> list[dict[str, Any]]:
+    rooms = set(rooms) if rooms is not None else None
+    return [
+        {**{key: value for key, value in day.items() if key != 'rooms'},
+         'rooms': {room: events for room, events in day['rooms'].items() if rooms is None or room in rooms}}
+        for day in days
+    ]
+
+
+def read_json(path: Path) -> Any:
+    with path.open('rb') as fp:
+        return json.load(fp)
+
+
+def write_json(path: Path, data: Any):
+    with path.open('w') as fp:
+        json.dump(data, fp, separators=(',', ':'))
+
+
+def write_slices(source: Path, target: Path):
+    """
+    Splits a schedule json file into compact slices per room and per day, written into the directory `target`.
+    """
+    schedule = read_json(source)['schedule']
+    days = [
+        {
+            'index': day['index'],
+            'date': day['date'],
+            'day_start': day['day_start'],
+            'day_end': day['day_end'],
+            'rooms': {room: [compact_event(event) for event in events] for room, events in day['rooms'].items()},
+        }
+        for day in schedule['conference']['days']
+    ]
+    room_names = list(dict.fromkeys(room for day in days for room in day['rooms']))
+    room_files = {}
+    for room in room_names:
+        room_files[room] = f'room-{slugify(room) or "unnamed"}-{len(room_files)}.json'
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    build_dir = Path(tempfile.mkdtemp(dir=target.parent, prefix=f'.{target.name}.'))
+    try:
+        write_json(build_dir / ALL_FILE, make_slice(schedule, days))
+        for room, filename in room_files.items():
+            write_json(build_dir / filename, make_slice(schedule, slice_days(days, [room])))
+        for day in days:
+            write_json(build_dir / f'day-{day["index"]}.json', make_slice(schedule, [day]))
+        write_json(build_dir / INDEX_FILE, {'version': schedule['version'], 'rooms': room_files,
+                                            'days': [day['index'] for day in days]})
+        build_dir.chmod(0o755)
+        os.replace(build_dir, target)
+    except OSError:
+        # another process built the same version in the meantime
+        shutil.rmtree(build_dir, ignore_errors=True)
+        if not (target / INDEX_FILE).exists():
+            raise
+
+
+def read_slice(directory: Path, rooms: Optional[list[str]] = None, day: Optional[int] = None) -> dict[str, Any]:
+    """
+    Returns the part of the schedule held in the given rooms (all if empty) on the given day (all if None).
+    """
+    index = read_json(directory / INDEX_FILE)
+    if not rooms:
+        data = read_json(directory / (f'day-{day}.json' if day in index['days'] else ALL_FILE))
+        days = data['schedule']['conference']['days']
+    else:
+        data, days = None, []
+        for room in rooms:
+            if room not in index['rooms']:
+                continue
+            room_slice = read_json(directory / index['rooms'][room])
+            if data is None:
+                data, days = room_slice, room_slice['schedule']['conference']['days']
+                continue
+            for merged_day, room_day in zip(days, room_slice['schedule']['conference']['days']):
+                merged_day['rooms'].update(room_day['rooms'])
+        if data is None:
+            data = make_slice({'version': index['version'], 'conference': {}}, [])
+    data['schedule']['conference']['days'] = [d for d in days if day is None or d['index'] == day]
+    return data
+
+
+def read_events(directory: Path) -> dict[str, tuple[int, dict[str, Any]]]:
+    return {
+        event['guid']: (day['index'], event)
+        for day in read_json(directory / ALL_FILE)['schedule']['conference']['days']
+        for room_events in day['rooms'].values()
+        for event in room_events
+    }
+
+
+def diff_slices(old: Path, new: Path) -> dict[str, list[dict[str, Any]]]:
+    """
+    Returns the events added or changed (with the index of their day and their previous room) and the events
+    removed between two versions.
+    """
+    old_events, new_events = read_events(old), read_events(new)
+    return {
+        'upserts': [
+            {'day': day, 'event': event, 'previous_room': old_events[guid][1]['room'] if guid in old_events else None}
+            for guid, (day, event) in new_events.items()
+            if old_events.get(guid) != (day, event)
+        ],
+        'removed': [{'guid': guid, 'room': event['room']} for guid, (_day, event) in old_events.items()
+                    if guid not in new_events],
+    }
+
+
+def filter_delta(delta: dict[str, list[dict[str, Any]]], rooms: list[str]) -> dict[str, list[dict[str, Any]]]:
+    """
+    The part of a delta visible in the given rooms (all if empty), events moved out of the rooms count as removed.
+    """
+    if not rooms:
+        return delta
+    return {
+        'upserts': [upsert for upsert in delta['upserts'] if upsert['event']['room'] in rooms],
+        'removed': [removed for removed in delta['removed'] if removed['room'] in rooms] + [
+            {'guid': upsert['event']['guid'], 'room': upsert['previous_room']}
+            for upsert in delta['upserts']
+            if upsert['event']['room'] not in rooms and upsert['previous_room'] in rooms
+        ],
+    }
@@ -1,19 +1,59 @@
-import channels.layers
-from asgiref.sync import async_to_sync
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from c3ds.core.models import BaseView, Display
-
+from functools import partial
 
-channel_layer = channels.layers.get_channel_layer()
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from c3ds.core.groups import regroup_display
+from c3ds.core.media import media_pipeline, needs_derivatives
+from c3ds.core.models import BaseView, Display, ImageFile, Playlist, PlaylistEntry, VideoFile
+from c3ds.core.reload import reload_coalescer
 
 
 @receiver(post_save, sender=Display)
 def display_saved_handler(sender: Display, instance: Display, created: bool, updated_fields=None, **kwargs):
-    instance.reload()
+    instance.invalidate_page_cache()
+    if instance.needs_regroup():
+        transaction.on_commit(partial(regroup_display, instance.slug))
+    if instance.needs_reload():
+        reload_coalescer.add([instance.slug])
+    instance.mark_reloaded()
+
+@receiver(post_delete, sender=Display)
+def display_deleted_handler(sender: Display, instance: Display, **kwargs):
+    instance.invalidate_page_cache()
 
 @receiver(post_save)
 def view_saved_handler(sender: BaseView, instance: BaseView = None, created: bool = None, updated_fields=None, **kwargs):
     if not isinstance(instance, BaseView):
         return
-    instance.displays.reload()
+    instance.displays.invalidate_page_cache()
+    reload_coalescer.add(instance.displays.values_list('slug', flat=True))
+    playlists = Playlist.objects.filter(views=instance).distinct()
+    if playlists.exists():
+        playlists.invalidate_manifest()
+        reload_coalescer.add(Display.objects.filter(playlist__in=playlists).values_list('slug', flat=True))
+
+@receiver(post_save, sender=Playlist)
+def playlist_saved_handler(sender: Playlist, instance: Playlist, **kwargs):
+    instance.invalidate_manifest()
+    instance.displays.invalidate_page_cache()
+    reload_coalescer.add(instance.displays.values_list('slug', flat=True))
+
+@receiver([post_save, post_delete], sender=PlaylistEntry)
+def playlist_entry_changed_handler(sender: PlaylistEntry, instance: PlaylistEntry, **kwargs):
+    Playlist.objects.filter(pk=instance.playlist_id).invalidate_manifest()
+    reload_coalescer.add(Display.objects.filter(playlist_id=instance.playlist_id).values_list('slug', flat=True))
+
+@receiver(post_save, sender=ImageFile)
+def image_saved_handler(sender: ImageFile, instance: ImageFile, raw: bool = False, **kwargs):
+    Display.objects.filter(static_view__image_views__image=instance).invalidate_page_cache()
+    Playlist.objects.filter(views__image_views__image=instance).invalidate_manifest()
+    if not raw and needs_derivatives(instance):
+        media_pipeline.submit(instance)
+
+@receiver(post_save, sender=VideoFile)
+def video_saved_handler(sender: VideoFile, instance: VideoFile, raw: bool = False, **kwargs):
+    Display.objects.filter(static_view__video_views__video=instance).invalidate_page_cache()
+    Playlist.objects.filter(views__video_views__video=instance).invalidate_manifest()
+    if not raw and needs_derivatives(instance):
+        media_pipeline.submit(instance)
@@ -6,19 +6,19 @@ declare const window: Window & typeof globalThis & {
 }
 
 (() => {
-  const container = document.getElementById('clock')
-  if (container === null || container.dataset['dayZero'] === undefined) return
-  const dayElement = container.querySelector('p span')
-  const timeElement = container.querySelector('p:last-child')
-  const offsetElement = document.getElementById('ntp-time-offset')
-  const latencyElement = document.getElementById('ntp-latency')
-  if (dayElement === null || timeElement === null) return;
-  const dayZero = moment(container.dataset['dayZero'])
-
   const update_time = () => {
     const now = getCurrentTime()
-    dayElement.textContent = now.diff(dayZero, 'days').toString()
-    timeElement.textContent = now.format('HH:mm')
+    // look the elements up on every tick, the view can be swapped in place
+    const container = document.getElementById('clock')
+    const dayElement = container?.querySelector('p span')
+    const timeElement = container?.querySelector('p:last-child')
+    const offsetElement = document.getElementById('ntp-time-offset')
+    const latencyElement = document.getElementById('ntp-latency')
+
+    if (container?.dataset['dayZero'] !== undefined && dayElement && timeElement) {
+      dayElement.textContent = now.diff(moment(container.dataset['dayZero']), 'days').toString()
+      timeElement.textContent = now.format('HH:mm')
+    }
 
     if (offsetElement !== null) offsetElement.textContent = `Time offset: ${window.ntp?.offset?.toFixed(3)}ms`
     if (latencyElement !== null) latencyElement.textContent = `Latency: ${window.ntp?.latency?.toFixed(3)}ms`
@@ -0,0 +1,77 @@
+import {ReceivedWebSocketCommand, WebSocketClient} from "./websocket.ts";
+import type {PlaylistPlayer} from "./playlist.ts";
+
+export interface UpdateViewCommand extends ReceivedWebSocketCommand {
+  cmd: 'updateView'
+  build: string
+  html: string
+  delay?: number
+  rollout?: string
+}
+
+declare const window: Window & typeof globalThis & {
+ playlist?: PlaylistPlayer
+}
+
+export interface swapCallback { (): void }
+
+export class HotSwapClient {
+  ws: WebSocketClient
+  beforeSwap: swapCallback
+  afterSwap: swapCallback
+
+  constructor(webSocketClient: WebSocketClient, beforeSwap: swapCallback, afterSwap: swapCallback) {
+    this.ws = webSocketClient
+    this.beforeSwap = beforeSwap
+    this.afterSwap = afterSwap
+    this.ws.registerCommand('updateView', (cmd) => {
+      this.onUpdateView(cmd as UpdateViewCommand)
+    })
+  }
+
+  onUpdateView(cmd: UpdateViewCommand) {
+    const page = new DOMParser().parseFromString(cmd.html, 'text/html')
+    if (cmd.build !== document.body.dataset['build']) {
+      // the page needs other scripts or styles than the ones we have loaded
+      this.reload(cmd)
+      return
+    }
+
+    const manifestUrl = page.querySelector<HTMLElement>('div.playlist-container')?.dataset['manifestUrl']
+    if (manifestUrl !== undefined && window.playlist?.manifestUrl === manifestUrl) {
+      console.log('updating playlist in place')
+      window.playlist.update()
+      if (cmd.rollout !== undefined) this.ws.acknowledgeRollout(cmd.rollout)
+      return
+    }
+
+    if (!document.body.hasAttribute('data-hot-swap') || !page.body.hasAttribute('data-hot-swap')) {
+      this.reload(cmd)
+      return
+    }
+    console.log('swapping view in place')
+    this.swap(page)
+    if (cmd.rollout !== undefined) this.ws.acknowledgeRollout(cmd.rollout)
+  }
+
+  swap(page: Document) {
+    this.beforeSwap()
+    document.title = page.title
+    for (const attribute of Array.from(document.body.attributes)) {
+      document.body.removeAttribute(attribute.name)
+    }
+    for (const attribute of Array.from(page.body.attributes)) {
+      document.body.setAttribute(attribute.name, attribute.value)
+    }
+    document.body.replaceChildren(...Array.from(page.body.childNodes).map((node) => document.importNode(node, true)))
+    this.afterSwap()
+  }
+
+  reload(cmd: UpdateViewCommand) {
+    const timeout = cmd.delay || 0
+    console.log(`can't swap view in place, reloading in ${timeout/1000} seconds!`)
+    window.setTimeout(() => {
+      this.ws.reloadPage(cmd.rollout)
+    }, timeout)
+  }
+}
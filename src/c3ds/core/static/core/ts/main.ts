@@ -3,12 +3,15 @@ import 'video.js/dist/video-js.css';
 import {WebSocketClient} from "./websocket.ts";
 import {RemoteShellClient} from "./remote_shell.ts";
 import {NTPClient} from "./ntp.ts";
+import {HotSwapClient} from "./hot_swap.ts";
+import {AssetPrefetcher} from "./prefetch.ts";
 
 const displaySlug = document.querySelector('body')?.dataset['displaySlug']
 
 // Video Playback
-const video_container = document.getElementById('video')
-if (video_container !== null) {
+const initVideo = () => {
+  const video_container = document.getElementById('video')
+  if (video_container === null) return
   const video_src = video_container.dataset['src']
   const video_type = video_container.dataset['type']
   if (video_src !== undefined && video_type !== undefined) {
@@ -25,8 +28,17 @@ if (video_container !== null) {
   }
 }
 
+const disposeVideo = () => {
+  for (const player of Object.values(videojs.getPlayers())) {
+    player?.dispose()
+  }
+}
+
+initVideo()
+
 declare const window: Window & typeof globalThis & {
  ntp?: NTPClient
+ ws?: WebSocketClient
 }
 
 
@@ -34,7 +46,10 @@ declare const window: Window & typeof globalThis & {
 if (displaySlug !== undefined) {
   console.log('Initializing Websocket Client')
   const ws = new WebSocketClient(displaySlug, true)
+  window.ws = ws
   new RemoteShellClient(ws)
+  new HotSwapClient(ws, disposeVideo, initVideo)
+  new AssetPrefetcher(ws, document.body.dataset['assetManifestUrl'])
   const ntp = new NTPClient(ws)
   window.ntp = ntp
   window.setTimeout(() =>{
@@ -24,11 +24,20 @@ export interface NTPReport extends WebSocketCommand{
 }
 
 
+interface NTPSample {
+  offset: number
+  latency: number
+}
+
+// number of recent exchanges the offset is picked from
+const MAX_SAMPLES = 8
+
 export class NTPClient {
   ws: WebSocketClient
   syncInterval: number | null = null
   offset: number | null = null
   latency: number | null = null
+  samples: NTPSample[] = []
 
   constructor(webSocketClient: WebSocketClient) {
     this.ws = webSocketClient
@@ -66,18 +75,26 @@ export class NTPClient {
     const serverTime = moment(response.serverTime)
     const roundTripTime = response.receiveTimestampe - response.clientSendTimestamp
     const offset = Date.now() - (response.serverTime + roundTripTime / 2 + performance.now() - response.receiveTimestampe)
-    this.latency = roundTripTime
-    this.offset = offset
+    this.addSample({offset, latency: roundTripTime})
 
     console.log(`Received NTP Response after ${roundTripTime}ms with server time ${serverTime.toISOString(true)} (an offset of ${offset}ms)`)
     const ntpReport: NTPReport = {
       cmd: "NTPReport",
-      ntpOffset: offset,
-      ntpLatency: roundTripTime,
+      ntpOffset: this.offset!,
+      ntpLatency: this.latency!,
     }
     this.ws.send(ntpReport)
   }
 
+  addSample(sample: NTPSample) {
+    // the exchange with the lowest round trip time has the least asymmetric delay, so its offset is the most exact
+    this.samples.push(sample)
+    if (this.samples.length > MAX_SAMPLES) this.samples.shift()
+    const best = this.samples.reduce((a, b) => a.latency <= b.latency ? a : b)
+    this.offset = best.offset
+    this.latency = best.latency
+  }
+
   getAdjustedTime(): Moment {
     const now = moment()
     if (this.offset != null) {
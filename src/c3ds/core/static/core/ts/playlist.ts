@@ -0,0 +1,247 @@
+import axios from 'axios'
+import {ReceivedWebSocketCommand, WebSocketClient} from "./websocket.ts";
+import {NTPClient} from "./ntp.ts";
+
+export interface PlaylistAsset {
+  url: string
+  type: string
+}
+
+export interface PlaylistEntry {
+  id: number
+  view: number
+  slug: string
+  type: string
+  url: string
+  template: string
+  vue_module: string
+  layout_mode: string
+  duration: number | null
+  until_ended: boolean
+  assets: PlaylistAsset[]
+  changed: string
+}
+
+export interface PlaylistManifest {
+  playlist: string
+  version: string
+  epoch: number
+  default_duration: number
+  entries: PlaylistEntry[]
+}
+
+export interface PlaylistAdvanceCommand extends ReceivedWebSocketCommand {
+  cmd: 'advance'
+  playlist: string
+  version: string
+  epoch: number
+  index: number
+  at: number
+}
+
+declare const window: Window & typeof globalThis & {
+ playlist?: PlaylistPlayer
+ ntp?: NTPClient
+ ws?: WebSocketClient
+}
+
+// used if an entry should play until its video ended, but there is no video to wait for
+const FALLBACK_DURATION = 10
+
+export class PlaylistPlayer {
+  container: HTMLElement
+  manifestUrl: string
+  manifest: PlaylistManifest | null = null
+  frames: {[id: number]: HTMLIFrameElement} = {}
+  current: number = -1
+  timer: number | null = null
+  synchronized: boolean = false
+  watchdog: number | null = null
+
+  constructor(container: HTMLElement, manifestUrl: string) {
+    this.container = container
+    this.manifestUrl = manifestUrl
+  }
+
+  async load() {
+    const resp = await axios.get(this.manifestUrl)
+    this.manifest = resp.data as PlaylistManifest
+    console.log('playlist %s version %s loaded', this.manifest.playlist, this.manifest.version)
+  }
+
+  async update() {
+    // reload the manifest and drop the frames of all entries that changed, the others keep playing
+    const previous = this.entries
+    await this.load()
+    const entries: {[id: number]: string} = {}
+    for (const entry of this.entries) entries[entry.id] = JSON.stringify(entry)
+    for (const entry of previous) {
+      if (entries[entry.id] !== JSON.stringify(entry) && this.frames[entry.id] !== undefined) {
+        this.frames[entry.id].remove()
+        delete this.frames[entry.id]
+      }
+    }
+    for (const frame of Object.values(this.frames)) frame.classList.add('invisible')
+    const index = this.synchronized ? this.slotAt(this.serverTime()) : Math.max(this.current, 0)
+    this.current = -1
+    this.show(index)
+    if (!this.synchronized) this.scheduleNext()
+  }
+
+  get entries(): PlaylistEntry[] {
+    return this.manifest?.entries || []
+  }
+
+  frameFor(entry: PlaylistEntry): HTMLIFrameElement {
+    // every entry is loaded only once and kept, switching entries only toggles the visibility
+    if (this.frames[entry.id] === undefined) {
+      const frame = document.createElement('iframe')
+      // the views pick image and video sizes for the resolution of the display
+      const scale = window.devicePixelRatio || 1
+      frame.src = `${entry.url}?width=${Math.round(window.innerWidth * scale)}&height=${Math.round(window.innerHeight * scale)}`
+      frame.className = 'absolute inset-0 w-full h-full border-0 invisible'
+      this.container.appendChild(frame)
+      this.frames[entry.id] = frame
+    }
+    return this.frames[entry.id]
+  }
+
+  getVideo(frame: HTMLIFrameElement): HTMLVideoElement | null {
+    return frame.contentDocument?.querySelector('video') || null
+  }
+
+  show(index: number) {
+    if (this.entries.length === 0) return
+    index = index % this.entries.length
+    const entry = this.entries[index]
+    const previous = this.current >= 0 ? this.entries[this.current] : undefined
+    const frame = this.frameFor(entry)
+
+    if (previous !== undefined && previous.id !== entry.id) {
+      const previousFrame = this.frameFor(previous)
+      previousFrame.classList.add('invisible')
+      this.getVideo(previousFrame)?.pause()
+    }
+    frame.classList.remove('invisible')
+    this.current = index
+    this.restartVideo(frame)
+
+    // load the next entry in the background so it is ready when we switch
+    this.frameFor(this.entries[(index + 1) % this.entries.length])
+  }
+
+  restartVideo(frame: HTMLIFrameElement) {
+    const video = this.getVideo(frame)
+    if (video === null) return
+    video.currentTime = 0
+    video.play()?.catch(() => {
+      video.muted = true
+      video.play()
+    })
+  }
+
+  scheduleNext() {
+    if (this.timer !== null) window.clearTimeout(this.timer)
+    const entry = this.entries[this.current]
+    if (entry === undefined) return
+
+    if (!entry.until_ended) {
+      this.timer = window.setTimeout(() => this.advance(), (entry.duration || FALLBACK_DURATION) * 1000)
+      return
+    }
+
+    const frame = this.frameFor(entry)
+    const waitForVideo = () => {
+      const video = this.getVideo(frame)
+      if (video === null) {
+        this.timer = window.setTimeout(() => this.advance(), FALLBACK_DURATION * 1000)
+        return
+      }
+      video.loop = false
+      video.addEventListener('ended', () => this.advance(), {once: true})
+    }
+    if (frame.contentDocument?.readyState === 'complete') {
+      waitForVideo()
+    } else {
+      frame.addEventListener('load', waitForVideo, {once: true})
+    }
+  }
+
+  advance() {
+    this.show(this.current + 1)
+    this.scheduleNext()
+  }
+
+  serverTime(): number {
+    // the NTP offset is local minus server time
+    return Date.now() - (window.ntp?.offset || 0)
+  }
+
+  clockDurations(): number[] {
+    // must match c3ds.core.playlist_clock.PlaylistClock
+    return this.entries.map((entry) => (entry.duration || this.manifest!.default_duration) * 1000)
+  }
+
+  slotAt(timestamp: number): number {
+    const durations = this.clockDurations()
+    const cycle = durations.reduce((a, b) => a + b, 0)
+    if (cycle === 0) return 0
+    let position = (timestamp - this.manifest!.epoch) % cycle
+    if (position < 0) position += cycle
+    for (let index = 0; index < durations.length; index++) {
+      if (position < durations[index]) return index
+      position -= durations[index]
+    }
+    return 0
+  }
+
+  followClock(ws: WebSocketClient) {
+    ws.registerCommand('advance', (cmd) => {
+      this.onAdvance(cmd as PlaylistAdvanceCommand)
+    })
+  }
+
+  async onAdvance(cmd: PlaylistAdvanceCommand) {
+    if (this.manifest === null || cmd.version !== this.manifest.version) {
+      await this.load()
+    }
+    this.synchronized = true
+    if (this.timer !== null) window.clearTimeout(this.timer)
+    const delay = cmd.at - this.serverTime()
+    this.timer = window.setTimeout(() => {
+      this.show(cmd.index)
+    }, Math.max(delay, 0))
+    this.resetWatchdog()
+  }
+
+  resetWatchdog() {
+    // fall back to local timers if the server stops publishing the clock
+    if (this.watchdog !== null) window.clearTimeout(this.watchdog)
+    const longest = Math.max(...this.clockDurations(), 0)
+    this.watchdog = window.setTimeout(() => {
+      console.log('playlist clock stopped, continuing with local timers')
+      this.synchronized = false
+      this.scheduleNext()
+    }, longest + 5000)
+  }
+
+  async start() {
+    await this.load()
+    if (window.ws !== undefined) {
+      // start at the slot all other displays show right now and wait for the server clock
+      this.followClock(window.ws)
+      this.show(this.slotAt(this.serverTime()))
+      this.resetWatchdog()
+    } else {
+      this.show(0)
+      this.scheduleNext()
+    }
+  }
+}
+
+const playlistContainer: HTMLElement | null = document.querySelector('div.playlist-container')
+if (playlistContainer !== null && playlistContainer.dataset['manifestUrl'] !== undefined) {
+  const player = new PlaylistPlayer(playlistContainer, playlistContainer.dataset['manifestUrl'])
+  window.playlist = player
+  player.start()
+}
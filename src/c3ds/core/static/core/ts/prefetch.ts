@@ -0,0 +1,118 @@
+import axios from 'axios'
+import {ReceivedWebSocketCommand, WebSocketClient, WebSocketCommand} from "./websocket.ts";
+
+export interface AssetSource {
+  url: string
+  mime: string | null
+  size: number | null
+  hash: string | null
+}
+
+export interface Asset extends AssetSource {
+  type: string
+  sources?: AssetSource[]
+}
+
+export interface AssetManifest {
+  display: string
+  version: string
+  size: number
+  assets: Asset[]
+}
+
+export interface PrefetchCommand extends ReceivedWebSocketCommand {
+  cmd: 'prefetch'
+  version: string
+  assets: Asset[]
+}
+
+export interface PrefetchReport extends WebSocketCommand {
+  cmd: 'prefetchReport'
+  version: string
+  total: number
+  cached: number
+  bytes: number
+  failed: string[]
+}
+
+// give the content of the page a head start before downloading the media of what comes next
+const STARTUP_DELAY = 10 * 1000
+
+const supportedImageTypes: {[mime: string]: boolean} = {}
+
+const supportsImageType = (mime: string | null): boolean => {
+  if (mime === null) return false
+  if (supportedImageTypes[mime] === undefined) {
+    const canvas = document.createElement('canvas')
+    canvas.width = canvas.height = 1
+    supportedImageTypes[mime] = canvas.toDataURL(mime).startsWith(`data:${mime}`)
+  }
+  return supportedImageTypes[mime]
+}
+
+export class AssetPrefetcher {
+  ws: WebSocketClient
+  version: string | null = null
+
+  constructor(webSocketClient: WebSocketClient, manifestUrl?: string) {
+    this.ws = webSocketClient
+    this.ws.registerCommand('prefetch', (cmd) => {
+      const prefetch = cmd as PrefetchCommand
+      this.prefetch(prefetch.version, prefetch.assets)
+    })
+    if (manifestUrl !== undefined) {
+      window.setTimeout(() => {
+        this.loadManifest(manifestUrl)
+      }, STARTUP_DELAY)
+    }
+  }
+
+  async loadManifest(manifestUrl: string) {
+    try {
+      const manifest = (await axios.get(manifestUrl)).data as AssetManifest
+      await this.prefetch(manifest.version, manifest.assets)
+    } catch (e) {
+      console.error('loading asset manifest failed', e)
+    }
+  }
+
+  selectSource(asset: Asset): AssetSource {
+    // the same choice the browser makes for a <picture>
+    return asset.sources?.find((source) => supportsImageType(source.mime)) || asset
+  }
+
+  async download(source: AssetSource): Promise<number> {
+    // media URLs are content addressed and cached as immutable, the HTTP cache keeps them for the page
+    const resp = await fetch(source.url, {cache: 'force-cache'})
+    if (!resp.ok || resp.body === null) throw Error(`HTTP ${resp.status}`)
+    // read the body in chunks, videos must not be held in memory
+    const reader = resp.body.getReader()
+    let bytes = 0
+    for (;;) {
+      const {done, value} = await reader.read()
+      if (done) break
+      bytes += value.byteLength
+    }
+    if (source.size !== null && bytes !== source.size) throw Error(`expected ${source.size} bytes, got ${bytes}`)
+    return bytes
+  }
+
+  async prefetch(version: string, assets: Asset[]) {
+    this.version = version
+    const report: PrefetchReport = {cmd: 'prefetchReport', version, total: assets.length, cached: 0, bytes: 0, failed: []}
+    // one download at a time, the venue network is shared with everything else
+    for (const asset of assets) {
+      if (this.version !== version) return  // superseded by a newer prefetch
+      const source = this.selectSource(asset)
+      try {
+        report.bytes += await this.download(source)
+        report.cached += 1
+      } catch (e) {
+        console.error('prefetching %s failed', source.url, e)
+        report.failed.push(source.url)
+      }
+    }
+    console.log('prefetched %d of %d assets (%d bytes)', report.cached, report.total, report.bytes)
+    this.ws.send(report)
+  }
+}
@@ -2,6 +2,7 @@ import {WebSocketCommand, WebSocketClient} from "./websocket.ts";
 
 export interface RemoteShellCommand extends WebSocketCommand{
   cmd: string;
+  route?: string;
   id?: number;
   payload?: string;
   displaySlug?: string;
@@ -9,6 +10,7 @@ export interface RemoteShellCommand extends WebSocketCommand{
 
 export interface RemoteShellResult extends WebSocketCommand {
     cmd: 'rsRES',
+    route?: string;
     id: number;
     reqCmd: string,
     error: string | null;
@@ -17,6 +19,18 @@ export interface RemoteShellResult extends WebSocketCommand {
     pEnd?: number | null;
 }
 
+// part of a result too large for one frame, the shell joins the data of all chunks and parses it
+export interface RemoteShellResultChunk extends WebSocketCommand {
+    cmd: 'rsRES',
+    route?: string;
+    id: number;
+    chunk: number;
+    chunks: number;
+    data: string;
+}
+
+export const RESULT_CHUNK_SIZE = 64 * 1024
+
 
 export class RemoteShellClient {
   ws: WebSocketClient
@@ -33,8 +47,10 @@ export class RemoteShellClient {
       return;
     }
 
+    // the server routes results by the prefix '{"cmd":"rsRES","route":"…"', so these two keys come first
     let res: RemoteShellResult = {
       cmd: "rsRES",
+      route: cmd.route,
       reqCmd: cmd.payload,
       id: cmd.id,
       pStart: performance.now(),
@@ -57,6 +73,29 @@ export class RemoteShellClient {
 
     res.pEnd = performance.now();
 
-    this.ws.ws?.send(JSON.stringify(res));
+    let text: string
+    try {
+      text = JSON.stringify(res)
+    } catch (e: any) {
+      res.result = null
+      res.error = `result not serializable: ${e}`
+      text = JSON.stringify(res)
+    }
+    if (text.length <= RESULT_CHUNK_SIZE) {
+      this.ws.send_raw(text)
+      return
+    }
+    const chunks = Math.ceil(text.length / RESULT_CHUNK_SIZE)
+    for (let chunk = 0; chunk < chunks; chunk++) {
+      const part: RemoteShellResultChunk = {
+        cmd: 'rsRES',
+        route: cmd.route,
+        id: cmd.id,
+        chunk,
+        chunks,
+        data: text.slice(chunk * RESULT_CHUNK_SIZE, (chunk + 1) * RESULT_CHUNK_SIZE),
+      }
+      this.ws.send_raw(JSON.stringify(part))
+    }
   }
 }
\ No newline at end of file
@@ -1,10 +1,20 @@
 import {ComponentPublicInstance, createApp} from 'vue'
 import ScheduleView from "../components/ScheduleView.vue";
 import axios from 'axios'
-import {ScheduleJson, Schedule} from "../../../../static/ts/c3voc.ts";
+import {ScheduleJson, Schedule, Event} from "../../../../static/ts/c3voc.ts";
+import {ReceivedWebSocketCommand, WebSocketClient} from "./websocket.ts";
 
 declare const window: Window & typeof globalThis & {
  scheduleView?: ComponentPublicInstance<typeof ScheduleView>
+ ws?: WebSocketClient
+}
+
+export interface ScheduleDeltaCommand extends ReceivedWebSocketCommand {
+  cmd: 'scheduleDelta'
+  version: string
+  previous: string | null
+  upserts: {day: number, event: Event}[]
+  removed: {guid: string, room: string}[]
 }
 
 const scheduleContainer: HTMLElement|null = document.querySelector('div.schedule-container')
@@ -34,6 +44,39 @@ if (scheduleContainer !== null) {
       }
     })
   }
+  const apply_delta = (delta: ScheduleDeltaCommand) => {
+    if (current_schedule === null || delta.previous === null || current_schedule.version !== delta.previous) {
+      // we missed a version or the change was too large for a delta
+      load_data()
+      return
+    }
+    const changed = new Set([...delta.removed.map((r) => r.guid), ...delta.upserts.map((u) => u.event.guid)])
+    const schedule: Schedule = JSON.parse(JSON.stringify(current_schedule))
+    for (const day of schedule.conference.days) {
+      for (const room in day.rooms) {
+        day.rooms[room] = day.rooms[room].filter((event) => !changed.has(event.guid))
+      }
+    }
+    for (const upsert of delta.upserts) {
+      const day = schedule.conference.days.find((day) => day.index === upsert.day)
+      if (day === undefined) {
+        load_data()
+        return
+      }
+      const room = upsert.event.room
+      if (day.rooms[room] === undefined) day.rooms[room] = []
+      day.rooms[room].push(upsert.event)
+      day.rooms[room].sort((a, b) => a.date.localeCompare(b.date))
+    }
+    schedule.version = delta.version
+    console.log('schedule delta %s → %s applied', delta.previous, delta.version)
+    current_schedule = schedule
+    scheduleView.schedule = current_schedule
+  }
+
   load_data()
   window.setInterval(load_data, 5*60*1000)
+  window.ws?.registerCommand('scheduleDelta', (cmd) => {
+    apply_delta(cmd as ScheduleDeltaCommand)
+  })
 }
@@ -8,8 +8,18 @@ export interface ReceivedWebSocketCommand extends WebSocketCommand {
 
 export interface ReloadWebSocketCommand extends ReceivedWebSocketCommand {
   delayed?: boolean
+  delay?: number
+  rollout?: string
 }
 
+export interface RolloutAckCommand extends WebSocketCommand {
+  cmd: 'reloadAck'
+  rollout: string
+}
+
+// the rollout of a reload, acknowledged by the reloaded page
+const ROLLOUT_STORAGE_KEY = 'c3ds-rollout'
+
 export interface websocketMessageCallback { (cmd: ReceivedWebSocketCommand): void }
 
 export class WebSocketClient {
@@ -17,6 +27,8 @@ export class WebSocketClient {
   ws: WebSocket | null = null
   heartbeatInterval: number | null = null
   unansweredPings: number = 0
+  pingSent: number | null = null
+  lastRtt: number | null = null
   callbacks: {[key: string]: websocketMessageCallback} = Object()
 
   constructor(displaySlug: string, autoconnect: boolean) {
@@ -36,6 +48,11 @@ export class WebSocketClient {
       console.log('opening websocket');
       this.unansweredPings = 0
       this.startTimers()
+      const rollout = window.sessionStorage.getItem(ROLLOUT_STORAGE_KEY)
+      if (rollout !== null) {
+        window.sessionStorage.removeItem(ROLLOUT_STORAGE_KEY)
+        this.acknowledgeRollout(rollout)
+      }
     }
     this.ws.onmessage = (e) => {
       const timeReceived = performance.now()
@@ -46,14 +63,16 @@ export class WebSocketClient {
       switch (data?.cmd) {
         case 'reload':
           if ((data as ReloadWebSocketCommand).delayed) {
-            const timeout = 20 * 1000 * Math.random()
+            // the server assigns every display its own slot in the reload window, older commands have none
+            const delay = (data as ReloadWebSocketCommand).delay
+            const timeout = delay !== undefined ? delay : 20 * 1000 * Math.random()
             console.log(`received reload command, reloading in ${timeout/1000} seconds!`)
             window.setTimeout(() => {
-              window.location.reload()
+              this.reloadPage((data as ReloadWebSocketCommand).rollout)
             }, timeout)
           } else {
             console.log('received reload command, reloading NOW!')
-            window.location.reload()
+            this.reloadPage((data as ReloadWebSocketCommand).rollout)
           }
           break;
 
@@ -98,13 +117,28 @@ export class WebSocketClient {
     console.log('sending ping')
     this.unansweredPings += 1
     if (this.unansweredPings > 30) window.location.reload()  // reload if we didn't get a pong for 300 sec
+    this.pingSent = performance.now()
+    // the round trip time of the previous ping is reported with the next one
     this.ws?.send(JSON.stringify({
-      cmd: 'ping'
+      cmd: 'ping',
+      ...(this.lastRtt !== null && {rtt: this.lastRtt}),
     }))
   }
 
   onPingReply() {
     this.unansweredPings = 0
+    if (this.pingSent !== null) this.lastRtt = performance.now() - this.pingSent
+    this.pingSent = null
+  }
+
+  reloadPage(rollout?: string) {
+    if (rollout !== undefined) window.sessionStorage.setItem(ROLLOUT_STORAGE_KEY, rollout)
+    window.location.reload()
+  }
+
+  acknowledgeRollout(rollout: string) {
+    const ack: RolloutAckCommand = {cmd: 'reloadAck', rollout: rollout}
+    this.send(ack)
   }
 
   send_raw(data: (string | ArrayBufferLike | Blob | ArrayBufferView)) {
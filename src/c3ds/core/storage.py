@@ -0,0 +1,62 @@
+import hashlib
+import os
+import tempfile
+from contextlib import suppress
+from pathlib import Path
+
+from django.core.files.storage import FileSystemStorage
+
+HASHED_DIRECTORY = 'hashed'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores files under the SHA-256 of their content in the media root. Identical files are stored once and the
+    content behind a name never changes, so the files are served with immutable caching (see c3ds.asgi).
+    """
+
+    def hashed_name(self, digest: str, name: str) -> str:
+        return f'{HASHED_DIRECTORY}/{digest[:2]}/{digest}{Path(name).suffix.lower()}'
+
+    def get_available_name(self, name, max_length=None):
+        # the final name is only known once the content is hashed in _save
+        return name
+
+    def _save(self, name, content):
+        directory = Path(self.path(HASHED_DIRECTORY))
+        directory.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=directory, prefix='.upload.', delete=False) as fp:
+            try:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    fp.write(chunk)
+                fp.close()
+                return self.adopt(Path(fp.name), digest.hexdigest(), name)
+            finally:
+                with suppress(FileNotFoundError):
+                    os.unlink(fp.name)
+
+    def adopt(self, path: Path, digest: str, name: str) -> str:
+        """
+        Moves a file written next to the storage into it under its hash, returns the name it is stored under.
+        """
+        name = self.hashed_name(digest, name)
+        target = Path(self.path(name))
+        if target.exists():
+            # deduplicated, the file is already stored
+            path.unlink()
+            return name
+        target.parent.mkdir(exist_ok=True)
+        os.chmod(path, self.file_permissions_mode or 0o644)
+        os.replace(path, target)
+        return name
+
+
+content_storage = ContentAddressedStorage()
+
+
+def get_content_storage() -> ContentAddressedStorage:
+    return content_storage
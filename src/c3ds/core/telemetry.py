@@ -0,0 +1,217 @@
+import asyncio
+import datetime
+import logging
+import time
+from typing import Any, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from c3ds.core.health import CURRENT_RESOLUTION, RETENTION, DisplayHistory, FleetHistory
+from c3ds.core.models import Display
+from c3ds.core.presence import WORKER
+
+logger = logging.getLogger(__name__)
+
+FLEET_WORKERS_CACHE_KEY = 'fleet-history-workers'
+
+
+def fleet_history_cache_key(worker: str) -> str:
+    return f'fleet-history-{worker}'
+
+
+def current_history_cache_key(slug: str) -> str:
+    return f'{slug}-history-current'
+
+
+class TelemetryStore:
+    """
+    Buffers per display telemetry (last heartbeat, NTP offset) in process and writes it to the cache in batches,
+    so cache writes scale with the flush interval and not with the number of pings.
+
+    Samples (ping RTT, NTP offset and latency, connects and disconnects) are added to the history of the display and
+    to the fleet history of this worker, which keeps histograms so fleet wide percentiles are read without the
+    samples of every display.
+
+    The history of a display is a few KiB, so it is not rewritten with every flush: the samples go into the current
+    bucket of the finest resolution, a value of a few bytes per display, and only a completed bucket is added to the
+    history. That's one read and write of the history per display and bucket interval (5 minutes).
+    """
+
+    def __init__(self):
+        self._pending: dict[str, Any] = {}
+        # slug -> the bucket still filling up, completed buckets waiting to be added to the history
+        self._current: dict[str, DisplayHistory] = {}
+        self._completed: dict[str, list[DisplayHistory]] = {}
+        self._changed: set[str] = set()
+        self._fleet_changed = False
+        self.fleet_history = FleetHistory()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    @property
+    def flush_interval(self) -> float:
+        return settings.TELEMETRY_FLUSH_INTERVAL
+
+    def record_heartbeat(self, slug: str, timestamp: Optional[datetime.datetime] = None):
+        self._pending[Display.heartbeat_cache_key_for_slug(slug)] = timestamp or datetime.datetime.now(tz=datetime.UTC)
+        self.start()
+
+    def record_ntp_offset(self, slug: str, offset: float):
+        self._pending[Display.ntp_offset_cache_key_for_slug(slug)] = offset
+        self.start()
+
+    def record_prefetch_report(self, slug: str, report: dict[str, Any]):
+        self._pending[Display.prefetch_cache_key_for_slug(slug)] = report
+        self.start()
+
+    def record_sample(self, slug: str, metric: str, value: float):
+        timestamp = time.time()
+        self._get_current(slug, timestamp).add_sample(timestamp, metric, value)
+        self.fleet_history.add_sample(timestamp, metric, value)
+        self._fleet_changed = True
+        self.start()
+
+    def record_event(self, slug: str, event: str):
+        timestamp = time.time()
+        self._get_current(slug, timestamp).add_event(timestamp, event)
+        self.fleet_history.add_event(timestamp, event)
+        self._fleet_changed = True
+        self.start()
+
+    def _get_current(self, slug: str, timestamp: float) -> DisplayHistory:
+        (interval, _slots), = CURRENT_RESOLUTION
+        current = self._current.get(slug)
+        if current is not None and current.series[interval].starts[0] < int(timestamp) // interval * interval:
+            self._completed.setdefault(slug, []).append(current)
+            current = None
+        if current is None:
+            current = self._current[slug] = DisplayHistory(resolutions=CURRENT_RESOLUTION)
+        self._changed.add(slug)
+        return current
+
+    def start(self):
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # not running in an event loop (management commands, wsgi), write through instead
+            self.flush_sync()
+            return
+        self._flush_task = loop.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:  # NoQa
+                logger.exception('Flushing telemetry failed')
+
+    def _take_pending(self) -> dict[str, Any]:
+        pending, self._pending = self._pending, {}
+        return pending
+
+    def _take_completed(self) -> tuple[dict[str, list[DisplayHistory]], dict[str, Any], list[str]]:
+        """
+        Returns the completed buckets by slug, the current buckets to write and the keys of the current buckets that
+        were completed without a new one (the display went quiet or moved to another worker).
+        """
+        (interval, _slots), = CURRENT_RESOLUTION
+        ended = int(time.time()) // interval * interval
+        for slug, current in list(self._current.items()):
+            if current.series[interval].starts[0] < ended:
+                self._completed.setdefault(slug, []).append(self._current.pop(slug))
+                self._changed.add(slug)
+        completed, self._completed = self._completed, {}
+        changed, self._changed = self._changed, set()
+        current = {current_history_cache_key(slug): self._current[slug].to_bytes()
+                   for slug in changed if slug in self._current}
+        return completed, current, [current_history_cache_key(slug) for slug in changed if slug not in self._current]
+
+    @staticmethod
+    def _add_completed(completed: dict[str, list[DisplayHistory]], stored: dict[str, bytes]) -> dict[str, bytes]:
+        histories = {}
+        for slug, buckets in completed.items():
+            key = Display.history_cache_key_for_slug(slug)
+            history = DisplayHistory(stored.get(key))
+            for bucket in buckets:
+                history.add_history(bucket)
+            histories[key] = history.to_bytes()
+        return histories
+
+    def _fleet_values(self, workers: dict[str, float]) -> dict[str, Any]:
+        # every worker rewrites the index, an entry lost to concurrent writes is back after its next flush
+        now = time.time()
+        workers = {worker: written for worker, written in workers.items() if written > now - RETENTION}
+        workers[WORKER] = now
+        return {fleet_history_cache_key(WORKER): self.fleet_history.to_bytes(), FLEET_WORKERS_CACHE_KEY: workers}
+
+    async def flush(self):
+        pending = self._take_pending()
+        if pending:
+            await cache.aset_many(pending, None)
+        completed, current, quiet = self._take_completed()
+        histories = {}
+        if completed:
+            # displays rarely move between workers within a bucket interval, so the histories are read and written
+            # without locking
+            keys = [Display.history_cache_key_for_slug(slug) for slug in completed]
+            histories = self._add_completed(completed, await cache.aget_many(keys))
+        if self._fleet_changed:
+            self._fleet_changed = False
+            histories.update(self._fleet_values(await cache.aget(FLEET_WORKERS_CACHE_KEY) or {}))
+        if histories or current:
+            await cache.aset_many({**histories, **current}, RETENTION)
+        if quiet:
+            await cache.adelete_many(quiet)
+
+    def flush_sync(self):
+        pending = self._take_pending()
+        if pending:
+            cache.set_many(pending, None)
+        completed, current, quiet = self._take_completed()
+        histories = {}
+        if completed:
+            keys = [Display.history_cache_key_for_slug(slug) for slug in completed]
+            histories = self._add_completed(completed, cache.get_many(keys))
+        if self._fleet_changed:
+            self._fleet_changed = False
+            histories.update(self._fleet_values(cache.get(FLEET_WORKERS_CACHE_KEY) or {}))
+        if histories or current:
+            cache.set_many({**histories, **current}, RETENTION)
+        if quiet:
+            cache.delete_many(quiet)
+
+    def _get_many(self, keys: dict[str, str]) -> dict[str, Any]:
+        values = cache.get_many([key for key in keys if key not in self._pending])
+        values.update({key: self._pending[key] for key in keys if key in self._pending})
+        return {slug: values[key] for key, slug in keys.items() if key in values}
+
+    def get_heartbeats(self, slugs: Iterable[str]) -> dict[str, datetime.datetime]:
+        return self._get_many({Display.heartbeat_cache_key_for_slug(slug): slug for slug in slugs})
+
+    def get_ntp_offsets(self, slugs: Iterable[str]) -> dict[str, float]:
+        return self._get_many({Display.ntp_offset_cache_key_for_slug(slug): slug for slug in slugs})
+
+    def get_prefetch_reports(self, slugs: Iterable[str]) -> dict[str, dict[str, Any]]:
+        return self._get_many({Display.prefetch_cache_key_for_slug(slug): slug for slug in slugs})
+
+    def get_heartbeat(self, slug: str) -> Optional[datetime.datetime]:
+        return self.get_heartbeats([slug]).get(slug)
+
+    def get_history(self, slug: str) -> DisplayHistory:
+        key, current_key = Display.history_cache_key_for_slug(slug), current_history_cache_key(slug)
+        records = cache.get_many([key, current_key])
+        history = DisplayHistory(records.get(key))
+        if current_key in records:
+            history.add_history(DisplayHistory(records[current_key], resolutions=CURRENT_RESOLUTION))
+        return history
+
+    def get_fleet_history(self) -> FleetHistory:
+        workers = cache.get(FLEET_WORKERS_CACHE_KEY) or {}
+        records = cache.get_many([fleet_history_cache_key(worker) for worker in workers])
+        return FleetHistory.merge(FleetHistory(record) for record in records.values())
+
+
+telemetry_store = TelemetryStore()
@@ -1,13 +1,17 @@
 from django.conf import settings
 from django.urls import path
 
-from c3ds.core.views import DisplayView, GenericView, ShellView
+from c3ds.core.views import (DisplayAssetManifestView, DisplayView, GenericView, PlaylistManifestView,
+                             ScheduleSliceView, ShellView)
 
 urlpatterns = [
     path('views/<int:pk>/', GenericView.as_view(), name='view_by_pk'),
     path('views/<slug:slug>/', GenericView.as_view(), name='view_by_slug'),
+    path('views/<slug:slug>/schedule.json', ScheduleSliceView.as_view(), name='schedule_view_slice'),
     path('display/<slug:slug>/', DisplayView.as_view(), name='display_by_slug_long'),
     path('d/<slug:slug>/', DisplayView.as_view(), name='display_by_slug'),
+    path('d/<slug:slug>/assets.json', DisplayAssetManifestView.as_view(), name='display_asset_manifest'),
+    path('playlists/<slug:slug>/manifest.json', PlaylistManifestView.as_view(), name='playlist_manifest'),
 ]
 
 if settings.REMOTE_SHELL:
@@ -1,10 +1,19 @@
+import hashlib
+import json
+import time
 from typing import Optional
 
-from django.http import Http404
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, HttpRequest, HttpResponse, JsonResponse
 from django.shortcuts import render
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 from django.views.generic import DetailView, TemplateView
+from django.views.generic.detail import BaseDetailView
 
-from c3ds.core.models import BaseView, Display
+from c3ds.core.instrumentation import DISPLAY_VIEW_RENDER
+from c3ds.core.models import BaseView, Display, Playlist, ScheduleView
 
 
 class GenericView(DetailView):
@@ -18,6 +27,14 @@ class GenericView(DetailView):
     def get_template_names(self):
         return [self.object.get_template_name()]
 
+    def get_resolution(self) -> tuple[int, int]:
+        # playlists pass the resolution of the display the view is shown on
+        width, height = Display.default_resolution()
+        try:
+            return int(self.request.GET.get('width', width)), int(self.request.GET.get('height', height))
+        except ValueError:
+            return width, height
+
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         ctx.update({
@@ -25,7 +42,7 @@ class GenericView(DetailView):
             'layout_mode': getattr(self.object, 'layout_mode', 'normal'),
             'slug': 'undefined',
         })
-        ctx.update(self.object.get_context())
+        ctx.update(self.object.get_context(self.get_resolution()))
         return ctx
 
 
@@ -49,6 +66,51 @@ class DisplayView(DetailView):
     is_unconfigured = False
     _view = None
 
+    @classmethod
+    def render_page(cls, display: Display) -> Optional[tuple[str, bytes]]:
+        """
+        Returns ETag and content of the page of a configured display outside a request, using the page cache.
+        """
+        cached = cache.get(display.get_page_cache_key())
+        if cached is not None:
+            return cached
+        request = HttpRequest()
+        request.method = 'GET'
+        view = cls()
+        view.setup(request, slug=display.slug)
+        view.object = display
+        if display.static_view is not None and view.get_view() is None:
+            return None
+        return view.cache_page(view.render_to_response(view.get_context_data(object=display)))
+
+    def cache_page(self, response) -> tuple[str, bytes]:
+        response.render()
+        etag = quote_etag(hashlib.md5(response.content, usedforsecurity=False).hexdigest())
+        cache.set(Display.page_cache_key_for_slug(self.kwargs.get(self.slug_url_kwarg)), (etag, response.content),
+                  settings.DISPLAY_PAGE_CACHE_TIMEOUT)
+        return etag, response.content
+
+    def get(self, request, *args, **kwargs):
+        start = time.perf_counter()
+        cached = cache.get(Display.page_cache_key_for_slug(self.kwargs.get(self.slug_url_kwarg)))
+        if cached is None:
+            response = super().get(request, *args, **kwargs)
+            # the unconfigured page shows the client ip address, so it can't be shared
+            if self.is_unconfigured:
+                DISPLAY_VIEW_RENDER.labels('unconfigured').observe(time.perf_counter() - start)
+                return response
+            etag, _content = self.cache_page(response)
+            DISPLAY_VIEW_RENDER.labels('miss').observe(time.perf_counter() - start)
+        else:
+            etag, content = cached
+            response = HttpResponse(content)
+            DISPLAY_VIEW_RENDER.labels('hit').observe(time.perf_counter() - start)
+
+        response = get_conditional_response(request, etag=etag, response=response)
+        response['ETag'] = etag
+        patch_cache_control(response, no_cache=True)
+        return response
+
     def get_queryset(self):
         return super().get_queryset().select_related('playlist', 'static_view')
 
@@ -69,17 +131,20 @@ class DisplayView(DetailView):
         elif self.object.static_view is not None:
             return [self.get_view().get_template_name()]
         else:
-            raise NotImplementedError('Playlist support not yet implemented')
+            return ['core/playlist_view.html']
 
 
     def get_view(self) -> Optional[BaseView]:
-        if self.is_unconfigured or self.object is None:
+        if self.is_unconfigured or self.object is None or self.object.static_view is None:
             return None
         if self._view is None:
             self._view = self.object.static_view.get_specific()
         return self._view
 
     def get_layout_mode(self):
+        if self.object is not None and self.object.playlist_id is not None:
+            # every playlist entry brings its own layout
+            return 'fullscreen'
         return getattr(self.get_view(), 'layout_mode', 'normal') if self.get_view() is not None else 'normal'
 
     def get_context_data(self, **kwargs):
@@ -90,5 +155,59 @@ class DisplayView(DetailView):
             'slug': self.kwargs.get(self.slug_url_kwarg)
         })
         if self.get_view() is not None:
-            ctx.update(self.get_view().get_context())
+            ctx.update(self.get_view().get_context(self.object.get_resolution()))
+        if self.object is not None and self.object.playlist is not None:
+            ctx['playlist'] = self.object.playlist
         return ctx
+
+
+class PlaylistManifestView(BaseDetailView):
+    model = Playlist
+
+    def render_to_response(self, context):
+        manifest = self.object.get_manifest()
+        etag = quote_etag(manifest['version'])
+        response = get_conditional_response(self.request, etag=etag) or JsonResponse(manifest)
+        response['ETag'] = etag
+        patch_cache_control(response, no_cache=True)
+        return response
+
+
+class DisplayAssetManifestView(BaseDetailView):
+    model = Display
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('playlist', 'static_view')
+
+    def render_to_response(self, context):
+        if self.object.static_view is None and self.object.playlist is None:
+            raise Http404('Display has no content')
+        manifest = self.object.get_asset_manifest()
+        etag = quote_etag(manifest['version'])
+        response = get_conditional_response(self.request, etag=etag) or JsonResponse(manifest)
+        response['ETag'] = etag
+        patch_cache_control(response, no_cache=True)
+        return response
+
+
+class ScheduleSliceView(BaseDetailView):
+    model = ScheduleView
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('schedule')
+
+    def render_to_response(self, context):
+        schedule = self.object.schedule
+        if not schedule.version or not schedule.file:
+            raise Http404('Schedule not downloaded yet')
+        try:
+            day = int(self.request.GET['day'])
+        except (KeyError, ValueError):
+            day = None
+        rooms = self.object.get_room_filter()
+        etag = quote_etag(hashlib.md5(json.dumps([schedule.version, rooms, day]).encode(),
+                                      usedforsecurity=False).hexdigest())
+        response = get_conditional_response(self.request, etag=etag) or JsonResponse(schedule.get_slice(rooms, day))
+        response['ETag'] = etag
+        patch_cache_control(response, no_cache=True)
+        return response
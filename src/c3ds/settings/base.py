@@ -82,6 +82,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'c3ds.core.context_processors.event_data',
+                'c3ds.core.context_processors.build_data',
                 'c3ds.core.context_processors.extra_data',
             ],
         },
@@ -106,6 +107,9 @@ DATABASES['default'].setdefault('CONN_MAX_AGE',
                                 env.int('C3DS_DATABASE_CONN_MAX_AGE',
                                         default=(0 if _db_backend.endswith('sqlite3') else 120)))
 DATABASES['default'].setdefault('CONN_HEALTH_CHECKS', not DATABASES['default']['ENGINE'].endswith('sqlite3'))
+if DATABASES['default']['ENGINE'].endswith('sqlite3'):
+    # take the write lock when a transaction starts, so concurrent writers wait for each other instead of failing
+    DATABASES['default'].setdefault('OPTIONS', {}).setdefault('transaction_mode', 'IMMEDIATE')
 
 
 # Password validation
@@ -283,6 +287,77 @@ if DAY_ZERO:
 REMOTE_SHELL = env.bool('C3DS_REMOTE_SHELL', default=False)
 
 DELAYED_RELOAD_THRESHOLD = env.int('C3DS_DELAYED_RELOAD_THRESHOLD', default=10)
+# Seconds per display a delayed reload is spread over, displays reload at a rate of 1 / spread factor per second
+RELOAD_SPREAD_FACTOR = env.float('C3DS_RELOAD_SPREAD_FACTOR', default=0.05)
+# Upper limit of the window in seconds delayed reloads are spread over
+RELOAD_MAX_WINDOW = env.float('C3DS_RELOAD_MAX_WINDOW', default=120)
+# Seconds after the last change before the reloads triggered by saving displays and their content are sent
+RELOAD_DEBOUNCE = env.float('C3DS_RELOAD_DEBOUNCE', default=0.5)
+
+# Display duration in seconds of playlist entries without a duration of their own
+PLAYLIST_DEFAULT_DURATION = env.int('C3DS_PLAYLIST_DEFAULT_DURATION', default=10)
+
+# Milliseconds ahead of a slot boundary the playlist clock announces it to the displays
+PLAYLIST_CLOCK_LEAD = env.int('C3DS_PLAYLIST_CLOCK_LEAD', default=1000)
+# Maximum seconds the clock of a playlist waits before it retries after a failure
+PLAYLIST_CLOCK_MAX_BACKOFF = env.float('C3DS_PLAYLIST_CLOCK_MAX_BACKOFF', default=60)
+
+# Seconds a rendered display page is cached, pages are also invalidated when a display or its content changes
+DISPLAY_PAGE_CACHE_TIMEOUT = env.int('C3DS_DISPLAY_PAGE_CACHE_TIMEOUT', default=3600)
+
+# Seconds between two polls of a schedule URL, failing schedules back off up to the maximum backoff
+SCHEDULE_REFRESH_INTERVAL = env.float('C3DS_SCHEDULE_REFRESH_INTERVAL', default=60)
+SCHEDULE_REFRESH_MAX_BACKOFF = env.float('C3DS_SCHEDULE_REFRESH_MAX_BACKOFF', default=900)
+# Schedule updates changing more events are not pushed as a delta, the displays refetch the schedule instead
+SCHEDULE_DELTA_MAX_EVENTS = env.int('C3DS_SCHEDULE_DELTA_MAX_EVENTS', default=200)
+# Connect and read timeout in seconds for schedule downloads
+SCHEDULE_FETCH_TIMEOUT = env.float('C3DS_SCHEDULE_FETCH_TIMEOUT', default=10)
+
+# Widths of the image variants and heights of the video renditions generated for uploaded media
+MEDIA_IMAGE_WIDTHS = env.list('C3DS_MEDIA_IMAGE_WIDTHS', cast=int, default=[3840, 1920, 1280])
+MEDIA_VIDEO_HEIGHTS = env.list('C3DS_MEDIA_VIDEO_HEIGHTS', cast=int, default=[1080, 720])
+# Number of threads generating media derivatives in the background
+MEDIA_WORKERS = env.int('C3DS_MEDIA_WORKERS', default=2)
+# ffmpeg binary used for the video renditions, videos are served as uploaded if it is not installed
+FFMPEG_BINARY = env.str('C3DS_FFMPEG_BINARY', default='ffmpeg')
+# Number of channel layer groups the displays are spread over, fleet commands are sent one shard at a time with a
+# pause in seconds in between
+DISPLAY_GROUP_SHARDS = env.int('C3DS_DISPLAY_GROUP_SHARDS', default=16)
+FLEET_SHARD_PAUSE = env.float('C3DS_FLEET_SHARD_PAUSE', default=0.5)
+# Serve MEDIA_ROOT from the ASGI app, disable if the web server serves it
+MEDIA_SERVE = env.bool('C3DS_MEDIA_SERVE', default=True)
+# Media responses streamed at the same time per process, further requests wait up to the queue timeout (seconds)
+MEDIA_MAX_STREAMS = env.int('C3DS_MEDIA_MAX_STREAMS', default=64)
+MEDIA_QUEUE_TIMEOUT = env.float('C3DS_MEDIA_QUEUE_TIMEOUT', default=10)
+# nginx location serving MEDIA_ROOT internally, media responses are handed to nginx with X-Accel-Redirect if set
+MEDIA_ACCEL_REDIRECT = env.str('C3DS_MEDIA_ACCEL_REDIRECT', default=None)
+# Resolution assumed for displays without a configured resolution
+DISPLAY_DEFAULT_WIDTH = env.int('C3DS_DISPLAY_DEFAULT_WIDTH', default=1920)
+DISPLAY_DEFAULT_HEIGHT = env.int('C3DS_DISPLAY_DEFAULT_HEIGHT', default=1080)
+
+# Interval in seconds in which buffered display telemetry (heartbeats, NTP offsets) is written to the cache
+TELEMETRY_FLUSH_INTERVAL = env.float('C3DS_TELEMETRY_FLUSH_INTERVAL', default=5)
+# Seconds after which the connections of a worker that stopped refreshing them and connections without heartbeats
+# count as offline, and the interval in seconds in which connects and disconnects are written to the cache
+PRESENCE_TTL = env.float('C3DS_PRESENCE_TTL', default=20)
+PRESENCE_FLUSH_INTERVAL = env.float('C3DS_PRESENCE_FLUSH_INTERVAL', default=1)
+# Seconds after its slot in the reload window a display that didn't acknowledge a rollout counts as straggler, and
+# the interval in seconds in which acknowledgements are written to the database
+ROLLOUT_ACK_TIMEOUT = env.float('C3DS_ROLLOUT_ACK_TIMEOUT', default=60)
+ROLLOUT_ACK_FLUSH_INTERVAL = env.float('C3DS_ROLLOUT_ACK_FLUSH_INTERVAL', default=1)
+# Content updates go to the online displays in waves: first the canaries (displays tagged ROLLOUT_CANARY_TAG, then
+# others up to ROLLOUT_CANARY_SIZE), then waves starting at ROLLOUT_WAVE_SIZE displays and growing by
+# ROLLOUT_WAVE_GROWTH. The next wave is sent once ROLLOUT_WAVE_SUCCESS_RATIO of the displays of the current wave
+# acknowledged and sent a heartbeat since, a wave that doesn't get there within ROLLOUT_WAVE_TIMEOUT seconds after the
+# last slot of its reload window halts the rollout. Waves are checked every ROLLOUT_WAVE_CHECK_INTERVAL seconds.
+ROLLOUT_WAVES = env.bool('C3DS_ROLLOUT_WAVES', default=True)
+ROLLOUT_CANARY_TAG = env.str('C3DS_ROLLOUT_CANARY_TAG', default='canary')
+ROLLOUT_CANARY_SIZE = env.int('C3DS_ROLLOUT_CANARY_SIZE', default=2)
+ROLLOUT_WAVE_SIZE = env.int('C3DS_ROLLOUT_WAVE_SIZE', default=10)
+ROLLOUT_WAVE_GROWTH = env.float('C3DS_ROLLOUT_WAVE_GROWTH', default=2)
+ROLLOUT_WAVE_SUCCESS_RATIO = env.float('C3DS_ROLLOUT_WAVE_SUCCESS_RATIO', default=0.9)
+ROLLOUT_WAVE_TIMEOUT = env.float('C3DS_ROLLOUT_WAVE_TIMEOUT', default=60)
+ROLLOUT_WAVE_CHECK_INTERVAL = env.float('C3DS_ROLLOUT_WAVE_CHECK_INTERVAL', default=2)
 
 # SSO
 SOCIAL_AUTH_PIPELINE = (
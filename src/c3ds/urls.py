@@ -22,11 +22,13 @@ from django.contrib import admin
 from django.urls import include, path, re_path
 
 import c3ds.core.urls
+from c3ds.core.api import api
 from c3ds.core.consumer import DisplayConsumer, RemoteShellConsumer
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('oauth/', include('social_django.urls', namespace='social')),
+    path('api/', api.urls),
     path('', include(c3ds.core.urls)),
     path('', include('django_prometheus.urls')),
 ]
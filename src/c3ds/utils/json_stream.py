@@ -0,0 +1,78 @@
+import json
+from typing import Optional
+
+
+class JSONPathScanner:
+    """
+    Finds the string value at a path of object keys in a JSON document fed in chunks, without parsing the document.
+
+    Only the structure up to the value is scanned, so values near the start of large documents are found cheaply.
+    """
+
+    def __init__(self, path: tuple[str, ...]):
+        self.path = path
+        self.value: Optional[str] = None
+        # one entry per open container: the current key for objects, None for arrays
+        self._keys: list[Optional[str]] = []
+        self._in_object: list[bool] = []
+        self._expect_key = False
+        self._in_string = False
+        self._escape = False
+        self._is_key = False
+        self._capture = False
+        self._buffer = bytearray()
+
+    @property
+    def found(self) -> bool:
+        return self.value is not None
+
+    def _at_path(self) -> bool:
+        return len(self._keys) == len(self.path) and all(self._in_object) and tuple(self._keys) == self.path
+
+    def feed(self, chunk: bytes):
+        if self.found:
+            return
+        for byte in chunk:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif byte == 0x5c:  # backslash
+                    self._escape = True
+                elif byte == 0x22:  # quote
+                    self._in_string = False
+                    self._end_string()
+                    if self.found:
+                        return
+                    continue
+                if self._is_key or self._capture:
+                    self._buffer.append(byte)
+                continue
+
+            match byte:
+                case 0x22:  # quote
+                    self._in_string = True
+                    self._is_key = bool(self._in_object) and self._in_object[-1] and self._expect_key
+                    self._capture = not self._is_key and self._at_path()
+                    self._buffer.clear()
+                case 0x7b:  # {
+                    self._keys.append(None)
+                    self._in_object.append(True)
+                    self._expect_key = True
+                case 0x5b:  # [
+                    self._keys.append(None)
+                    self._in_object.append(False)
+                    self._expect_key = False
+                case 0x7d | 0x5d:  # } ]
+                    if self._keys:
+                        self._keys.pop()
+                        self._in_object.pop()
+                    self._expect_key = False
+                case 0x2c:  # ,
+                    self._expect_key = bool(self._in_object) and self._in_object[-1]
+
+    def _end_string(self):
+        if self._is_key:
+            self._keys[-1] = json.loads(b'"' + bytes(self._buffer) + b'"')
+            self._expect_key = False
+        elif self._capture:
+            self.value = json.loads(b'"' + bytes(self._buffer) + b'"')
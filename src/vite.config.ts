@@ -28,6 +28,7 @@ export default defineConfig({
         'core/ts/main.ts',
         'core/ts/clock.ts',
         'core/ts/schedule.ts',
+        'core/ts/playlist.ts',
         'core/ts/remote_shell.ts',
         'core/ts/remote_shell_backend.ts',
       ],